@@ -44,6 +44,7 @@ from .prompts import (
     log_llm_prompt,
 )
 from .prompts import build_prompt
+from .prompt_cache import bump_prompt_cache_version
 from .prompts import run_llm_prompt
 from . import prompts as prompts_module
 from .models import User
@@ -3225,7 +3226,8 @@ def _promote_templates_batch(source_state: str, target_state: str, note: str | N
             if prune_state in {"develop", "beta", "live"}:
                 _enforce_single_active_states(s, {prune_state})
         s.commit()
-        return created
+    bump_prompt_cache_version()
+    return created
 
 
 @admin.get("/prompt-settings", response_class=HTMLResponse)
@@ -3319,6 +3321,7 @@ async def save_prompt_settings(
         row.worker_mode_override = _parse_override(worker_mode_override)
         row.podcast_worker_mode_override = _parse_override(podcast_worker_mode_override)
         s.commit()
+    bump_prompt_cache_version()
     return RedirectResponse(url="/admin/prompt-settings", status_code=303)
 
 
@@ -4158,6 +4161,7 @@ async def save_prompt_template(
         row.task_block = task_block or None
         row.is_active = active_flag
         s.commit()
+    bump_prompt_cache_version()
     return RedirectResponse(url="/admin/prompt-templates", status_code=303)
 
 
@@ -30,7 +30,7 @@ from datetime import datetime, timedelta, date, timezone
 from types import SimpleNamespace
 from zoneinfo import ZoneInfo
 from fastapi import FastAPI, APIRouter, Request, Response, Depends, Header, HTTPException, status, Body, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy import text, select, desc, func, or_, update, false
 from sqlalchemy.exc import IntegrityError
@@ -132,6 +132,7 @@ from .nudges import (
 )
 from .checkins import record_checkin
 from . import prompts as prompts_module
+from .prompt_context import prompt_context_scope
 from .prompts import (
     build_prompt,
     assessment_scores_prompt,
@@ -188,7 +189,24 @@ from .reporting import (
 )
 from .reports_paths import resolve_reports_dir, resolve_reports_dir_with_source
 from .reports_retention import run_reports_retention_from_env
-from .job_queue import ensure_job_table, enqueue_job, should_use_worker, ensure_prompt_settings_schema
+from .job_metrics import job_queue_metrics, render_job_queue_metrics_prometheus
+from .llm_cache import cache_ttl_for_touchpoint, cached_llm_text, llm_response_cache_stats, purge_expired_llm_responses
+from .kb_index import invalidate_kb_index, kb_index_stats
+from .embeddings import embedding_model_id
+from .query_embedding_cache import query_embedding_cache_stats
+from .prompt_cache import bump_prompt_cache_version, prompt_cache_stats
+from .llm_stream import llm_stream_context
+from .outbound_dispatcher import KeyedDispatcher
+from .conversation_state import ConversationState, load_conversation_state
+from .user_identity import remember_user_identity, user_identity_cache_stats
+from .job_queue import (
+    compact_finished_jobs_from_env,
+    ensure_job_table,
+    enqueue_job,
+    job_table_stats,
+    should_use_worker,
+    ensure_prompt_settings_schema,
+)
 from .virtual_clock import get_virtual_date, get_virtual_now_for_user, set_virtual_mode
 from .wearables import (
     apply_token_payload as apply_wearable_token_payload,
@@ -555,6 +573,7 @@ def _start_scheduler_after_startup() -> None:
         scheduler.schedule_auto_daily_prompts()
         scheduler.schedule_out_of_session_messages()
         scheduler.schedule_reports_retention()
+        scheduler.schedule_background_jobs_retention()
     except Exception as e:
         print(f"⚠️  Scheduler start failed: {e!r}")
 
@@ -1114,6 +1133,36 @@ def on_startup():
     threading.Thread(target=_startup_tasks, daemon=True).start()
 
 
+@app.on_event("shutdown")
+def _shutdown_drain_twilio_inbound() -> None:
+    # Inbound messages are acknowledged before routing; finish routing what was
+    # accepted before the process exits. Registered first so prompt logs written
+    # while draining are flushed by the hook below.
+    dispatcher = _TWILIO_INBOUND_DISPATCHER
+    if dispatcher is None:
+        return
+    timeout = float(os.getenv("TWILIO_INBOUND_DRAIN_SEC", "25") or "25")
+    try:
+        if not dispatcher.drain(timeout=timeout):
+            stats = dispatcher.stats()
+            print(
+                "[shutdown] WARN: twilio inbound drain timed out "
+                f"queued={stats.get('queued')} active_keys={stats.get('active_keys')}"
+            )
+    except Exception as e:
+        print(f"[shutdown] WARN: twilio inbound drain failed: {e}")
+
+
+@app.on_event("shutdown")
+def _shutdown_flush_prompt_logs() -> None:
+    try:
+        from .prompts import flush_llm_prompt_logs
+        if not flush_llm_prompt_logs(timeout=10):
+            print("[shutdown] WARN: prompt log flush timed out")
+    except Exception as e:
+        print(f"[shutdown] WARN: prompt log flush failed: {e}")
+
+
 @app.on_event("startup")
 async def _startup_scheduler_after_reset() -> None:
     if not _startup_reset_requested_from_env():
@@ -1437,11 +1486,24 @@ def _get_or_create_user(
             s.add(u)
             s.commit()
             s.refresh(u)
+        if u:
+            remember_user_identity(u)
         return u
 
 
-def _log_inbound_direct(user: User, channel: str, body: str, from_raw: str) -> None:
-    """All inbound logging routed through app.message_log.write_log (no direct DB writes)."""
+def _log_inbound_direct(
+    user: User,
+    channel: str,
+    body: str,
+    from_raw: str,
+    *,
+    write_message_log: bool = True,
+) -> None:
+    """
+    All inbound logging routed through app.message_log.write_log (no direct DB writes).
+    write_message_log=False only records last_inbound_message_at, for messages already
+    logged before the sender was a known user.
+    """
     try:
         # Import here to avoid any circulars
         from .message_log import write_log
@@ -1457,17 +1519,18 @@ def _log_inbound_direct(user: User, channel: str, body: str, from_raw: str) -> N
             meta_payload["virtual_date"] = virtual_now.date().isoformat()
 
         # Canonical logging (category/sid omitted for inbound unless you have them)
-        write_log(
-            phone_e164=phone,
-            direction="inbound",
-            text=body or "",
-            category=None,
-            twilio_sid=None,
-            user=user,
-            channel=channel,  # harmless if model lacks 'channel'
-            meta=meta_payload,  # harmless if model lacks 'meta'
-            created_at=virtual_now,
-        )
+        if write_message_log:
+            write_log(
+                phone_e164=phone,
+                direction="inbound",
+                text=body or "",
+                category=None,
+                twilio_sid=None,
+                user=user,
+                channel=channel,  # harmless if model lacks 'channel'
+                meta=meta_payload,  # harmless if model lacks 'meta'
+                created_at=virtual_now,
+            )
 
         # Persist the user's most recent inbound timestamp for admin visibility and channel policy.
         if user_id:
@@ -2210,16 +2273,22 @@ def _is_greeting_message(body: str) -> bool:
     return normalized in {"hi", "hello", "hey", "good morning", "good afternoon", "good evening"}
 
 
-def _handle_pending_coaching_day_resume(user: User, body: str) -> bool:
+def _handle_pending_coaching_day_resume(
+    user: User,
+    body: str,
+    conversation_state: ConversationState | None = None,
+) -> bool:
     """
     Clear stale pending weekday prompt state.
     """
+    if conversation_state is None:
+        conversation_state = load_conversation_state(int(user.id), extra_keys=(COACHING_PENDING_DAY_PREF_KEY,))
+    if not _state_coaching_enabled(conversation_state, int(user.id)):
+        return False
+    raw_day = (_state_pref_value(conversation_state, int(user.id), COACHING_PENDING_DAY_PREF_KEY) or "").strip().lower()
+    if raw_day not in {"monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"}:
+        return False
     with SessionLocal() as s:
-        if not _coaching_enabled_for_user(s, int(user.id)):
-            return False
-        raw_day = (_pref_value(s, int(user.id), COACHING_PENDING_DAY_PREF_KEY) or "").strip().lower()
-        if raw_day not in {"monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"}:
-            return False
         _delete_pref_keys(
             s,
             int(user.id),
@@ -2245,7 +2314,11 @@ def _handle_pending_coaching_day_resume(user: User, body: str) -> bool:
     return False
 
 
-def _handle_coaching_greeting(user: User, body: str) -> bool:
+def _handle_coaching_greeting(
+    user: User,
+    body: str,
+    conversation_state: ConversationState | None = None,
+) -> bool:
     """
     Coaching greeting behavior:
     - route to general coach mode. Weekday scheduled day flows are retired.
@@ -2254,17 +2327,15 @@ def _handle_coaching_greeting(user: User, body: str) -> bool:
     if not _is_greeting_message(body):
         return False
     try:
-        with SessionLocal() as s:
-            coaching_enabled = _coaching_enabled_for_user(s, int(user.id))
+        coaching_enabled = _state_coaching_enabled(conversation_state, int(user.id))
     except Exception:
         coaching_enabled = False
     if not coaching_enabled:
         return False
 
     try:
-        if not general_support.has_active_state(int(user.id)):
-            general_support.activate(int(user.id), source="greeting", week_no=None, send_intro=False)
-        general_support.handle_message(user, body)
+        _ensure_general_support_active(user, "greeting", conversation_state)
+        general_support.handle_message(user, body, conversation_state)
         return True
     except Exception as e:
         try:
@@ -4198,6 +4269,7 @@ def _handle_admin_command(admin_user: User, text: str, *, source_phone: str | No
                     s.add(pref)
                 pref.value = desired_state
                 s.commit()
+                bump_prompt_cache_version()
                 send_whatsapp(
                     to=admin_user.phone,
                     text=f"Prompt state override for {display_full_name(u)} ({u.phone}) set to {desired_state}.",
@@ -4777,343 +4849,411 @@ def _handle_global_command(admin_user: User, text: str) -> bool:
 # Webhooks
 # ──────────────────────────────────────────────────────────────────────────────
 
-@router.post("/webhooks/twilio")
-async def twilio_inbound(request: Request):
+_TWILIO_INBOUND_DISPATCHER: KeyedDispatcher | None = None
+_TWILIO_INBOUND_DISPATCHER_LOCK = threading.Lock()
+
+
+def _twilio_inbound_dispatcher() -> KeyedDispatcher:
+    global _TWILIO_INBOUND_DISPATCHER
+    with _TWILIO_INBOUND_DISPATCHER_LOCK:
+        if _TWILIO_INBOUND_DISPATCHER is None:
+            _TWILIO_INBOUND_DISPATCHER = KeyedDispatcher(
+                "twilio_inbound",
+                workers=int(os.getenv("TWILIO_INBOUND_WORKERS", "8") or "8"),
+            )
+        return _TWILIO_INBOUND_DISPATCHER
+
+
+def _log_inbound_unknown(channel: str, body: str, from_raw: str, phone: str) -> None:
+    """Log an inbound message from a number with no user yet (user_id is left empty)."""
+    try:
+        from .message_log import write_log
+
+        write_log(
+            phone_e164=phone,
+            direction="inbound",
+            text=body or "",
+            category=None,
+            twilio_sid=None,
+            user=None,
+            channel=channel,
+            meta={"from": from_raw, "unknown_sender": True},
+        )
+    except Exception as e:
+        print(f"⚠️ inbound unknown-sender log failed (non-fatal): {e!r}")
+
+
+def _route_twilio_inbound(user_id: int | None, body: str, from_raw: str, phone: str, channel: str) -> None:
     """
-    Accepts x-www-form-urlencoded payloads from Twilio (SMS/WhatsApp).
-    Parses the raw body for maximum compatibility, resolves/creates user, logs
-    inbound immediately upon receipt, and then routes to the assessor.
+    Route one inbound Twilio message to the owning flow (unknown-user onboarding,
+    admin commands, assessment, coaching modules...). Runs on the inbound dispatcher,
+    one message at a time per phone number; every message is already logged. The
+    user is re-loaded here so routing sees changes made by messages queued ahead.
     """
     try:
-        raw = (await request.body()).decode("utf-8")
-        data = parse_qs(raw, keep_blank_values=True)
-
-        body = (data.get("Body", [""])[0] or "").strip()
-        button_payload = (data.get("ButtonPayload", [""])[0] or "").strip()
-        button_text = (data.get("ButtonText", [""])[0] or "").strip()
-        if button_payload:
-            body = button_payload
-        elif not body and button_text:
-            body = button_text
-        from_raw = (data.get("From", [""])[0] or "").strip()
-        if not from_raw:
-            return Response(content="", media_type="text/plain", status_code=400)
+        user = None
+        if user_id is not None:
+            with SessionLocal() as s:
+                user = s.get(User, int(user_id))
+        if user is None:
+            # An earlier message from this phone (queued ahead of us) may have created the user.
+            user = _get_or_create_user(phone, create_if_missing=False)
+            if user:
+                _log_inbound_direct(user, channel, body, from_raw, write_message_log=False)
+        with prompt_context_scope(user_id=int(user.id) if user else None):
+            _route_twilio_inbound_message(user, body, from_raw, phone, channel)
+    except Exception:
+        import traceback
+        traceback.print_exc()
 
-        phone = from_raw.replace("whatsapp:", "") if from_raw.startswith("whatsapp:") else from_raw
-        channel = "whatsapp" if from_raw.startswith("whatsapp:") else "sms"
 
-        user = _get_or_create_user(phone, create_if_missing=False)
+def _route_twilio_inbound_message(user: User | None, body: str, from_raw: str, phone: str, channel: str) -> None:
+    if not user:
+        unknown_msg = " ".join((body or "").strip().split())
+        unknown_lower = unknown_msg.lower()
+        if unknown_lower.startswith("global") or unknown_lower.startswith("admin"):
+            try:
+                send_whatsapp(to=phone, text="Sorry, admin commands are restricted to superusers.")
+            except Exception:
+                pass
+            return
 
-        if not user:
-            unknown_msg = " ".join((body or "").strip().split())
-            unknown_lower = unknown_msg.lower()
-            if unknown_lower.startswith("global") or unknown_lower.startswith("admin"):
-                try:
-                    send_whatsapp(to=phone, text="Sorry, admin commands are restricted to superusers.")
-                except Exception:
-                    pass
-                return Response(content="", media_type="text/plain", status_code=200)
-
-            pending_first, pending_surname = _extract_pending_confirmed_name(phone)
-            if _require_name_fields(pending_first, pending_surname) and _is_affirmative_name_confirm(unknown_msg):
-                created = _get_or_create_user(
-                    phone,
-                    create_if_missing=True,
-                    first_name=pending_first,
-                    surname=pending_surname,
-                )
-                if created:
-                    user = created
-                    _log_inbound_direct(user, channel, body, from_raw)
-                    _start_assessment_async(user, force_intro=True)
-                return Response(content="", media_type="text/plain", status_code=200)
-
-            first_name, surname = _extract_valid_name_from_reply(unknown_msg)
-            awaiting_name_reply = _awaiting_unknown_user_name_reply(phone)
-            if _require_name_fields(first_name, surname) and (
-                awaiting_name_reply or _require_name_fields(pending_first, pending_surname)
-            ):
-                try:
-                    send_whatsapp(to=phone, text=_unknown_user_name_confirm_text(first_name, surname))
-                except Exception:
-                    pass
-                return Response(content="", media_type="text/plain", status_code=200)
+        pending_first, pending_surname = _extract_pending_confirmed_name(phone)
+        if _require_name_fields(pending_first, pending_surname) and _is_affirmative_name_confirm(unknown_msg):
+            created = _get_or_create_user(
+                phone,
+                create_if_missing=True,
+                first_name=pending_first,
+                surname=pending_surname,
+            )
+            if created:
+                user = created
+                _log_inbound_direct(user, channel, body, from_raw, write_message_log=False)
+                _start_assessment_async(user, force_intro=True)
+            return
 
-            if _require_name_fields(pending_first, pending_surname):
-                try:
-                    send_whatsapp(to=phone, text=_unknown_user_name_confirm_text(pending_first, pending_surname))
-                except Exception:
-                    pass
-                return Response(content="", media_type="text/plain", status_code=200)
+        first_name, surname = _extract_valid_name_from_reply(unknown_msg)
+        awaiting_name_reply = _awaiting_unknown_user_name_reply(phone)
+        if _require_name_fields(first_name, surname) and (
+            awaiting_name_reply or _require_name_fields(pending_first, pending_surname)
+        ):
+            try:
+                send_whatsapp(to=phone, text=_unknown_user_name_confirm_text(first_name, surname))
+            except Exception:
+                pass
+            return
 
+        if _require_name_fields(pending_first, pending_surname):
             try:
-                send_whatsapp(to=phone, text=UNKNOWN_USER_NAME_PROMPT)
+                send_whatsapp(to=phone, text=_unknown_user_name_confirm_text(pending_first, pending_surname))
             except Exception:
                 pass
-            return Response(content="", media_type="text/plain", status_code=200)
-
-        # Safety backfill for legacy restarts that cleared consent flags incorrectly.
-        _repair_missing_consent_for_completed_user(user)
-
-        # Global admin commands (broader scope)
-        if body.lower().startswith("global"):
-            _log_inbound_direct(user, channel, body, from_raw)
-            if _is_global_admin(user):
-                if _handle_global_command(user, body):
-                    return Response(content="", media_type="text/plain", status_code=200)
-                return Response(content="", media_type="text/plain", status_code=200)
-            else:
-                print(f"[global] ignored command from non-global user_id={user.id}")
-                try:
-                    send_whatsapp(to=user.phone, text="Sorry, global commands are restricted to global admins.")
-                except Exception:
-                    pass
-                return Response(content="", media_type="text/plain", status_code=200)
-
-        # Admin commands must never fall through to normal flow
-        if body.lower().startswith("admin"):
-            _log_inbound_direct(user, channel, body, from_raw)
-            if _is_admin_user(user):
-                if _handle_admin_command(user, body, source_phone=phone):
-                    return Response(content="", media_type="text/plain", status_code=200)
-                return Response(content="", media_type="text/plain", status_code=200)
-            else:
-                print(f"[admin] ignored admin cmd from non-admin user_id={user.id} is_superuser={getattr(user,'is_superuser',None)}")
-                try:
-                    send_whatsapp(to=user.phone, text="Sorry, admin commands are restricted to superusers.")
-                except Exception:
-                    pass
-                return Response(content="", media_type="text/plain", status_code=200)
+            return
+
+        try:
+            send_whatsapp(to=phone, text=UNKNOWN_USER_NAME_PROMPT)
+        except Exception:
+            pass
+        return
 
-        lower_body = body.lower()
+    # Safety backfill for legacy restarts that cleared consent flags incorrectly.
+    _repair_missing_consent_for_completed_user(user)
 
-        # ✅ log inbound immediately upon receipt (before processing)
-        _log_inbound_direct(user, channel, body, from_raw)
+    # Global admin commands (broader scope)
+    if body.lower().startswith("global"):
+        if _is_global_admin(user):
+            _handle_global_command(user, body)
+            return
+        else:
+            print(f"[global] ignored command from non-global user_id={user.id}")
+            try:
+                send_whatsapp(to=user.phone, text="Sorry, global commands are restricted to global admins.")
+            except Exception:
+                pass
+            return
 
-        if lower_body in {"stop", "unsubscribe", "opt out", "opt-out", "cancel marketing"}:
+    # Admin commands must never fall through to normal flow
+    if body.lower().startswith("admin"):
+        if _is_admin_user(user):
+            _handle_admin_command(user, body, source_phone=phone)
+            return
+        else:
+            print(f"[admin] ignored admin cmd from non-admin user_id={user.id} is_superuser={getattr(user,'is_superuser',None)}")
             try:
-                with SessionLocal() as s:
-                    pref = (
-                        s.query(UserPreference)
-                        .filter(UserPreference.user_id == user.id, UserPreference.key == "marketing_opt_in")
-                        .one_or_none()
-                    )
-                    if pref:
-                        pref.value = "0"
-                    else:
-                        s.add(UserPreference(user_id=user.id, key="marketing_opt_in", value="0"))
-                    s.commit()
-                msg = "You’re unsubscribed from marketing updates. You’ll still receive essential coaching and account messages."
-                if channel == "sms":
-                    send_sms(to=user.phone, text=msg)
-                else:
-                    send_whatsapp(to=user.phone, text=msg)
+                send_whatsapp(to=user.phone, text="Sorry, admin commands are restricted to superusers.")
             except Exception:
                 pass
-            return Response(content="", media_type="text/plain", status_code=200)
+            return
+
+    lower_body = body.lower()
 
-        # Active assessment session handling (consent/name or in-progress)
-        # Keep this before coaching/day-flow shortcuts so assessment replies are never hijacked.
+    if lower_body in {"stop", "unsubscribe", "opt out", "opt-out", "cancel marketing"}:
         try:
-            from .models import AssessSession
             with SessionLocal() as s:
-                active_sess = (
-                    s.query(AssessSession)
-                    .filter(AssessSession.user_id == user.id, AssessSession.is_active == True)  # noqa: E712
-                    .first()
+                pref = (
+                    s.query(UserPreference)
+                    .filter(UserPreference.user_id == user.id, UserPreference.key == "marketing_opt_in")
+                    .one_or_none()
                 )
-            if active_sess:
-                _continue_assessment_async(user, body)
-                return Response(content="", media_type="text/plain", status_code=200)
-            # If no active session but consent not recorded, continue assessment flow to capture consent/name
-            has_consent = bool(getattr(user, "consent_given", False)) \
-                          or bool(getattr(user, "consent_at", None)) \
-                          or bool(getattr(user, "consent_yes_at", None)) \
-                          or bool(getattr(user, "first_assessment_completed", None))
-            if not has_consent:
-                _continue_assessment_async(user, body)
-                return Response(content="", media_type="text/plain", status_code=200)
+                if pref:
+                    pref.value = "0"
+                else:
+                    s.add(UserPreference(user_id=user.id, key="marketing_opt_in", value="0"))
+                s.commit()
+            msg = "You’re unsubscribed from marketing updates. You’ll still receive essential coaching and account messages."
+            if channel == "sms":
+                send_sms(to=user.phone, text=msg)
+            else:
+                send_whatsapp(to=user.phone, text=msg)
         except Exception:
             pass
+        return
 
-        # App-channel users should continue via the in-app chat surface for coaching.
-        # Keep this after active-assessment handling so legacy WhatsApp assessments are not interrupted.
-        # For strict channel separation, do not send coaching replies on WhatsApp when app is selected.
+    # Active assessment session handling (consent/name or in-progress)
+    # Keep this before coaching/day-flow shortcuts so assessment replies are never hijacked.
+    try:
+        from .models import AssessSession
+        with SessionLocal() as s:
+            active_sess = (
+                s.query(AssessSession)
+                .filter(AssessSession.user_id == user.id, AssessSession.is_active == True)  # noqa: E712
+                .first()
+            )
+        if active_sess:
+            _continue_assessment_async(user, body)
+            return
+        # If no active session but consent not recorded, continue assessment flow to capture consent/name
+        has_consent = bool(getattr(user, "consent_given", False)) \
+                      or bool(getattr(user, "consent_at", None)) \
+                      or bool(getattr(user, "consent_yes_at", None)) \
+                      or bool(getattr(user, "first_assessment_completed", None))
+        if not has_consent:
+            _continue_assessment_async(user, body)
+            return
+    except Exception:
+        pass
+
+    # Every preference the routing below consults (channel, coaching switches and the
+    # per-flow states) in one query; handlers get the snapshot instead of re-reading.
+    try:
+        conv_state = load_conversation_state(int(user.id), extra_keys=(COACHING_PENDING_DAY_PREF_KEY,))
+    except Exception as e:
+        print(f"[twilio] WARN: conversation state load failed user_id={user.id}: {e}")
+        conv_state = None
+
+    # App-channel users should continue via the in-app chat surface for coaching.
+    # Keep this after active-assessment handling so legacy WhatsApp assessments are not interrupted.
+    # For strict channel separation, do not send coaching replies on WhatsApp when app is selected.
+    try:
+        preferred_channel = (_state_pref_value(conv_state, int(user.id), "preferred_channel") or "").strip().lower()
+        if preferred_channel == "app":
+            return
+    except Exception:
+        pass
+
+    # If a day prompt was deferred because the user was outside 24h, resume it now.
+    if _handle_pending_coaching_day_resume(user, body, conv_state):
+        return
+
+    # Coaching greeting shortcut:
+    # - send today's day flow if not already sent
+    # - otherwise route to general coach mode
+    if _handle_coaching_greeting(user, body, conv_state):
+        return
+
+    # User coaching note command (available anytime)
+    if lower_body.startswith("coachmycoach"):
+        coachmycoach.handle(user, body)
+        return
+
+    if lower_body.startswith("psych"):
+        try:
+            psych.handle_message(user, body, conv_state)
+        except Exception as e:
+            send_whatsapp(to=user.phone, text=f"Psych check failed: {e}")
+        return
+    if habit_selector.has_active_state(user.id, conv_state):
+        try:
+            habit_selector.handle_message(user, body, conv_state)
+        except Exception as e:
+            send_whatsapp(to=user.phone, text=f"Habit steps failed: {e}")
+        return
+
+    if sunday.has_active_state(user.id, conv_state):
         try:
             with SessionLocal() as s:
-                preferred_channel = (_pref_value(s, int(user.id), "preferred_channel") or "").strip().lower()
-            if preferred_channel == "app":
-                return Response(content="", media_type="text/plain", status_code=200)
+                rows = (
+                    s.query(UserPreference)
+                    .filter(UserPreference.user_id == int(user.id), UserPreference.key == "sunday_state")
+                    .all()
+                )
+                for row in rows:
+                    s.delete(row)
+                s.commit()
         except Exception:
             pass
+        try:
+            _ensure_general_support_active(user, "retired_sunday_state", conv_state)
+            general_support.handle_message(user, body, conv_state)
+        except Exception as e:
+            send_whatsapp(to=user.phone, text=f"Coaching support failed: {e}")
+        return
 
-        # If a day prompt was deferred because the user was outside 24h, resume it now.
-        if _handle_pending_coaching_day_resume(user, body):
-            return Response(content="", media_type="text/plain", status_code=200)
-
-        # Coaching greeting shortcut:
-        # - send today's day flow if not already sent
-        # - otherwise route to general coach mode
-        if _handle_coaching_greeting(user, body):
-            return Response(content="", media_type="text/plain", status_code=200)
-
-        # User coaching note command (available anytime)
-        if lower_body.startswith("coachmycoach"):
-            coachmycoach.handle(user, body)
-            return Response(content="", media_type="text/plain", status_code=200)
+    first_token = lower_body.split(maxsplit=1)[0] if lower_body else ""
+    if first_token in {
+        "kickoff",
+        "midweek",
+        "wednesday",
+        "week",
+        "sunday",
+        "tuesday",
+        "thursday",
+        "saturday",
+        "weekstart",
+        "monday",
+        "boost",
+        "friday",
+    } or monday.has_active_state(user.id, conv_state):
+        try:
+            with SessionLocal() as s:
+                rows = (
+                    s.query(UserPreference)
+                    .filter(UserPreference.user_id == int(user.id), UserPreference.key == "weekstart_state")
+                    .all()
+                )
+                for row in rows:
+                    s.delete(row)
+                s.commit()
+        except Exception:
+            pass
+        try:
+            _ensure_general_support_active(user, "retired_schedule_command", conv_state)
+            general_support.handle_message(user, body, conv_state)
+        except Exception as e:
+            send_whatsapp(to=user.phone, text=f"Coaching support failed: {e}")
+        return
+    # Interactive menu commands
+    if lower_body in {"menu", "help", "options"}:
+        send_menu_options(user)
+        return
 
-        if lower_body.startswith("psych"):
-            try:
-                psych.handle_message(user, body)
-            except Exception as e:
-                send_whatsapp(to=user.phone, text=f"Psych check failed: {e}")
-            return Response(content="", media_type="text/plain", status_code=200)
-        if habit_selector.has_active_state(user.id):
-            try:
-                habit_selector.handle_message(user, body)
-            except Exception as e:
-                send_whatsapp(to=user.phone, text=f"Habit steps failed: {e}")
-            return Response(content="", media_type="text/plain", status_code=200)
+    if lower_body == "assessment":
+        try:
+            print(f"[api] assessment command received for user_id={user.id}")
+        except Exception:
+            pass
+        send_dashboard_link(user)
+        return
+    if lower_body == "progress":
+        try:
+            from .reporting import generate_progress_report_html
+            path = generate_progress_report_html(user.id)
+            url = _public_report_url(user.id, "progress.html")
+            send_whatsapp(to=user.phone, text=f"Your progress report: {url}")
+        except Exception as e:
+            send_whatsapp(to=user.phone, text=f"Couldn't refresh your progress report: {e}")
+        return
 
-        if sunday.has_active_state(user.id):
+    # Explicit assessment entry (including marketing CTA replies from WhatsApp/SMS)
+    normalized_body = " ".join(re.sub(r"[^a-z0-9\s]+", " ", (body or "").strip().lower()).split())
+    marketing_start_tokens = {
+        "send",
+        "start",
+        "hit start",
+        "hit send",
+        "tap start",
+        "tap send",
+        "start free assessment",
+        "hit start to start free assessment",
+        "hit send to start free assessment",
+        "free assessment",
+        "start assessment",
+        "hi",
+        "hello",
+    }
+    looks_like_marketing_cta = (
+        normalized_body in marketing_start_tokens
+        or (
+            "hit send" in normalized_body
+            and "start" in normalized_body
+            and "free assessment" in normalized_body
+        )
+    )
+    if looks_like_marketing_cta:
+        completed_assessment = bool(getattr(user, "first_assessment_completed", None))
+        coaching_enabled = False
+        try:
+            coaching_enabled = _state_coaching_enabled(conv_state, int(user.id))
+        except Exception:
+            coaching_enabled = False
+        # Do not restart assessment for users already in coaching or already completed.
+        if completed_assessment or coaching_enabled:
             try:
-                with SessionLocal() as s:
-                    rows = (
-                        s.query(UserPreference)
-                        .filter(UserPreference.user_id == int(user.id), UserPreference.key == "sunday_state")
-                        .all()
-                    )
-                    for row in rows:
-                        s.delete(row)
-                    s.commit()
+                print(
+                    "[api] marketing_cta_ignored"
+                    f" user_id={user.id}"
+                    f" normalized_body={normalized_body!r}"
+                    f" completed_assessment={completed_assessment}"
+                    f" coaching_enabled={coaching_enabled}"
+                )
             except Exception:
                 pass
-            try:
-                if not general_support.has_active_state(int(user.id)):
-                    general_support.activate(int(user.id), source="retired_sunday_state", week_no=None, send_intro=False)
-                general_support.handle_message(user, body)
-            except Exception as e:
-                send_whatsapp(to=user.phone, text=f"Coaching support failed: {e}")
-            return Response(content="", media_type="text/plain", status_code=200)
+            if normalized_body in {"hi", "hello", "start", "send", "hit start", "hit send", "tap start", "tap send"}:
+                send_menu_options(user)
+            return
+        # Clear any stale active session and force fresh consent/name capture
+        _start_assessment_async(user, force_intro=True)
+        return
 
-        first_token = lower_body.split(maxsplit=1)[0] if lower_body else ""
-        if first_token in {
-            "kickoff",
-            "midweek",
-            "wednesday",
-            "week",
-            "sunday",
-            "tuesday",
-            "thursday",
-            "saturday",
-            "weekstart",
-            "monday",
-            "boost",
-            "friday",
-        } or monday.has_active_state(user.id):
-            try:
-                with SessionLocal() as s:
-                    rows = (
-                        s.query(UserPreference)
-                        .filter(UserPreference.user_id == int(user.id), UserPreference.key == "weekstart_state")
-                        .all()
-                    )
-                    for row in rows:
-                        s.delete(row)
-                    s.commit()
-            except Exception:
-                pass
-            try:
-                if not general_support.has_active_state(int(user.id)):
-                    general_support.activate(int(user.id), source="retired_schedule_command", week_no=None, send_intro=False)
-                general_support.handle_message(user, body)
-            except Exception as e:
-                send_whatsapp(to=user.phone, text=f"Coaching support failed: {e}")
-            return Response(content="", media_type="text/plain", status_code=200)
-        # Interactive menu commands
-        if lower_body in {"menu", "help", "options"}:
-            send_menu_options(user)
-            return Response(content="", media_type="text/plain", status_code=200)
-
-        if lower_body == "assessment":
-            try:
-                print(f"[api] assessment command received for user_id={user.id}")
-            except Exception:
-                pass
-            send_dashboard_link(user)
-            return Response(content="", media_type="text/plain", status_code=200)
-        if lower_body == "progress":
-            try:
-                from .reporting import generate_progress_report_html
-                path = generate_progress_report_html(user.id)
-                url = _public_report_url(user.id, "progress.html")
-                send_whatsapp(to=user.phone, text=f"Your progress report: {url}")
-            except Exception as e:
-                send_whatsapp(to=user.phone, text=f"Couldn't refresh your progress report: {e}")
-            return Response(content="", media_type="text/plain", status_code=200)
-
-        # Explicit assessment entry (including marketing CTA replies from WhatsApp/SMS)
-        normalized_body = " ".join(re.sub(r"[^a-z0-9\s]+", " ", (body or "").strip().lower()).split())
-        marketing_start_tokens = {
-            "send",
-            "start",
-            "hit start",
-            "hit send",
-            "tap start",
-            "tap send",
-            "start free assessment",
-            "hit start to start free assessment",
-            "hit send to start free assessment",
-            "free assessment",
-            "start assessment",
-            "hi",
-            "hello",
-        }
-        looks_like_marketing_cta = (
-            normalized_body in marketing_start_tokens
-            or (
-                "hit send" in normalized_body
-                and "start" in normalized_body
-                and "free assessment" in normalized_body
-            )
+    if general_support.has_active_state(user.id, conv_state):
+        general_support.handle_message(user, body, conv_state)
+        return
+
+    # No explicit command matched; treat as a freeform check-in for history
+    try:
+        _record_freeform_checkin(user, body)
+    except Exception:
+        pass
+
+
+@router.post("/webhooks/twilio")
+async def twilio_inbound(request: Request):
+    """
+    Accepts x-www-form-urlencoded payloads from Twilio (SMS/WhatsApp).
+    Parses the raw body for maximum compatibility, resolves the user and logs the
+    inbound message (known sender or not), then acknowledges; routing happens on the
+    inbound dispatcher, which is drained on shutdown.
+    """
+    try:
+        raw = (await request.body()).decode("utf-8")
+        data = parse_qs(raw, keep_blank_values=True)
+
+        body = (data.get("Body", [""])[0] or "").strip()
+        button_payload = (data.get("ButtonPayload", [""])[0] or "").strip()
+        button_text = (data.get("ButtonText", [""])[0] or "").strip()
+        if button_payload:
+            body = button_payload
+        elif not body and button_text:
+            body = button_text
+        from_raw = (data.get("From", [""])[0] or "").strip()
+        if not from_raw:
+            return Response(content="", media_type="text/plain", status_code=400)
+
+        phone = from_raw.replace("whatsapp:", "") if from_raw.startswith("whatsapp:") else from_raw
+        channel = "whatsapp" if from_raw.startswith("whatsapp:") else "sms"
+
+        # Persist before acknowledging; routing (DB state machines, LLM turns, outbound
+        # sends) runs off the event loop on the inbound dispatcher, in order per phone.
+        user = await asyncio.to_thread(_get_or_create_user, phone, create_if_missing=False)
+        if user:
+            await asyncio.to_thread(_log_inbound_direct, user, channel, body, from_raw)
+        else:
+            await asyncio.to_thread(_log_inbound_unknown, channel, body, from_raw, phone)
+        user_id = int(user.id) if user else None
+        _twilio_inbound_dispatcher().submit(
+            phone,
+            lambda: _route_twilio_inbound(user_id, body, from_raw, phone, channel),
         )
-        if looks_like_marketing_cta:
-            completed_assessment = bool(getattr(user, "first_assessment_completed", None))
-            coaching_enabled = False
-            try:
-                with SessionLocal() as s:
-                    coaching_enabled = _coaching_enabled_for_user(s, int(user.id))
-            except Exception:
-                coaching_enabled = False
-            # Do not restart assessment for users already in coaching or already completed.
-            if completed_assessment or coaching_enabled:
-                try:
-                    print(
-                        "[api] marketing_cta_ignored"
-                        f" user_id={user.id}"
-                        f" normalized_body={normalized_body!r}"
-                        f" completed_assessment={completed_assessment}"
-                        f" coaching_enabled={coaching_enabled}"
-                    )
-                except Exception:
-                    pass
-                if normalized_body in {"hi", "hello", "start", "send", "hit start", "hit send", "tap start", "tap send"}:
-                    send_menu_options(user)
-                return Response(content="", media_type="text/plain", status_code=200)
-            # Clear any stale active session and force fresh consent/name capture
-            _start_assessment_async(user, force_intro=True)
-            return Response(content="", media_type="text/plain", status_code=200)
-
-        if general_support.has_active_state(user.id):
-            general_support.handle_message(user, body)
-            return Response(content="", media_type="text/plain", status_code=200)
-
-        # No explicit command matched; treat as a freeform check-in for history
-        try:
-            _record_freeform_checkin(user, body)
-        except Exception:
-            pass
-        # Acknowledge silently
         return Response(content="", media_type="text/plain", status_code=200)
 
     except Exception as e:
@@ -5744,6 +5884,42 @@ def _coaching_enabled_for_user(session, user_id: int) -> bool:
     )
     return bool(legacy_row and str(legacy_row.value or "").strip() == "1")
 
+
+def _state_pref_value(conversation_state: ConversationState | None, user_id: int, key: str) -> str | None:
+    """_pref_value served from a routing snapshot when it covers the key."""
+    if conversation_state is not None and conversation_state.covers(key):
+        val = str(conversation_state.value(key) or "").strip()
+        return val or None
+    with SessionLocal() as s:
+        return _pref_value(s, user_id, key)
+
+
+def _state_coaching_enabled(conversation_state: ConversationState | None, user_id: int) -> bool:
+    """_coaching_enabled_for_user served from a routing snapshot when it covers both keys."""
+    if (
+        conversation_state is not None
+        and conversation_state.covers("coaching")
+        and conversation_state.covers("auto_daily_prompts")
+    ):
+        if conversation_state.has("coaching"):
+            return str(conversation_state.value("coaching") or "").strip() == "1"
+        return str(conversation_state.value("auto_daily_prompts") or "").strip() == "1"
+    with SessionLocal() as s:
+        return _coaching_enabled_for_user(s, user_id)
+
+
+def _ensure_general_support_active(
+    user: User,
+    source: str,
+    conversation_state: ConversationState | None = None,
+) -> None:
+    if general_support.has_active_state(int(user.id), conversation_state):
+        return
+    general_support.activate(int(user.id), source=source, week_no=None, send_intro=False)
+    if conversation_state is not None:
+        # The snapshot predates activation; let handle_message read the new state.
+        conversation_state.forget(general_support.STATE_KEY)
+
 def _latest_assessment_completed_at(session, user_id: int) -> str | None:
     user_row = session.get(User, int(user_id))
     if not user_row:
@@ -6586,7 +6762,7 @@ def api_public_assessment_lead_first_reply(payload: dict | None, request: Reques
     _log_app_chat_inbound(db_user, text_val, meta_extra=quick_reply_meta)
 
     outbox: list[dict] = []
-    with assessment_delivery_context(
+    with prompt_context_scope(), assessment_delivery_context(
         channel="app",
         outbox=outbox,
         source="api_v1_public_lead_first_reply",
@@ -7231,14 +7407,28 @@ def api_user_assessment_chat_start(
     }
 
 
-@api_v1.post("/users/{user_id}/assessment/chat/send")
-def api_user_assessment_chat_send(
+class _StreamingOutbox(list):
+    """Outbox list that also reports each appended message (for the SSE chat stream)."""
+
+    def __init__(self, on_append):
+        super().__init__()
+        self._on_append = on_append
+
+    def append(self, item) -> None:
+        super().append(item)
+        try:
+            self._on_append(item)
+        except Exception:
+            pass
+
+
+def _assessment_chat_send_prepare(
     user_id: int,
     payload: dict | None,
     request: Request,
-    x_admin_token: str | None = Header(None, alias="X-Admin-Token"),
-    x_admin_user_id: str | None = Header(None, alias="X-Admin-User-Id"),
-):
+    x_admin_token: str | None,
+    x_admin_user_id: str | None,
+) -> tuple[User, str, str, dict[str, object] | None]:
     user = _resolve_user_access(request=request, user_id=user_id, x_admin_token=x_admin_token, x_admin_user_id=x_admin_user_id)
     if _is_readonly_admin_preview_request(
         request,
@@ -7271,9 +7461,23 @@ def api_user_assessment_chat_send(
             }
             if label_val:
                 quick_reply_meta["quick_reply_label"] = label_val[:40]
+    return user, text_val, chat_mode, quick_reply_meta
+
+
+def _assessment_chat_send_run(
+    user: User,
+    user_id: int,
+    text_val: str,
+    chat_mode: str,
+    quick_reply_meta: dict[str, object] | None,
+    outbox: list[dict],
+) -> dict:
     _log_app_chat_inbound(user, text_val, meta_extra=quick_reply_meta)
-    outbox: list[dict] = []
-    with assessment_delivery_context(
+    support_mode = chat_mode in {"general_support", "tracker_summary"}
+    with prompt_context_scope(
+        user_id=user_id if support_mode else None,
+        tracker=support_mode,
+    ), assessment_delivery_context(
         channel="app",
         outbox=outbox,
         source="api_v1_assessment_chat_send",
@@ -7297,11 +7501,86 @@ def api_user_assessment_chat_send(
         "ok": True,
         "handled": resolved_handled,
         "needs_start": bool((not resolved_handled) and (not chat_state.get("has_active_session"))),
-        "outbox": outbox,
+        "outbox": list(outbox),
         **chat_state,
     }
 
 
+@api_v1.post("/users/{user_id}/assessment/chat/send")
+def api_user_assessment_chat_send(
+    user_id: int,
+    payload: dict | None,
+    request: Request,
+    x_admin_token: str | None = Header(None, alias="X-Admin-Token"),
+    x_admin_user_id: str | None = Header(None, alias="X-Admin-User-Id"),
+):
+    user, text_val, chat_mode, quick_reply_meta = _assessment_chat_send_prepare(
+        user_id, payload, request, x_admin_token, x_admin_user_id
+    )
+    return _assessment_chat_send_run(user, user_id, text_val, chat_mode, quick_reply_meta, [])
+
+
+def _sse_event(event: str, data: object) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@api_v1.post("/users/{user_id}/assessment/chat/stream")
+async def api_user_assessment_chat_stream(
+    user_id: int,
+    payload: dict | None,
+    request: Request,
+    x_admin_token: str | None = Header(None, alias="X-Admin-Token"),
+    x_admin_user_id: str | None = Header(None, alias="X-Admin-User-Id"),
+):
+    """
+    Streaming variant of /assessment/chat/send (Server-Sent Events). Emits:
+      - token:   {"touchpoint", "delta"} for each LLM text chunk as it arrives
+      - message: each outbox entry as soon as it is delivered (final, full text)
+      - done:    the same payload /assessment/chat/send returns
+      - error:   {"detail"} if handling failed
+    """
+    user, text_val, chat_mode, quick_reply_meta = await asyncio.to_thread(
+        _assessment_chat_send_prepare, user_id, payload, request, x_admin_token, x_admin_user_id
+    )
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def _emit(event: str, data: object) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    def _run() -> None:
+        outbox = _StreamingOutbox(lambda item: _emit("message", item))
+        try:
+            with llm_stream_context(lambda tp, delta: _emit("token", {"touchpoint": tp, "delta": delta})):
+                result = _assessment_chat_send_run(user, user_id, text_val, chat_mode, quick_reply_meta, outbox)
+            _emit("done", result)
+        except Exception as exc:
+            print(f"[api] assessment chat stream failed user_id={user_id}: {exc!r}")
+            _emit("error", {"detail": "chat handling failed"})
+        finally:
+            _emit("", None)
+
+    async def _events():
+        # asyncio.to_thread copies contextvars, so delivery/stream scopes stay per-request.
+        task = asyncio.ensure_future(asyncio.to_thread(_run))
+        try:
+            while True:
+                event, data = await events.get()
+                if not event:
+                    break
+                yield _sse_event(event, data)
+        finally:
+            # On client disconnect the handler still completes (and persists) in the background.
+            if not task.done():
+                task.add_done_callback(lambda t: t.exception())
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @api_v1.post("/users/{user_id}/assessment/chat/tracker-summary")
 def api_user_assessment_chat_tracker_summary(
     user_id: int,
@@ -7756,11 +8035,12 @@ def _build_daily_tracker_summary_realtime_session_payload(
     summary_text = requested_text
     if not summary_text:
         try:
-            summary_text = general_support.generate_tracker_summary_message(
-                user,
-                source="app_tracker_summary",
-                include_prefix=False,
-            )
+            with prompt_context_scope(user_id=int(user.id), tracker=True):
+                summary_text = general_support.generate_tracker_summary_message(
+                    user,
+                    source="app_tracker_summary",
+                    include_prefix=False,
+                )
         except HTTPException:
             raise
         except Exception as exc:
@@ -14883,6 +15163,7 @@ def _build_prompt_cost_rows(
             "rate_out": None,
             "rate_source": None,
             "cost_est_gbp": 0.0,
+            "cache_hit": bool((_meta_to_dict(prompt.context_meta) or {}).get("response_cache_hit")),
             "match_user": True if user_id is None else (resolved_user_id == user_id),
         }
 
@@ -14941,6 +15222,9 @@ def _build_prompt_cost_rows(
             entry["tokens_in"] = float(estimate_tokens(entry.get("prompt_text_full")))
         if not entry["tokens_out"] and entry.get("response_text_full"):
             entry["tokens_out"] = float(estimate_tokens(entry.get("response_text_full")))
+        if entry.get("cache_hit"):
+            # Served from the LLM response cache: nothing was billed.
+            rate_in = rate_out = 0.0
         calc_cost = (entry["tokens_in"] / 1_000_000.0) * rate_in + (entry["tokens_out"] / 1_000_000.0) * rate_out
         logged_cost = float(entry.get("cost_est_gbp") or 0.0)
         cost_est = calc_cost if calc_cost else logged_cost
@@ -16675,6 +16959,7 @@ def admin_prompt_template_create(
         s.add(row)
         s.commit()
         s.refresh(row)
+    bump_prompt_cache_version()
     return {"id": row.id, "touchpoint": row.touchpoint}
 
 
@@ -16718,6 +17003,7 @@ def admin_prompt_template_update(
                         .update({PromptTemplate.is_active: False}, synchronize_session=False)
                     )
             s.commit()
+            bump_prompt_cache_version()
             return {"ok": True}
         if "okr_scope" in payload:
             row.okr_scope = payload.get("okr_scope") or None
@@ -16737,6 +17023,7 @@ def admin_prompt_template_update(
             row.block_order = block_order or None
             row.include_blocks = include_blocks or block_order or None
         s.commit()
+    bump_prompt_cache_version()
     return {"ok": True}
 
 
@@ -16806,6 +17093,7 @@ def admin_prompt_template_promote(
                 status_code=409,
                 detail="Prompt template promotion conflicted with an existing version. Refresh and try again.",
             ) from exc
+    bump_prompt_cache_version()
     return response_payload or {"ok": True}
 
 
@@ -16872,6 +17160,19 @@ def admin_prompt_settings(admin_user: User = Depends(_require_admin)):
     }
 
 
+@admin.get("/worker/metrics")
+def admin_worker_metrics(
+    window_minutes: int = 15,
+    admin_user: User = Depends(_require_admin),
+):
+    _ = admin_user
+    metrics = job_queue_metrics(window_minutes=max(1, min(int(window_minutes), 24 * 60)))
+    return Response(
+        content=render_job_queue_metrics_prometheus(metrics),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @admin.get("/prompts/versions")
 def admin_prompt_versions(limit: int = 20, admin_user: User = Depends(_require_admin)):
     admin_routes._ensure_prompt_template_table()  # type: ignore[attr-defined]
@@ -17072,6 +17373,93 @@ def admin_background_job_history(
     return {"items": items, "kinds": kinds}
 
 
+@admin.get("/background-jobs/stats")
+def admin_background_job_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    ensure_job_table()
+    return job_table_stats()
+
+
+@admin.post("/background-jobs/retention/run")
+def admin_background_job_retention_run(
+    dry_run: bool = True,
+    admin_user: User = Depends(_require_admin),
+):
+    _ = admin_user
+    return compact_finished_jobs_from_env(dry_run=bool(dry_run))
+
+
+@admin.get("/llm/response-cache/stats")
+def admin_llm_response_cache_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    return llm_response_cache_stats()
+
+
+@admin.get("/prompts/cache/stats")
+def admin_prompt_cache_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    return prompt_cache_stats()
+
+
+@admin.get("/llm/token-budget/stats")
+def admin_llm_token_budget_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    from .token_budget import token_budget_stats
+    return token_budget_stats()
+
+
+@admin.get("/messaging/outbound/stats")
+def admin_outbound_dispatcher_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    from .outbound_dispatcher import outbound_dispatcher_stats
+    return outbound_dispatcher_stats()
+
+
+@admin.get("/messaging/inbound/stats")
+def admin_twilio_inbound_dispatcher_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    return _twilio_inbound_dispatcher().stats()
+
+
+@admin.get("/messaging/identity-cache/stats")
+def admin_user_identity_cache_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    return user_identity_cache_stats()
+
+
+@admin.get("/messaging/rate-limit/stats")
+def admin_send_rate_limit_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    from .send_rate_limiter import send_rate_limiter_stats
+    return send_rate_limiter_stats()
+
+
+@admin.get("/llm/fanout/stats")
+def admin_llm_fanout_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    from .llm_fanout import llm_fanout_stats
+    return llm_fanout_stats()
+
+
+@admin.get("/prompts/log-writer/stats")
+def admin_prompt_log_writer_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    from .prompts import llm_prompt_log_writer_stats
+    return llm_prompt_log_writer_stats()
+
+
+@admin.post("/prompts/cache/invalidate")
+def admin_prompt_cache_invalidate(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    return {"version": bump_prompt_cache_version()}
+
+
+@admin.post("/llm/response-cache/purge")
+def admin_llm_response_cache_purge(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    return {"deleted": purge_expired_llm_responses()}
+
+
 @admin.get("/prompts/history/filter-touchpoints")
 def admin_prompt_history_filter_touchpoints(
     user_id: int | None = None,
@@ -18023,11 +18411,15 @@ def admin_prompt_settings_update(
         if "podcast_worker_mode_override" in payload:
             row.podcast_worker_mode_override = _parse_override(payload.get("podcast_worker_mode_override"))
         s.commit()
+    bump_prompt_cache_version()
     return {"ok": True}
 
 
 @admin.get("/worker/status")
-def admin_worker_status(admin_user: User = Depends(_require_admin)):
+def admin_worker_status(
+    window_minutes: int = 60,
+    admin_user: User = Depends(_require_admin),
+):
     admin_routes._ensure_prompt_template_table()  # type: ignore[attr-defined]
     ensure_prompt_settings_schema()
 
@@ -18056,6 +18448,7 @@ def admin_worker_status(admin_user: User = Depends(_require_admin)):
         "podcast_worker_mode_effective": effective_podcast,
         "worker_mode_source": "override" if worker_override is not None else "env",
         "podcast_worker_mode_source": podcast_source,
+        "queue": job_queue_metrics(window_minutes=max(1, min(int(window_minutes), 24 * 60))),
     }
 
 
@@ -18631,6 +19024,7 @@ def _build_prompt_test_payload(
     test_date: str | None,
     run_llm: bool,
     model_override: str | None,
+    use_cache: bool = False,
 ) -> dict:
     tp_lower = touchpoint.lower()
 
@@ -18664,13 +19058,25 @@ def _build_prompt_test_payload(
                 touchpoint=touchpoint,
                 model_override=effective_model,
             )
-            resp = client.invoke(assembly.text)
+
+            def _invoke() -> str:
+                resp = client.invoke(assembly.text)
+                return (getattr(resp, "content", "") or "").strip()
+
+            content, cache_hit = cached_llm_text(
+                assembly.text,
+                model=resolved_model,
+                touchpoint=touchpoint,
+                invoke=_invoke,
+                # Explicit opt-in from the tester: honour the touchpoint TTL, else keep for an hour.
+                ttl_seconds=(cache_ttl_for_touchpoint(touchpoint) or 3600) if use_cache else 0,
+            )
             duration_ms = int((time.perf_counter() - t0) * 1000)
-            content = (getattr(resp, "content", "") or "").strip()
             return {
                 "model": resolved_model,
                 "duration_ms": duration_ms,
                 "content": content,
+                "cache_hit": cache_hit,
             }
         except Exception as e:
             return {"error": str(e)}
@@ -18848,6 +19254,7 @@ def admin_prompt_test(payload: dict, admin_user: User = Depends(_require_admin))
     state = (payload.get("state") or "published").strip().lower()
     test_date = payload.get("test_date")
     run_llm = bool(payload.get("run_llm"))
+    use_cache = bool(payload.get("use_cache"))
     model_override = (payload.get("model_override") or "").strip() or None
     generate_podcast = bool(payload.get("generate_podcast"))
     podcast_voice = (payload.get("podcast_voice") or "").strip() or None
@@ -18865,6 +19272,7 @@ def admin_prompt_test(payload: dict, admin_user: User = Depends(_require_admin))
         test_date=test_date,
         run_llm=run_llm,
         model_override=model_override,
+        use_cache=use_cache,
     )
     if generate_podcast:
         llm = (result or {}).get("llm") or {}
@@ -21825,6 +22233,22 @@ def admin_script_run_log(run_id: int, tail: int = 4000, admin_user: User = Depen
         data = fh.read()
     return {"log": data.decode(errors="replace"), "path": log_path, "tail": tail}
 
+@admin.get("/kb/index/stats")
+def admin_kb_index_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    return kb_index_stats()
+
+@admin.get("/kb/query-embedding-cache/stats")
+def admin_kb_query_embedding_cache_stats(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    return query_embedding_cache_stats()
+
+@admin.post("/kb/index/invalidate")
+def admin_kb_index_invalidate(admin_user: User = Depends(_require_admin)):
+    _ = admin_user
+    invalidate_kb_index()
+    return {"ok": True}
+
 @admin.get("/kb/snippets/{snippet_id}")
 def admin_kb_snippet_detail(snippet_id: int, admin_user: User = Depends(_require_admin)):
     with SessionLocal() as s:
@@ -21864,8 +22288,9 @@ def admin_kb_snippet_create(payload: dict, admin_user: User = Depends(_require_a
         s.flush()
         embedding_source = f"{title}\n{text_val}" if title else text_val
         embedding = embed_text(embedding_source)
-        s.add(KBVector(snippet_id=sn.id, embedding=embedding))
+        s.add(KBVector(snippet_id=sn.id, embedding=embedding, embedding_model=embedding_model_id()))
         s.commit()
+        invalidate_kb_index(pillar_key, concept_code)
         return {"id": sn.id}
 
 @admin.post("/kb/snippets/{snippet_id}")
@@ -21874,6 +22299,7 @@ def admin_kb_snippet_update(snippet_id: int, payload: dict, admin_user: User = D
         sn = s.query(KBSnippet).filter(KBSnippet.id == snippet_id).one_or_none()
         if not sn:
             raise HTTPException(status_code=404, detail="snippet not found")
+        old_partition = (sn.pillar_key, sn.concept_code)
         reembed = False
         if "pillar_key" in payload:
             pillar_key = (payload.get("pillar_key") or "").strip()
@@ -21901,8 +22327,11 @@ def admin_kb_snippet_update(snippet_id: int, payload: dict, admin_user: User = D
             s.query(KBVector).filter(KBVector.snippet_id == sn.id).delete()
             embedding_source = f"{sn.title}\n{sn.text}" if sn.title else sn.text
             embedding = embed_text(embedding_source)
-            s.add(KBVector(snippet_id=sn.id, embedding=embedding))
+            s.add(KBVector(snippet_id=sn.id, embedding=embedding, embedding_model=embedding_model_id()))
         s.commit()
+        invalidate_kb_index(*old_partition)
+        if (sn.pillar_key, sn.concept_code) != old_partition:
+            invalidate_kb_index(sn.pillar_key, sn.concept_code)
         return {"id": sn.id}
 
 @admin.get("/users")
@@ -22890,12 +23319,14 @@ def admin_user_prompt_state(user_id: int, payload: dict, admin_user: User = Depe
             if pref:
                 s.delete(pref)
                 s.commit()
+                bump_prompt_cache_version()
             return {"user_id": user_id, "prompt_state_override": ""}
         if not pref:
             pref = UserPreference(user_id=user_id, key="prompt_state_override")
             s.add(pref)
         pref.value = state_raw
         s.commit()
+    bump_prompt_cache_version()
     return {"user_id": user_id, "prompt_state_override": state_raw}
 
 @admin.post("/users/{user_id}/coaching")
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import atexit
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+
+class BufferedBatchWriter:
+    """
+    Single background thread that drains a bounded in-memory queue in batches.
+
+    submit() never does I/O: it enqueues and returns True, or returns False when the
+    buffer stays full for block_ms so the caller can apply its own overflow policy
+    (write inline, or drop and count). write_batch receives up to batch_size items,
+    waiting at most linger_ms after the first one for more to arrive, and returns how
+    many it wrote (None means all of them) or raises. Pending items are flushed at
+    interpreter exit (bounded by shutdown_timeout_sec).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        write_batch: Callable[[List[Any]], Optional[int]],
+        *,
+        max_queue: int = 1000,
+        batch_size: int = 50,
+        linger_ms: int = 200,
+        block_ms: int = 0,
+        shutdown_timeout_sec: float = 10.0,
+    ):
+        self.name = name
+        self._write_batch = write_batch
+        self.max_queue = max(1, int(max_queue))
+        self.batch_size = max(1, int(batch_size))
+        self.linger_sec = max(0, int(linger_ms)) / 1000.0
+        self.block_sec = max(0, int(block_ms)) / 1000.0
+        self.shutdown_timeout_sec = max(0.0, float(shutdown_timeout_sec))
+        self._items: Deque[Any] = deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._flush_requested = False
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"submitted": 0, "rejected": 0, "written": 0, "dropped": 0, "batches": 0, "batch_failures": 0}
+        atexit.register(self._flush_at_exit)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> bool:
+        deadline = time.monotonic() + self.block_sec
+        with self._cond:
+            while len(self._items) >= self.max_queue:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["rejected"] += 1
+                    return False
+                self._cond.wait(remaining)
+            self._items.append(item)
+            self._stats["submitted"] += 1
+            self._ensure_thread()
+            self._cond.notify_all()
+        return True
+
+    def _next_batch(self) -> List[Any]:
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            if len(self._items) < self.batch_size and not self._flush_requested:
+                deadline = time.monotonic() + self.linger_sec
+                while len(self._items) < self.batch_size and not self._flush_requested:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            batch = [self._items.popleft() for _ in range(min(self.batch_size, len(self._items)))]
+            self._in_flight += len(batch)
+            # Wake submitters blocked on a full buffer.
+            self._cond.notify_all()
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            written = 0
+            try:
+                result = self._write_batch(batch)
+                written = len(batch) if result is None else max(0, min(len(batch), int(result)))
+            except Exception as e:
+                print(f"[{self.name}] WARN: batch write failed ({len(batch)} items): {e}")
+            finally:
+                with self._cond:
+                    self._stats["written"] += written
+                    self._stats["dropped"] += len(batch) - written
+                    if not written:
+                        self._stats["batch_failures"] += 1
+                    self._stats["batches"] += 1
+                    self._in_flight -= len(batch)
+                    self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything submitted so far is written. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            if not (self._items or self._in_flight):
+                return True
+            self._ensure_thread()
+            self._flush_requested = True
+            self._cond.notify_all()
+            try:
+                while self._items or self._in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flush_requested = False
+
+    def _flush_at_exit(self) -> None:
+        pending = self.pending()
+        if not pending:
+            return
+        if not self.flush(self.shutdown_timeout_sec):
+            print(f"[{self.name}] WARN: shutdown flush timed out with {self.pending()} item(s) unwritten")
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._items) + self._in_flight
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queued = len(self._items)
+            in_flight = self._in_flight
+        return {
+            **self._stats,
+            "queued": queued,
+            "in_flight": in_flight,
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "linger_ms": int(self.linger_sec * 1000),
+            "block_ms": int(self.block_sec * 1000),
+        }
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import UserPreference
+
+# Preference keys inbound routing consults for every message: per-module flow
+# states plus the channel/coaching switches. Loaded together in one query.
+CONVERSATION_STATE_KEYS: tuple[str, ...] = (
+    "psych_state",            # psych.STATE_KEY
+    "habit_setup_state",      # habit_selector.STATE_KEY
+    "sunday_state",           # sunday.STATE_KEY / habit_selector.LEGACY_STATE_KEY
+    "weekstart_state",        # monday._state_key()
+    "general_support_state",  # general_support.STATE_KEY
+    "preferred_channel",
+    "coaching",
+    "auto_daily_prompts",
+)
+
+
+class ConversationState:
+    """
+    Snapshot of a user's conversation-state preferences. Module has_active_state /
+    handle_message accept it and read from it instead of querying, falling back to
+    the database for any key the snapshot does not cover (or that was forgotten
+    after a write).
+    """
+
+    def __init__(self, user_id: int, keys: Iterable[str], values: Dict[str, Optional[str]]):
+        self.user_id = int(user_id)
+        self._keys = set(keys)
+        self._values = dict(values)
+
+    def covers(self, key: str) -> bool:
+        return key in self._keys
+
+    def has(self, key: str) -> bool:
+        """True when a row exists for the key (even with an empty value)."""
+        return key in self._values
+
+    def value(self, key: str) -> Optional[str]:
+        """Raw stored value (latest row for the key), or None if absent."""
+        return self._values.get(key)
+
+    def json(self, key: str) -> Any:
+        raw = self._values.get(key)
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except Exception:
+            return None
+
+    def forget(self, *keys: str) -> None:
+        """Stop serving keys that were written after the snapshot was taken."""
+        for key in keys:
+            self._keys.discard(key)
+            self._values.pop(key, None)
+
+
+def load_conversation_state(
+    user_id: int,
+    *,
+    extra_keys: Iterable[str] = (),
+    session: Optional[Session] = None,
+) -> ConversationState:
+    keys = tuple(dict.fromkeys((*CONVERSATION_STATE_KEYS, *extra_keys)))
+
+    def _load(s: Session) -> Dict[str, Optional[str]]:
+        rows = (
+            s.query(UserPreference.key, UserPreference.value)
+            .filter(UserPreference.user_id == int(user_id), UserPreference.key.in_(keys))
+            .order_by(UserPreference.updated_at.is_(None), UserPreference.updated_at.desc(), UserPreference.id.desc())
+            .all()
+        )
+        values: Dict[str, Optional[str]] = {}
+        for key, value in rows:
+            # Rows are newest first; keep the first per key (as _pref_row does).
+            values.setdefault(key, value)
+        return values
+
+    if session is not None:
+        return ConversationState(user_id, keys, _load(session))
+    with SessionLocal() as s:
+        return ConversationState(user_id, keys, _load(s))
@@ -21,6 +21,7 @@ from .pillar_tracker import (
     tracker_today,
 )
 from .prompts import build_prompt, ensure_builtin_prompt_templates, run_llm_prompt
+from .prompt_context import active_prompt_context
 from .wearables import get_apple_health_resting_hr_summary
 from .pillar_config import ACTIVE_PILLAR_KEYS, pillar_label
 
@@ -1639,6 +1640,9 @@ def build_daily_tracker_generation_context(
     *,
     selected_concept_key: str | None = None,
 ) -> dict[str, Any]:
+    snapshot = active_prompt_context(user_id)
+    if snapshot is not None:
+        return snapshot.tracker_context(selected_concept_key)
     return _build_generation_context(user_id, selected_concept_key=selected_concept_key)
 
 
@@ -1647,6 +1651,10 @@ def build_daily_tracker_generation_context_snapshot(
     *,
     selected_concept_key: str | None = None,
 ) -> dict[str, Any]:
+    # Inside a prompt_context_scope the build is shared by every reader in the request/job.
+    snapshot = active_prompt_context(user_id)
+    if snapshot is not None:
+        return snapshot.tracker_snapshot(selected_concept_key)
     context = _build_generation_context(user_id, selected_concept_key=selected_concept_key)
     return {
         "context": context,
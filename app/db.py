@@ -6,6 +6,8 @@ from typing import Optional
 from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 
+from .prompt_context import PromptContextSession
+
 # ──────────────────────────────────────────────────────────────────────────────
 # DATABASE URL
 # ──────────────────────────────────────────────────────────────────────────────
@@ -68,7 +70,7 @@ else:
     # SQLite/local dev path.
     engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=PromptContextSession)
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Helpers
@@ -117,58 +119,105 @@ def ensure_auth_session_schema() -> None:
             )
         )
 
+def ensure_kb_vector_schema() -> None:
+    """Record which embedding backend/model produced each stored KB vector."""
+    inspector = inspect(engine)
+    if not inspector.has_table("kb_vectors"):
+        return
+    columns = {column["name"] for column in inspector.get_columns("kb_vectors")}
+    if "embedding_model" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE kb_vectors ADD COLUMN embedding_model varchar(160);"))
+
+
+KB_EMBED_DIM = _env_int("KB_EMBED_DIM", 1536)
+
+
 def ensure_pgvector_and_indexes() -> None:
     """
     Create pgvector extension and KB indexes (idempotent). No‑op on non‑Postgres.
     Safe to call on every startup.
+
+    kb_vectors.embedding stays JSONB (the portable copy every writer uses); a
+    vector(KB_EMBED_DIM) shadow column, kept in sync by trigger, carries the
+    ivfflat index that retriever.retrieve_snippets orders by.
+    Each step runs in its own transaction so one failure doesn't abort the rest.
     """
     if not _is_postgres():
         return
 
-    with engine.begin() as conn:
-        # 1) Ensure pgvector extension
-        try:
+    # 1) Ensure pgvector extension
+    try:
+        with engine.begin() as conn:
             conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
-        except Exception as e:
-            print(f"[db] WARN: failed to CREATE EXTENSION vector: {e}")
+    except Exception as e:
+        print(f"[db] WARN: failed to CREATE EXTENSION vector: {e}")
+        return
 
-        # If kb_vectors isn't created yet, indexes will be attempted later.
+    # If kb_vectors isn't created yet, indexes will be attempted later.
+    with engine.begin() as conn:
         if not _table_exists(conn, "kb_vectors"):
             return
 
-        # 2) ivfflat index on kb_vectors.embedding (optional, faster ANN)
-        try:
-            conn.execute(text("""
-                DO $$
+    dim = int(KB_EMBED_DIM)
+
+    # 2) vector shadow column + sync trigger + backfill
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE kb_vectors ADD COLUMN IF NOT EXISTS embedding_vec vector({dim});"))
+            conn.execute(text(f"""
+                CREATE OR REPLACE FUNCTION kb_vectors_sync_embedding_vec() RETURNS trigger AS $$
                 BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM pg_indexes WHERE indexname = 'kb_vec_idx'
-                    ) THEN
-                        CREATE INDEX kb_vec_idx
-                          ON kb_vectors USING ivfflat (embedding vector_cosine_ops)
-                          WITH (lists = 100);
+                    IF NEW.embedding IS NOT NULL
+                       AND jsonb_typeof(NEW.embedding) = 'array'
+                       AND jsonb_array_length(NEW.embedding) = {dim} THEN
+                        NEW.embedding_vec := (NEW.embedding::text)::vector;
+                    ELSE
+                        NEW.embedding_vec := NULL;
                     END IF;
-                END$$;
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql;
+            """))
+            conn.execute(text("DROP TRIGGER IF EXISTS kb_vectors_sync_embedding_vec ON kb_vectors;"))
+            conn.execute(text("""
+                CREATE TRIGGER kb_vectors_sync_embedding_vec
+                  BEFORE INSERT OR UPDATE OF embedding ON kb_vectors
+                  FOR EACH ROW EXECUTE FUNCTION kb_vectors_sync_embedding_vec();
+            """))
+            conn.execute(text(f"""
+                UPDATE kb_vectors
+                   SET embedding_vec = (embedding::text)::vector
+                 WHERE embedding_vec IS NULL
+                   AND jsonb_typeof(embedding) = 'array'
+                   AND jsonb_array_length(embedding) = {dim};
+            """))
+    except Exception as e:
+        print(f"[db] WARN: could not prepare kb_vectors.embedding_vec: {e}")
+        return
+
+    # 3) ivfflat index on kb_vectors.embedding_vec (ANN for cosine distance <=>)
+    lists = max(1, _env_int("KB_IVFFLAT_LISTS", 100))
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"""
+                CREATE INDEX IF NOT EXISTS kb_vec_idx
+                  ON kb_vectors USING ivfflat (embedding_vec vector_cosine_ops)
+                  WITH (lists = {lists});
             """))
-        except Exception as e:
-            # Can fail if extension missing or permissions—log and continue
-            print(f"[db] WARN: could not create kb_vec_idx: {e}")
+    except Exception as e:
+        # Can fail if extension missing or permissions—log and continue
+        print(f"[db] WARN: could not create kb_vec_idx: {e}")
 
-        # 3) metadata index for fast filters
-        try:
+    # 4) metadata index for the pillar/concept filter the distance query joins on
+    try:
+        with engine.begin() as conn:
             conn.execute(text("""
-                DO $$
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM pg_indexes WHERE indexname = 'kb_meta_idx'
-                    ) THEN
-                        CREATE INDEX kb_meta_idx
-                          ON kb_vectors (pillar_key, concept_key, type, locale);
-                    END IF;
-                END$$;
+                CREATE INDEX IF NOT EXISTS kb_meta_idx
+                  ON kb_snippets (pillar_key, concept_code, id);
             """))
-        except Exception as e:
-            print(f"[db] WARN: could not create kb_meta_idx: {e}")
+    except Exception as e:
+        print(f"[db] WARN: could not create kb_meta_idx: {e}")
 
 def maybe_seed_concepts_and_kb() -> None:
     """
@@ -211,6 +260,7 @@ def init_db() -> None:
 
     # 1) Create all tables
     Base.metadata.create_all(bind=engine)
+    ensure_kb_vector_schema()
 
     # 2) pgvector + indexes (Postgres only)
     ensure_pgvector_and_indexes()
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import random
+import threading
+from typing import Callable, Protocol, Sequence
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+EMBED_DIM = _env_int("KB_EMBED_DIM", 1536)
+# Texts per backend call when embedding in bulk (kb_ingest, reindexing).
+KB_EMBED_BATCH_SIZE = max(1, _env_int("KB_EMBED_BATCH_SIZE", 128))
+
+
+class EmbeddingBackend(Protocol):
+    name: str
+    dim: int
+    # True when embed_batch makes a network call (worth a shared cache lookup).
+    remote: bool
+
+    def embed_batch(self, texts: Sequence[str]) -> list[list[float]]:
+        ...
+
+
+class HashEmbeddingBackend:
+    """
+    Deterministic placeholder: a sha256-seeded pseudo-random unit vector per text.
+    Produces the same vectors the original embed_text stub did, so stored KB
+    embeddings stay comparable, but seeds a private RNG instead of the global one.
+    """
+
+    name = "hash"
+    remote = False
+
+    def __init__(self, dim: int = EMBED_DIM):
+        self.dim = int(dim)
+
+    def _one(self, text: str) -> list[float]:
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        rand = rng.random
+        v = [rand() - 0.5 for _ in range(self.dim)]
+        n = math.sqrt(sum(x * x for x in v)) or 1.0
+        return [x / n for x in v]
+
+    def embed_batch(self, texts: Sequence[str]) -> list[list[float]]:
+        return [self._one(t) for t in texts]
+
+
+class OpenAIEmbeddingBackend:
+    """OpenAI embeddings (KB_EMBED_MODEL, default text-embedding-3-small) at EMBED_DIM."""
+
+    name = "openai"
+    remote = True
+
+    def __init__(self, dim: int = EMBED_DIM, model: str | None = None):
+        from langchain_openai import OpenAIEmbeddings
+        from .llm_gateway import _shared_http_client
+
+        self.dim = int(dim)
+        self.model = (model or os.getenv("KB_EMBED_MODEL") or "text-embedding-3-small").strip()
+        self._client = OpenAIEmbeddings(
+            model=self.model,
+            dimensions=self.dim,
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=_shared_http_client(),
+            chunk_size=KB_EMBED_BATCH_SIZE,
+        )
+
+    def embed_batch(self, texts: Sequence[str]) -> list[list[float]]:
+        return [list(map(float, v)) for v in self._client.embed_documents(list(texts))]
+
+
+_factories: dict[str, Callable[[], EmbeddingBackend]] = {
+    "hash": HashEmbeddingBackend,
+    "openai": OpenAIEmbeddingBackend,
+}
+_backend: EmbeddingBackend | None = None
+_lock = threading.Lock()
+
+
+def register_embedding_backend(name: str, factory: Callable[[], EmbeddingBackend]) -> None:
+    """Make a backend selectable via KB_EMBED_BACKEND=<name>."""
+    global _backend
+    with _lock:
+        _factories[name.strip().lower()] = factory
+        _backend = None
+
+
+def get_embedding_backend() -> EmbeddingBackend:
+    global _backend
+    if _backend is not None:
+        return _backend
+    with _lock:
+        if _backend is None:
+            name = (os.getenv("KB_EMBED_BACKEND") or "hash").strip().lower()
+            factory = _factories.get(name)
+            if factory is None:
+                print(f"[embeddings] WARN: unknown KB_EMBED_BACKEND={name!r}; using hash")
+                factory = HashEmbeddingBackend
+            _backend = factory()
+    return _backend
+
+
+def embedding_model_id() -> str:
+    """Identifies the active backend/model/dimension, e.g. for cache keys."""
+    backend = get_embedding_backend()
+    model = getattr(backend, "model", None)
+    return f"{backend.name}:{model}:{backend.dim}" if model else f"{backend.name}:{backend.dim}"
+
+
+def embedding_backend_is_remote() -> bool:
+    # Backends registered without the attribute are assumed to be remote.
+    return bool(getattr(get_embedding_backend(), "remote", True))
+
+
+def embed_texts(texts: Sequence[str], batch_size: int | None = None) -> list[list[float]]:
+    """Embed many texts, KB_EMBED_BATCH_SIZE per backend call; output order matches input."""
+    backend = get_embedding_backend()
+    size = max(1, int(batch_size or KB_EMBED_BATCH_SIZE))
+    out: list[list[float]] = []
+    for i in range(0, len(texts), size):
+        chunk = list(texts[i:i + size])
+        vecs = backend.embed_batch(chunk)
+        if len(vecs) != len(chunk):
+            raise ValueError(f"embedding backend returned {len(vecs)} vectors for {len(chunk)} texts")
+        out.extend(vecs)
+    return out
@@ -13,13 +13,14 @@ from sqlalchemy.orm import Session
 
 from .db import SessionLocal
 from .daily_habits import (
-    build_daily_tracker_generation_context,
     build_daily_tracker_generation_context_snapshot,
 )
 from .models import User, UserPreference, WeeklyFocus, AssessmentRun
 from .coaching_delivery import send_coaching_text
+from .conversation_state import ConversationState
 from .programme_timeline import week_no_for_focus_start
 from .prompts import build_prompt, run_llm_prompt
+from .prompt_context import get_user_prompt_context
 COACH_NAME = os.getenv("COACH_NAME", "Gia")
 
 STATE_KEY = "general_support_state"
@@ -97,7 +98,11 @@ def _set_json_pref(session: Session, user_id: int, key: str, payload: Optional[d
         session.add(UserPreference(user_id=user_id, key=key, value=data))
 
 
-def _get_state(session: Session, user_id: int) -> Optional[dict]:
+def _get_state(
+    session: Session, user_id: int, conversation_state: Optional[ConversationState] = None
+) -> Optional[dict]:
+    if conversation_state is not None and conversation_state.covers(STATE_KEY):
+        return conversation_state.json(STATE_KEY)
     return _get_json_pref(session, user_id, STATE_KEY)
 
 
@@ -105,7 +110,9 @@ def _set_state(session: Session, user_id: int, state: Optional[dict]) -> None:
     _set_json_pref(session, user_id, STATE_KEY, state)
 
 
-def has_active_state(user_id: int) -> bool:
+def has_active_state(user_id: int, conversation_state: Optional[ConversationState] = None) -> bool:
+    if conversation_state is not None and conversation_state.covers(STATE_KEY):
+        return conversation_state.json(STATE_KEY) is not None
     with SessionLocal() as s:
         return _get_state(s, user_id) is not None
 
@@ -711,11 +718,9 @@ def _support_prompt(
         extras_parts.append(f"flow={source}")
     if week_no:
         extras_parts.append(f"week_no={week_no}")
-    tracker_context = (
-        tracker_snapshot.get("context")
-        if isinstance(tracker_snapshot, dict) and isinstance(tracker_snapshot.get("context"), dict)
-        else build_daily_tracker_generation_context(int(user.id))
-    )
+    prompt_context = get_user_prompt_context(int(user.id))
+    caller_snapshot = isinstance(tracker_snapshot, dict) and isinstance(tracker_snapshot.get("context"), dict)
+    tracker_context = tracker_snapshot.get("context") if caller_snapshot else prompt_context.tracker_context()
     if tracker_summary_mode:
         education_context = _education_programme_context(int(user.id), tracker_context)
         if education_context:
@@ -751,7 +756,9 @@ def _support_prompt(
         combined_score=combined_score,
         tracker_context=tracker_context,
         tracker_history=_tracker_history_lines(tracker_context),
+        tracker_history_lines=None if caller_snapshot else prompt_context.history_lines(),
         okr_context=tracker_context.get("okr_context") or {},
+        prompt_context=prompt_context,
     )
 
 
@@ -815,12 +822,12 @@ def generate_tracker_summary_message(
     )
 
 
-def handle_message(user: User, text: str) -> None:
+def handle_message(user: User, text: str, conversation_state: Optional[ConversationState] = None) -> None:
     msg = (text or "").strip()
     if not msg:
         return
     with SessionLocal() as s:
-        state = _get_state(s, user.id)
+        state = _get_state(s, user.id, conversation_state)
         if not state:
             return
         history = state.get("history") or []
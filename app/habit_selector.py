@@ -12,6 +12,7 @@ from . import habit_steps as habit_flow
 from .db import SessionLocal
 from .models import AssessmentRun, OKRKeyResult, OKRKrHabitStep, User, UserPreference, WeeklyFocus
 from .coaching_delivery import send_coaching_text
+from .conversation_state import ConversationState
 from .programme_timeline import BLOCK_WEEKS, PILLAR_SEQUENCE, week_anchor_date, week_no_for_focus_start
 from .prompts import kr_payload_list
 from .touchpoints import log_touchpoint
@@ -302,7 +303,33 @@ def _has_habit_steps_for_week(session: Session, user_id: int, week_no: int, kr_i
     return all(int(kr_id) in covered for kr_id in kr_ids)
 
 
-def _get_state(session: Session, user_id: int) -> tuple[Optional[dict], str]:
+def _state_from_snapshot(conversation_state: ConversationState) -> tuple[Optional[dict], str]:
+    raw = conversation_state.value(STATE_KEY)
+    if raw:
+        try:
+            return json.loads(raw), STATE_KEY
+        except Exception:
+            pass
+    legacy_raw = conversation_state.value(LEGACY_STATE_KEY)
+    if legacy_raw:
+        try:
+            payload = json.loads(legacy_raw)
+            if str((payload or {}).get("mode") or "") == "habit_setting":
+                return payload, LEGACY_STATE_KEY
+        except Exception:
+            pass
+    return None, STATE_KEY
+
+
+def _get_state(
+    session: Session, user_id: int, conversation_state: Optional[ConversationState] = None
+) -> tuple[Optional[dict], str]:
+    if (
+        conversation_state is not None
+        and conversation_state.covers(STATE_KEY)
+        and conversation_state.covers(LEGACY_STATE_KEY)
+    ):
+        return _state_from_snapshot(conversation_state)
     pref = (
         session.query(UserPreference)
         .filter(UserPreference.user_id == user_id, UserPreference.key == STATE_KEY)
@@ -346,7 +373,14 @@ def _set_state(session: Session, user_id: int, state: Optional[dict], key: str =
         session.add(UserPreference(user_id=user_id, key=key, value=json.dumps(state)))
 
 
-def has_active_state(user_id: int) -> bool:
+def has_active_state(user_id: int, conversation_state: Optional[ConversationState] = None) -> bool:
+    if (
+        conversation_state is not None
+        and conversation_state.covers(STATE_KEY)
+        and conversation_state.covers(LEGACY_STATE_KEY)
+    ):
+        state, _key = _state_from_snapshot(conversation_state)
+        return bool(state and str(state.get("mode") or "") == "habit_setting")
     with SessionLocal() as s:
         state, _key = _get_state(s, user_id)
         return bool(state and str(state.get("mode") or "") == "habit_setting")
@@ -512,12 +546,12 @@ def ensure_habit_steps_ready_for_day(user: User, day_key: str) -> bool:
         return False
 
 
-def handle_message(user: User, body: str) -> None:
+def handle_message(user: User, body: str, conversation_state: Optional[ConversationState] = None) -> None:
     text = (body or "").strip()
     if not text:
         return
     with SessionLocal() as s:
-        state, state_key = _get_state(s, user.id)
+        state, state_key = _get_state(s, user.id, conversation_state)
         if not state:
             return
         mode = str(state.get("mode") or "")
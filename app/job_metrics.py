@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import math
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import func
+
+from .db import SessionLocal
+from .models import BackgroundJob
+
+# Upper bounds (seconds) for the wait/run histograms; the last bucket is +Inf.
+HISTOGRAM_BUCKETS_SECONDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+_QUANTILES = (50, 95, 99)
+_FINISHED_ATTEMPT_STATUSES = ("done", "error", "retry")
+
+
+def _percentile(values: list[float], p: float) -> float | None:
+    clean = sorted(float(v) for v in values if v is not None)
+    if not clean:
+        return None
+    if len(clean) == 1:
+        return clean[0]
+    pct = max(0.0, min(100.0, float(p)))
+    rank = (pct / 100.0) * (len(clean) - 1)
+    lo = int(math.floor(rank))
+    hi = int(math.ceil(rank))
+    if lo == hi:
+        return clean[lo]
+    frac = rank - lo
+    return clean[lo] + ((clean[hi] - clean[lo]) * frac)
+
+
+def _histogram(values: list[float]) -> dict[str, int]:
+    """Cumulative bucket counts keyed by Prometheus-style `le` labels."""
+    out: dict[str, int] = {}
+    ordered = sorted(values)
+    idx = 0
+    for bound in HISTOGRAM_BUCKETS_SECONDS:
+        while idx < len(ordered) and ordered[idx] <= bound:
+            idx += 1
+        out[f"{bound:g}"] = idx
+    out["+Inf"] = len(ordered)
+    return out
+
+
+def _summarise(values: list[float]) -> dict[str, Any]:
+    summary: dict[str, Any] = {f"p{q}": None for q in _QUANTILES}
+    summary.update({"count": len(values), "sum": round(sum(values), 4), "max": None})
+    if values:
+        for q in _QUANTILES:
+            summary[f"p{q}"] = round(_percentile(values, q) or 0.0, 4)
+        summary["max"] = round(max(values), 4)
+    summary["histogram"] = _histogram(values)
+    return summary
+
+
+def _eligible_at(created_at: datetime | None, available_at: datetime | None) -> datetime | None:
+    if created_at and available_at:
+        return max(created_at, available_at)
+    return available_at or created_at
+
+
+def job_queue_metrics(*, window_minutes: int = 60, max_samples: int = 50000) -> dict[str, Any]:
+    """
+    Per-kind queue latency over a rolling window of finished attempts:
+    wait = eligible (max of created_at, available_at) -> started_at,
+    run = started_at -> finished_at, plus throughput, failure rate and current backlog.
+    """
+    window_minutes = max(1, int(window_minutes))
+    now = datetime.utcnow()
+    since = now - timedelta(minutes=window_minutes)
+    samples: dict[str, dict[str, Any]] = {}
+    backlog: dict[str, dict[str, Any]] = {}
+    with SessionLocal() as s:
+        rows = (
+            s.query(
+                BackgroundJob.kind,
+                BackgroundJob.status,
+                BackgroundJob.created_at,
+                BackgroundJob.available_at,
+                BackgroundJob.started_at,
+                BackgroundJob.finished_at,
+            )
+            .filter(
+                BackgroundJob.finished_at >= since,
+                BackgroundJob.status.in_(_FINISHED_ATTEMPT_STATUSES),
+            )
+            .order_by(BackgroundJob.finished_at.desc())
+            .limit(max(1, int(max_samples)))
+            .all()
+        )
+        backlog_rows = (
+            s.query(
+                BackgroundJob.kind,
+                BackgroundJob.status,
+                BackgroundJob.available_at <= now,
+                func.count(BackgroundJob.id),
+                func.min(func.coalesce(BackgroundJob.available_at, BackgroundJob.created_at)),
+            )
+            .filter(BackgroundJob.status.in_(["pending", "retry", "running"]))
+            .group_by(BackgroundJob.kind, BackgroundJob.status, BackgroundJob.available_at <= now)
+            .all()
+        )
+
+    for kind, status, created_at, available_at, started_at, finished_at in rows:
+        bucket = samples.setdefault(kind, {"wait": [], "run": [], "done": 0, "error": 0, "retry": 0})
+        bucket[status] += 1
+        eligible_at = _eligible_at(created_at, available_at)
+        if started_at and eligible_at:
+            bucket["wait"].append(max(0.0, (started_at - eligible_at).total_seconds()))
+        if started_at and finished_at:
+            bucket["run"].append(max(0.0, (finished_at - started_at).total_seconds()))
+
+    for kind, status, is_due, count, oldest in backlog_rows:
+        entry = backlog.setdefault(
+            kind,
+            {"ready": 0, "delayed": 0, "running": 0, "oldest_ready_wait_seconds": None},
+        )
+        if status == "running":
+            entry["running"] += int(count or 0)
+            continue
+        if is_due is False:
+            entry["delayed"] += int(count or 0)
+            continue
+        entry["ready"] += int(count or 0)
+        if oldest is not None:
+            waited = max(0.0, round((now - oldest).total_seconds(), 3))
+            current = entry["oldest_ready_wait_seconds"]
+            entry["oldest_ready_wait_seconds"] = waited if current is None else max(current, waited)
+
+    kinds: dict[str, Any] = {}
+    for kind, bucket in sorted(samples.items()):
+        attempts = bucket["done"] + bucket["error"] + bucket["retry"]
+        failures = bucket["error"] + bucket["retry"]
+        kinds[kind] = {
+            "completed": bucket["done"],
+            "failed": bucket["error"],
+            "retried": bucket["retry"],
+            "throughput_per_minute": round(bucket["done"] / window_minutes, 4),
+            "failure_rate": round(failures / attempts, 4) if attempts else None,
+            "wait_seconds": _summarise(bucket["wait"]),
+            "run_seconds": _summarise(bucket["run"]),
+        }
+    return {
+        "generated_at": now.replace(microsecond=0).isoformat(),
+        "window_minutes": window_minutes,
+        "sampled_attempts": len(rows),
+        "kinds": kinds,
+        "backlog": dict(sorted(backlog.items())),
+    }
+
+
+def _label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_job_queue_metrics_prometheus(metrics: dict[str, Any]) -> str:
+    """
+    Prometheus text exposition of job_queue_metrics(). Everything is a gauge over the
+    rolling window, so rates come straight from the sample rather than from rate().
+    """
+    lines: list[str] = []
+
+    def _family(name: str, help_text: str) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+
+    window = int(metrics.get("window_minutes") or 0)
+    kinds = metrics.get("kinds") or {}
+    backlog = metrics.get("backlog") or {}
+
+    for series, help_text in (
+        ("wait_seconds", f"Enqueue-to-claim wait over the last {window}m."),
+        ("run_seconds", f"Claim-to-finish run time over the last {window}m."),
+    ):
+        name = f"background_job_{series}"
+        _family(name, help_text)
+        for kind, data in kinds.items():
+            summary = data.get(series) or {}
+            for q in _QUANTILES:
+                value = summary.get(f"p{q}")
+                if value is not None:
+                    lines.append(f'{name}{{kind="{_label(kind)}",quantile="{q / 100:g}"}} {value}')
+        bucket_name = f"{name}_bucket"
+        _family(bucket_name, f"Cumulative {series.replace('_', ' ')} histogram over the last {window}m.")
+        for kind, data in kinds.items():
+            for le, count in ((data.get(series) or {}).get("histogram") or {}).items():
+                lines.append(f'{bucket_name}{{kind="{_label(kind)}",le="{le}"}} {count}')
+
+    _family("background_job_attempts", f"Finished job attempts by outcome over the last {window}m.")
+    for kind, data in kinds.items():
+        for outcome in ("completed", "failed", "retried"):
+            lines.append(f'background_job_attempts{{kind="{_label(kind)}",outcome="{outcome}"}} {data.get(outcome, 0)}')
+
+    _family("background_job_throughput_per_minute", f"Completed jobs per minute over the last {window}m.")
+    for kind, data in kinds.items():
+        lines.append(f'background_job_throughput_per_minute{{kind="{_label(kind)}"}} {data.get("throughput_per_minute", 0)}')
+
+    _family("background_job_failure_ratio", f"Failed attempts / finished attempts over the last {window}m.")
+    for kind, data in kinds.items():
+        if data.get("failure_rate") is not None:
+            lines.append(f'background_job_failure_ratio{{kind="{_label(kind)}"}} {data["failure_rate"]}')
+
+    _family("background_job_backlog", "Current jobs by state (ready, delayed, running).")
+    for kind, data in backlog.items():
+        for state in ("ready", "delayed", "running"):
+            lines.append(f'background_job_backlog{{kind="{_label(kind)}",state="{state}"}} {data.get(state, 0)}')
+
+    _family("background_job_oldest_ready_wait_seconds", "Age of the oldest claimable job.")
+    for kind, data in backlog.items():
+        if data.get("oldest_ready_wait_seconds") is not None:
+            lines.append(
+                f'background_job_oldest_ready_wait_seconds{{kind="{_label(kind)}"}} {data["oldest_ready_wait_seconds"]}'
+            )
+    return "\n".join(lines) + "\n"
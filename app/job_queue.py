@@ -1,26 +1,75 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import os
+import random
+import re
+import select
 import socket
-from datetime import datetime, timedelta
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from typing import Any, Iterable
 
-from sqlalchemy import and_, or_, text as sa_text
+from sqlalchemy import (
+    and_,
+    bindparam,
+    case,
+    delete,
+    func,
+    insert,
+    or_,
+    select as sa_select,
+    text as sa_text,
+    update,
+)
 from sqlalchemy.exc import IntegrityError, ProgrammingError, OperationalError
 
-from .db import SessionLocal, engine
-from .models import BackgroundJob, PromptSettings
+from .db import SessionLocal, _is_postgres, engine
+from .models import BackgroundJob, BackgroundJobArchive, PromptSettings
 
 
 def ensure_job_table() -> None:
     try:
         BackgroundJob.__table__.create(bind=engine, checkfirst=True)
+        BackgroundJobArchive.__table__.create(bind=engine, checkfirst=True)
     except (IntegrityError, ProgrammingError, OperationalError):
         raise
     try:
         with engine.connect() as conn:
             conn.execute(sa_text("ALTER TABLE background_jobs ADD COLUMN IF NOT EXISTS available_at timestamp;"))
             conn.execute(sa_text("CREATE INDEX IF NOT EXISTS ix_background_jobs_status_available_at ON background_jobs(status, available_at);"))
+            conn.execute(sa_text("ALTER TABLE background_jobs ADD COLUMN IF NOT EXISTS priority integer NOT NULL DEFAULT 0;"))
+            conn.execute(sa_text("ALTER TABLE background_jobs ADD COLUMN IF NOT EXISTS claim_rank double precision;"))
+            conn.execute(
+                sa_text(
+                    "UPDATE background_jobs "
+                    "SET claim_rank = EXTRACT(EPOCH FROM COALESCE(available_at, created_at)) - priority * :aging "
+                    "WHERE claim_rank IS NULL AND status IN ('pending', 'retry', 'running');"
+                ),
+                {"aging": _job_aging_seconds()},
+            )
+            conn.execute(sa_text("DROP INDEX IF EXISTS ix_background_jobs_status_priority_created;"))
+            conn.execute(
+                sa_text(
+                    "CREATE INDEX IF NOT EXISTS ix_background_jobs_claim_rank "
+                    "ON background_jobs(claim_rank, id) "
+                    "WHERE status IN ('pending', 'retry', 'running');"
+                )
+            )
+            conn.execute(sa_text("ALTER TABLE background_jobs ADD COLUMN IF NOT EXISTS started_at timestamp;"))
+            conn.execute(sa_text("ALTER TABLE background_jobs ADD COLUMN IF NOT EXISTS finished_at timestamp;"))
+            conn.execute(sa_text("CREATE INDEX IF NOT EXISTS ix_background_jobs_finished_at ON background_jobs(finished_at);"))
+            conn.execute(sa_text("ALTER TABLE background_jobs_archive ADD COLUMN IF NOT EXISTS started_at timestamp;"))
+            conn.execute(sa_text("ALTER TABLE background_jobs ADD COLUMN IF NOT EXISTS dedup_key varchar(64);"))
+            conn.execute(
+                sa_text(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS ux_background_jobs_active_dedup_key "
+                    "ON background_jobs(dedup_key) "
+                    "WHERE dedup_key IS NOT NULL AND status IN ('pending', 'retry', 'running');"
+                )
+            )
             conn.commit()
     except Exception:
         pass
@@ -81,6 +130,193 @@ def queue_requeue_delay_seconds(requeue_count: int) -> int:
     delay = base + (max(0, int(requeue_count)) * step)
     return min(max_delay, max(base, delay))
 
+# Priority lanes: higher claims first. Kinds not listed run in the default lane.
+JOB_LANE_PRIORITIES = {
+    "interactive": 100,
+    "default": 50,
+    "bulk": 10,
+}
+
+JOB_KIND_LANES = {
+    "assessment_start": "interactive",
+    "assessment_continue": "interactive",
+    "llm_prompt": "interactive",
+    "education_quiz_state_refresh": "interactive",
+    "assessment_narratives_seed": "default",
+    "assessment_narratives_core_seed": "default",
+    "assessment_narratives_habit_seed": "default",
+    "assessment_completion_summary_media": "default",
+    "pillar_okr_sync": "default",
+    "coach_home_tracker_refresh": "default",
+    "wearable_sync": "default",
+    "education_explore_catalog_warmup": "bulk",
+    "education_avatar_generate_all": "bulk",
+    "education_avatar_generate_programme": "bulk",
+    "education_marketing_video": "bulk",
+    "education_marketing_video_generate_all": "bulk",
+}
+
+
+def job_lane_for_kind(kind: str) -> str:
+    return JOB_KIND_LANES.get(str(kind or ""), "default")
+
+
+def job_priority_for_kind(kind: str) -> int:
+    return int(JOB_LANE_PRIORITIES.get(job_lane_for_kind(kind), JOB_LANE_PRIORITIES["default"]))
+
+
+def kinds_for_lanes(lanes: Iterable[str]) -> list[str]:
+    """
+    Kinds mapped to the given lanes, for use as claim_job(kinds=...).
+    Unmapped kinds only run on workers without a kind filter.
+    """
+    wanted = {str(lane).strip().lower() for lane in lanes if str(lane).strip()}
+    unknown = wanted - set(JOB_LANE_PRIORITIES)
+    if unknown:
+        raise ValueError(f"unknown job lane(s): {', '.join(sorted(unknown))}")
+    return sorted(kind for kind, lane in JOB_KIND_LANES.items() if lane in wanted)
+
+
+def _job_aging_seconds() -> int:
+    return max(1, _env_int("JOB_PRIORITY_AGING_SECONDS", 30))
+
+
+def _epoch_seconds(when: datetime) -> float:
+    return (when - datetime(1970, 1, 1)).total_seconds()
+
+
+def _claim_rank(eligible_at: datetime | None, priority: int) -> float:
+    """
+    Stored sort key for claims: the epoch second a job became claimable, pulled earlier by
+    JOB_PRIORITY_AGING_SECONDS per priority point. Ordering by it ascending is the same as
+    ordering by priority + waited/aging descending, but it is a plain column the partial
+    ix_background_jobs_claim_rank index can serve. With the default lanes a bulk job needs
+    ~45 minutes of eligibility before it outranks a fresh interactive one.
+    """
+    return _epoch_seconds(eligible_at or datetime.utcnow()) - int(priority or 0) * _job_aging_seconds()
+
+
+def _claim_order() -> list[Any]:
+    return [BackgroundJob.claim_rank.asc(), BackgroundJob.id.asc()]
+
+
+@dataclass(frozen=True)
+class JobRetryPolicy:
+    max_attempts: int
+    base_delay_seconds: float = 5.0
+    multiplier: float = 2.0
+    max_delay_seconds: float = 300.0
+    jitter: float = 0.5  # fraction of the computed delay that is randomised away
+
+
+# Per-kind overrides; max_attempts=None inherits WORKER_MAX_ATTEMPTS.
+# JOB_RETRY_POLICIES_JSON='{"llm_prompt": {"max_attempts": 5, "max_delay_seconds": 120}}'
+# overrides individual fields at runtime.
+JOB_RETRY_POLICIES: dict[str, dict[str, Any]] = {
+    "assessment_start": {"base_delay_seconds": 1.0, "max_delay_seconds": 15.0},
+    "assessment_continue": {"base_delay_seconds": 1.0, "max_delay_seconds": 15.0},
+    "llm_prompt": {"max_attempts": 4, "base_delay_seconds": 2.0, "max_delay_seconds": 60.0},
+    "assessment_completion_summary_media": {"max_attempts": 4, "base_delay_seconds": 15.0},
+    "wearable_sync": {"max_attempts": 4, "base_delay_seconds": 30.0, "max_delay_seconds": 900.0},
+    "education_avatar_generate_all": {"max_attempts": 5, "base_delay_seconds": 60.0, "max_delay_seconds": 1800.0},
+    "education_avatar_generate_programme": {"max_attempts": 5, "base_delay_seconds": 60.0, "max_delay_seconds": 1800.0},
+    "education_marketing_video": {"max_attempts": 5, "base_delay_seconds": 30.0, "max_delay_seconds": 900.0},
+    "education_marketing_video_generate_all": {"max_attempts": 5, "base_delay_seconds": 30.0, "max_delay_seconds": 900.0},
+}
+
+_RETRY_AFTER_MAX_SECONDS = 3600
+_RETRY_AFTER_TEXT_RE = re.compile(r"retry after\s+(\d+)\s+seconds?", re.IGNORECASE)
+
+
+def _retry_policy_env_overrides() -> dict[str, dict[str, Any]]:
+    raw = (os.getenv("JOB_RETRY_POLICIES_JSON") or "").strip()
+    if not raw:
+        return {}
+    try:
+        data = json.loads(raw)
+    except Exception:
+        print("[job_queue] WARN: ignoring invalid JOB_RETRY_POLICIES_JSON")
+        return {}
+    return {str(k): v for k, v in data.items() if isinstance(v, dict)} if isinstance(data, dict) else {}
+
+
+def job_retry_policy(kind: str) -> JobRetryPolicy:
+    policy = JobRetryPolicy(
+        max_attempts=max(1, _env_int("WORKER_MAX_ATTEMPTS", 3)),
+        base_delay_seconds=float(max(1, _env_int("JOB_RETRY_BASE_DELAY_SECONDS", 5))),
+        max_delay_seconds=float(max(1, _env_int("JOB_RETRY_MAX_DELAY_SECONDS", 300))),
+    )
+    fields = set(JobRetryPolicy.__dataclass_fields__)
+    for overrides in (JOB_RETRY_POLICIES.get(kind), _retry_policy_env_overrides().get(kind)):
+        if overrides:
+            policy = replace(policy, **{k: v for k, v in overrides.items() if k in fields and v is not None})
+    return policy
+
+
+def retry_delay_seconds(kind: str, attempts: int, *, retry_after_seconds: float | None = None) -> float:
+    """
+    Exponential backoff with jitter for the given (1-based) attempt count. A provider
+    Retry-After hint wins whenever it asks for a longer wait.
+    """
+    policy = job_retry_policy(kind)
+    exponent = max(0, int(attempts) - 1)
+    delay = min(policy.max_delay_seconds, policy.base_delay_seconds * (policy.multiplier ** exponent))
+    jitter = min(1.0, max(0.0, float(policy.jitter)))
+    delay = delay * (1.0 - jitter * random.random())
+    if retry_after_seconds is not None and retry_after_seconds > delay:
+        delay = min(float(retry_after_seconds), float(_RETRY_AFTER_MAX_SECONDS))
+    return max(0.0, delay)
+
+
+def _parse_retry_after(value: Any) -> float | None:
+    raw = str(value or "").strip()
+    if not raw:
+        return None
+    try:
+        seconds = float(raw)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(raw)
+        except Exception:
+            return None
+        if when is None:
+            return None
+        if when.tzinfo is not None:
+            when = when.astimezone(timezone.utc).replace(tzinfo=None)
+        seconds = (when - datetime.utcnow()).total_seconds()
+    return seconds if seconds > 0 else None
+
+
+def retry_after_hint(exc: BaseException | None) -> float | None:
+    """
+    Best-effort Retry-After extraction from an exception chain: an explicit
+    retry_after_seconds attribute, an HTTP response's Retry-After header, or a
+    "Retry after N seconds" message as raised by the avatar client.
+    """
+    seen: set[int] = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        explicit = getattr(exc, "retry_after_seconds", None)
+        if explicit is not None:
+            parsed = _parse_retry_after(explicit)
+            if parsed:
+                return parsed
+        response = getattr(exc, "response", None)
+        headers = getattr(response, "headers", None)
+        if headers is not None:
+            try:
+                parsed = _parse_retry_after(headers.get("retry-after") or headers.get("Retry-After"))
+            except Exception:
+                parsed = None
+            if parsed:
+                return parsed
+        match = _RETRY_AFTER_TEXT_RE.search(str(exc))
+        if match:
+            return float(match.group(1)) or None
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
 def _get_worker_overrides() -> tuple[bool | None, bool | None]:
     ensure_prompt_settings_schema()
     try:
@@ -96,6 +332,28 @@ def _get_worker_overrides() -> tuple[bool | None, bool | None]:
         return None, None
 
 
+JOB_NOTIFY_CHANNEL = (os.getenv("JOB_NOTIFY_CHANNEL") or "background_jobs").strip() or "background_jobs"
+
+
+def job_notify_enabled() -> bool:
+    """
+    LISTEN/NOTIFY wakeups are Postgres-only; SQLite/dev keeps plain polling.
+    """
+    if _env_flag("JOB_NOTIFY_DISABLED"):
+        return False
+    return _is_postgres()
+
+
+def _notify_job_enqueued(s, kind: str) -> None:
+    # Sent inside the enqueue transaction so listeners only wake once the row is committed.
+    if not job_notify_enabled():
+        return
+    s.execute(
+        sa_text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": JOB_NOTIFY_CHANNEL, "payload": str(kind or "")[:64]},
+    )
+
+
 def should_use_worker() -> bool:
     worker_override, _ = _get_worker_overrides()
     if worker_override is not None:
@@ -119,7 +377,11 @@ def enqueue_job(
     *,
     user_id: int | None = None,
     available_at: datetime | None = None,
+    priority: int | None = None,
+    dedup_key: str | None = None,
 ) -> int:
+    if priority is None:
+        priority = job_priority_for_kind(kind)
     with SessionLocal() as s:
         try:
             job = BackgroundJob(
@@ -128,11 +390,16 @@ def enqueue_job(
                 status="pending",
                 user_id=user_id,
                 available_at=available_at,
+                priority=int(priority),
+                claim_rank=_claim_rank(available_at, priority),
+                dedup_key=dedup_key,
             )
             s.add(job)
+            _notify_job_enqueued(s, kind)
+            s.flush()
+            job_id = int(job.id)
             s.commit()
-            s.refresh(job)
-            return int(job.id)
+            return job_id
         except (ProgrammingError, OperationalError) as e:
             # Handle missing table (e.g., DB reset) and retry once.
             if "does not exist" in str(e).lower():
@@ -147,47 +414,48 @@ def enqueue_job(
                     status="pending",
                     user_id=user_id,
                     available_at=available_at,
+                    priority=int(priority),
+                    claim_rank=_claim_rank(available_at, priority),
+                    dedup_key=dedup_key,
                 )
                 s.add(job)
+                _notify_job_enqueued(s, kind)
+                s.flush()
+                job_id = int(job.id)
                 s.commit()
-                s.refresh(job)
-                return int(job.id)
+                return job_id
             raise
 
 
-def _payload_matches(job_payload: Any, payload_match: dict[str, Any] | None) -> bool:
-    if not payload_match:
-        return True
-    if not isinstance(job_payload, dict):
-        return False
-    for key, expected in payload_match.items():
-        if job_payload.get(key) != expected:
-            return False
-    return True
+_ACTIVE_JOB_STATUSES = ("pending", "retry", "running")
 
 
-def find_active_job_id(
-    kind: str,
-    *,
-    payload_match: dict[str, Any] | None = None,
-    exclude_job_id: int | None = None,
-    running_stale_minutes: int = 10,
-) -> int | None:
-    now = datetime.utcnow()
-    running_stale_at = now - timedelta(minutes=max(1, int(running_stale_minutes)))
+def job_dedup_key(kind: str, payload_match: dict[str, Any] | None = None) -> str:
+    """
+    Stable key for enqueue_job_once: sha256 of the kind plus the canonical JSON of the
+    payload_match fields. At most one active job may hold a given key (partial unique
+    index ux_background_jobs_active_dedup_key).
+    """
+    canonical = json.dumps(
+        {"kind": str(kind or ""), "match": payload_match or {}},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _active_job_for_dedup_key(dedup_key: str):
     with SessionLocal() as s:
         try:
-            q = (
-                s.query(BackgroundJob)
+            return (
+                s.query(BackgroundJob.id, BackgroundJob.status, BackgroundJob.locked_at)
                 .filter(
-                    BackgroundJob.kind == kind,
-                    BackgroundJob.status.in_(["pending", "retry", "running"]),
+                    BackgroundJob.dedup_key == dedup_key,
+                    BackgroundJob.status.in_(_ACTIVE_JOB_STATUSES),
                 )
-                .order_by(BackgroundJob.created_at.asc(), BackgroundJob.id.asc())
+                .first()
             )
-            if exclude_job_id is not None:
-                q = q.filter(BackgroundJob.id != int(exclude_job_id))
-            rows = q.all()
         except (ProgrammingError, OperationalError) as e:
             if "does not exist" in str(e).lower():
                 try:
@@ -197,12 +465,37 @@ def find_active_job_id(
                 ensure_job_table()
                 return None
             raise
-        for job in rows:
-            if job.status == "running" and job.locked_at and job.locked_at < running_stale_at:
-                continue
-            if _payload_matches(getattr(job, "payload", None), payload_match):
-                return int(job.id)
-    return None
+
+
+def _dedup_holder_superseded(row, *, exclude_job_id: int | None, running_stale_minutes: int) -> bool:
+    # The caller's own job (a worker re-enqueueing itself) and stale running jobs
+    # never block a new enqueue.
+    if exclude_job_id is not None and int(row.id) == int(exclude_job_id):
+        return True
+    running_stale_at = datetime.utcnow() - timedelta(minutes=max(1, int(running_stale_minutes)))
+    return row.status == "running" and row.locked_at is not None and row.locked_at < running_stale_at
+
+
+def _release_dedup_key(job_id: int) -> None:
+    table = BackgroundJob.__table__
+    with SessionLocal() as s:
+        s.execute(update(table).where(table.c.id == int(job_id)).values(dedup_key=None))
+        s.commit()
+
+
+def find_active_job_id(
+    kind: str,
+    *,
+    payload_match: dict[str, Any] | None = None,
+    exclude_job_id: int | None = None,
+    running_stale_minutes: int = 10,
+) -> int | None:
+    row = _active_job_for_dedup_key(job_dedup_key(kind, payload_match))
+    if row is None:
+        return None
+    if _dedup_holder_superseded(row, exclude_job_id=exclude_job_id, running_stale_minutes=running_stale_minutes):
+        return None
+    return int(row.id)
 
 
 def enqueue_job_once(
@@ -211,47 +504,134 @@ def enqueue_job_once(
     *,
     user_id: int | None = None,
     available_at: datetime | None = None,
+    priority: int | None = None,
     payload_match: dict[str, Any] | None = None,
     exclude_job_id: int | None = None,
     running_stale_minutes: int = 10,
 ) -> tuple[int, bool]:
-    existing_id = find_active_job_id(
-        kind,
-        payload_match=payload_match,
-        exclude_job_id=exclude_job_id,
-        running_stale_minutes=running_stale_minutes,
-    )
-    if existing_id is not None:
-        return existing_id, False
-    return enqueue_job(kind, payload, user_id=user_id, available_at=available_at), True
+    """
+    Enqueue unless an active job with the same kind + payload_match already exists.
+    Lookup and insert both go through the dedup_key unique index, so concurrent
+    callers across processes converge on a single job.
+    """
+    dedup_key = job_dedup_key(kind, payload_match)
+    for _attempt in range(3):
+        row = _active_job_for_dedup_key(dedup_key)
+        if row is not None:
+            if not _dedup_holder_superseded(
+                row,
+                exclude_job_id=exclude_job_id,
+                running_stale_minutes=running_stale_minutes,
+            ):
+                return int(row.id), False
+            _release_dedup_key(int(row.id))
+        try:
+            job_id = enqueue_job(
+                kind,
+                payload,
+                user_id=user_id,
+                available_at=available_at,
+                priority=priority,
+                dedup_key=dedup_key,
+            )
+            return job_id, True
+        except IntegrityError:
+            # Another process inserted the same key between lookup and insert.
+            continue
+    row = _active_job_for_dedup_key(dedup_key)
+    if row is not None:
+        return int(row.id), False
+    raise RuntimeError(f"enqueue_job_once could not settle dedup key for kind={kind}")
 
 
-def claim_job(
+def _claimable_filters(
+    *,
+    now: datetime,
+    stale: datetime,
+    kinds: Iterable[str] | None,
+    exclude_kinds: Iterable[str] | None,
+) -> list[Any]:
+    filters = [
+        # Redundant with the or_ below, but lets Postgres match the partial claim index.
+        BackgroundJob.status.in_(_ACTIVE_JOB_STATUSES),
+        or_(
+            BackgroundJob.status == "pending",
+            BackgroundJob.status == "retry",
+            and_(BackgroundJob.status == "running", BackgroundJob.locked_at.isnot(None), BackgroundJob.locked_at < stale),
+        ),
+        or_(BackgroundJob.available_at.is_(None), BackgroundJob.available_at <= now),
+    ]
+    if kinds:
+        filters.append(BackgroundJob.kind.in_(list(kinds)))
+    if exclude_kinds:
+        filters.append(BackgroundJob.kind.notin_(list(exclude_kinds)))
+    return filters
+
+
+def claim_jobs(
+    limit: int,
     *,
     worker_id: str | None = None,
     kinds: Iterable[str] | None = None,
+    exclude_kinds: Iterable[str] | None = None,
     lock_timeout_minutes: int = 30,
-) -> BackgroundJob | None:
+) -> list[BackgroundJob]:
+    """
+    Claim up to `limit` jobs in one round-trip. On Postgres this is a single
+    UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) RETURNING, so concurrent
+    workers never block on or double-claim the same rows. Returned jobs are detached
+    and ordered highest priority first.
+    """
+    limit = max(0, int(limit))
+    if limit <= 0:
+        return []
     now = datetime.utcnow()
     stale = now - timedelta(minutes=max(1, lock_timeout_minutes))
     worker_id = worker_id or socket.gethostname()
+    filters = _claimable_filters(now=now, stale=stale, kinds=kinds, exclude_kinds=exclude_kinds)
     with SessionLocal() as s:
         try:
-            q = s.query(BackgroundJob).filter(
-                or_(
-                    BackgroundJob.status == "pending",
-                    BackgroundJob.status == "retry",
-                    and_(BackgroundJob.status == "running", BackgroundJob.locked_at.isnot(None), BackgroundJob.locked_at < stale),
+            if _is_postgres():
+                table = BackgroundJob.__table__
+                candidates = (
+                    sa_select(BackgroundJob.id)
+                    .where(*filters)
+                    .order_by(*_claim_order())
+                    .limit(limit)
+                    .with_for_update(skip_locked=True)
                 )
-            )
-            q = q.filter(or_(BackgroundJob.available_at.is_(None), BackgroundJob.available_at <= now))
-            if kinds:
-                q = q.filter(BackgroundJob.kind.in_(list(kinds)))
-            job = (
-                q.order_by(BackgroundJob.created_at.asc(), BackgroundJob.id.asc())
-                .with_for_update(skip_locked=True)
-                .first()
-            )
+                rows = s.execute(
+                    update(table)
+                    .where(table.c.id.in_(candidates))
+                    .values(
+                        status="running",
+                        locked_at=now,
+                        locked_by=worker_id,
+                        started_at=now,
+                        attempts=func.coalesce(table.c.attempts, 0) + 1,
+                    )
+                    .returning(*table.c)
+                ).mappings().all()
+                s.commit()
+                jobs = [BackgroundJob(**dict(row)) for row in rows]
+            else:
+                jobs = (
+                    s.query(BackgroundJob)
+                    .filter(*filters)
+                    .order_by(*_claim_order())
+                    .limit(limit)
+                    .all()
+                )
+                for job in jobs:
+                    job.status = "running"
+                    job.locked_at = now
+                    job.locked_by = worker_id
+                    job.started_at = now
+                    job.attempts = int(job.attempts or 0) + 1
+                s.commit()
+                for job in jobs:
+                    s.refresh(job)
+                    s.expunge(job)
         except (ProgrammingError, OperationalError) as e:
             if "does not exist" in str(e).lower():
                 try:
@@ -259,33 +639,105 @@ def claim_job(
                 except Exception:
                     pass
                 ensure_job_table()
-                return None
+                return []
             raise
-        if not job:
-            return None
-        job.status = "running"
-        job.locked_at = now
-        job.locked_by = worker_id
-        job.attempts = int(job.attempts or 0) + 1
-        s.add(job)
+    jobs.sort(key=lambda job: (job.claim_rank if job.claim_rank is not None else float("inf"), int(job.id)))
+    return jobs
+
+
+def claim_job(
+    *,
+    worker_id: str | None = None,
+    kinds: Iterable[str] | None = None,
+    exclude_kinds: Iterable[str] | None = None,
+    lock_timeout_minutes: int = 30,
+) -> BackgroundJob | None:
+    jobs = claim_jobs(
+        1,
+        worker_id=worker_id,
+        kinds=kinds,
+        exclude_kinds=exclude_kinds,
+        lock_timeout_minutes=lock_timeout_minutes,
+    )
+    return jobs[0] if jobs else None
+
+
+def release_jobs(job_ids: Iterable[int]) -> int:
+    """
+    Hand claimed-but-unstarted jobs back to the queue, undoing the claim's attempt bump.
+    Used when a batch claim returns more jobs of a capped kind than a worker can run.
+    Sends the same wakeup as enqueue_job so idle workers pick the jobs up straight away.
+    """
+    ids = [int(job_id) for job_id in job_ids]
+    if not ids:
+        return 0
+    table = BackgroundJob.__table__
+    with SessionLocal() as s:
+        rows = s.execute(
+            update(table)
+            .where(table.c.id.in_(ids), table.c.status == "running")
+            .values(
+                status=case((table.c.attempts > 1, "retry"), else_="pending"),
+                attempts=case((table.c.attempts > 0, table.c.attempts - 1), else_=0),
+                locked_at=None,
+                locked_by=None,
+                started_at=None,
+            )
+            .returning(table.c.kind)
+        ).all()
+        for kind in sorted({str(row.kind or "") for row in rows}):
+            _notify_job_enqueued(s, kind)
         s.commit()
-        s.refresh(job)
-        s.expunge(job)
-        return job
+        return len(rows)
 
 
-def mark_done(job_id: int, result: dict[str, Any] | None = None) -> None:
+def complete_jobs(outcomes: Iterable[dict[str, Any]]) -> int:
+    """
+    Record many job outcomes with one executemany UPDATE.
+
+    Each outcome is {"job_id": int, "result": dict | None} for success, or
+    {"job_id": int, "error": str, "retry": bool, "available_at": datetime | None} for
+    failure, where available_at delays the next claim of a retried job. A retried job
+    ages from when it becomes claimable again, not from its original enqueue.
+    """
+    now = datetime.utcnow()
+    params = []
+    for outcome in outcomes:
+        failed = outcome.get("error") is not None
+        if failed:
+            status = "retry" if outcome.get("retry") else "error"
+        else:
+            status = "done"
+        params.append(
+            {
+                "b_job_id": int(outcome["job_id"]),
+                "b_status": status,
+                "b_result": None if failed else outcome.get("result"),
+                "b_error": str(outcome.get("error")) if failed else None,
+                "b_available_at": outcome.get("available_at") if failed else None,
+                "b_eligible_epoch": _epoch_seconds((outcome.get("available_at") if failed else None) or now),
+            }
+        )
+    if not params:
+        return 0
+    table = BackgroundJob.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_job_id"))
+        .values(
+            status=bindparam("b_status"),
+            result=bindparam("b_result", type_=table.c.result.type),
+            error=bindparam("b_error"),
+            available_at=func.coalesce(bindparam("b_available_at", type_=table.c.available_at.type), table.c.available_at),
+            claim_rank=bindparam("b_eligible_epoch") - func.coalesce(table.c.priority, 0) * _job_aging_seconds(),
+            finished_at=now,
+            locked_at=None,
+            locked_by=None,
+        )
+    )
     with SessionLocal() as s:
         try:
-            job = s.get(BackgroundJob, job_id)
-            if not job:
-                return
-            job.status = "done"
-            job.result = result
-            job.error = None
-            job.locked_at = None
-            job.locked_by = None
-            s.add(job)
+            s.execute(stmt, params)
             s.commit()
         except (ProgrammingError, OperationalError) as e:
             if "does not exist" in str(e).lower():
@@ -294,26 +746,288 @@ def mark_done(job_id: int, result: dict[str, Any] | None = None) -> None:
                 except Exception:
                     pass
                 ensure_job_table()
-                return
+                return 0
             raise
+    return len(params)
 
 
-def mark_error(job_id: int, error: str, *, retry: bool) -> None:
-    with SessionLocal() as s:
+class JobNotificationListener:
+    """
+    Blocks until an enqueue signal arrives, wake() is called, or the timeout elapses.
+    With listen=True it holds one dedicated DB connection in autocommit mode on the job
+    channel; any failure drops it and the caller simply falls back to timed polling until
+    the next successful reconnect. With listen=False it is an interruptible sleep.
+    """
+
+    def __init__(self, channel: str | None = None, *, listen: bool = True) -> None:
+        self.channel = (channel or JOB_NOTIFY_CHANNEL).strip()
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]{0,62}", self.channel):
+            raise ValueError(f"invalid job notify channel: {self.channel!r}")
+        self.listen = bool(listen)
+        self._raw = None
+        self._conn = None
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+    def _ensure_connection(self):
+        if self._conn is not None:
+            return self._conn
+        raw = engine.raw_connection()
+        conn = getattr(raw, "dbapi_connection", None) or getattr(raw, "connection", None)
+        if conn is None or not hasattr(conn, "poll") or not hasattr(conn, "notifies"):
+            raw.close()
+            raise RuntimeError("DB driver does not support LISTEN/NOTIFY")
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN "{self.channel}"')
+        self._raw = raw
+        self._conn = conn
+        return conn
+
+    def _drain(self, conn) -> bool:
+        conn.poll()
+        got = bool(conn.notifies)
+        del conn.notifies[:]
+        return got
+
+    def _drain_wake(self) -> bool:
+        got = False
         try:
-            job = s.get(BackgroundJob, job_id)
-            if not job:
-                return
-            job.error = error
-            job.status = "retry" if retry else "error"
-            s.add(job)
+            while self._wake_r.recv(64):
+                got = True
+        except (BlockingIOError, InterruptedError):
+            pass
+        return got
+
+    def wake(self) -> None:
+        """Interrupt a pending wait() from another thread or a signal handler."""
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            pass
+
+    def wait(self, timeout: float) -> bool:
+        """Return True when woken by a notification or wake(), False on timeout or error."""
+        timeout = max(0.0, float(timeout))
+        conn = None
+        if self.listen:
+            try:
+                conn = self._ensure_connection()
+                if self._drain(conn):
+                    return True
+            except Exception as exc:
+                print(f"[job_queue] WARN: job notification listener unavailable: {exc}")
+                self.close()
+                conn = None
+        watch = [self._wake_r] if conn is None else [self._wake_r, conn]
+        try:
+            ready, _, _ = select.select(watch, [], [], timeout)
+        except Exception as exc:
+            print(f"[job_queue] WARN: job notification wait failed: {exc}")
+            self.close()
+            return False
+        woke = False
+        if self._wake_r in ready:
+            woke = self._drain_wake() or woke
+        if conn is not None and conn in ready:
+            try:
+                woke = self._drain(conn) or woke
+            except Exception as exc:
+                print(f"[job_queue] WARN: job notification listener dropped: {exc}")
+                self.close()
+        return woke
+
+    def close(self) -> None:
+        raw, self._raw, self._conn = self._raw, None, None
+        if raw is None:
+            return
+        try:
+            raw.invalidate()
+        except Exception:
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+
+def seconds_until_next_available_job(*, kinds: Iterable[str] | None = None) -> float | None:
+    """
+    Seconds until the earliest delayed pending/retry job becomes claimable.
+    Lets a listening worker wake for scheduled jobs without a short poll interval.
+    """
+    now = datetime.utcnow()
+    try:
+        with SessionLocal() as s:
+            q = s.query(func.min(BackgroundJob.available_at)).filter(
+                BackgroundJob.status.in_(["pending", "retry"]),
+                BackgroundJob.available_at > now,
+            )
+            if kinds:
+                q = q.filter(BackgroundJob.kind.in_(list(kinds)))
+            next_at = q.scalar()
+    except Exception:
+        return None
+    if not next_at:
+        return None
+    return max(0.0, (next_at - now).total_seconds())
+
+
+def mark_done(job_id: int, result: dict[str, Any] | None = None) -> None:
+    complete_jobs([{"job_id": job_id, "result": result}])
+
+
+def mark_error(job_id: int, error: str, *, retry: bool, available_at: datetime | None = None) -> None:
+    complete_jobs([{"job_id": job_id, "error": error, "retry": retry, "available_at": available_at}])
+
+
+_FINISHED_JOB_STATUSES = ("done", "error")
+_ARCHIVE_ERROR_MAX_CHARS = 2000
+
+
+def compact_finished_jobs(
+    *,
+    older_than_hours: int = 168,
+    batch_size: int = 500,
+    max_batches: int = 20,
+    dry_run: bool = False,
+) -> dict[str, Any]:
+    """
+    Move done/error jobs last touched more than `older_than_hours` ago into
+    background_jobs_archive, dropping payload/result. Works in bounded batches, each in
+    its own transaction, so it can run alongside live workers.
+    """
+    older_than_hours = max(1, int(older_than_hours))
+    batch_size = max(1, int(batch_size))
+    max_batches = max(1, int(max_batches))
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    eligible = and_(
+        BackgroundJob.status.in_(_FINISHED_JOB_STATUSES),
+        BackgroundJob.updated_at < cutoff,
+    )
+    if dry_run:
+        with SessionLocal() as s:
+            count = s.query(func.count(BackgroundJob.id)).filter(eligible).scalar()
+        return {
+            "ok": True,
+            "dry_run": True,
+            "cutoff": cutoff.isoformat(),
+            "eligible": int(count or 0),
+        }
+
+    archive = BackgroundJobArchive.__table__
+    jobs = BackgroundJob.__table__
+    archived = 0
+    batches = 0
+    for _ in range(max_batches):
+        with SessionLocal() as s:
+            id_query = s.query(BackgroundJob.id).filter(eligible).order_by(BackgroundJob.id.asc()).limit(batch_size)
+            if _is_postgres():
+                id_query = id_query.with_for_update(skip_locked=True)
+            ids = [int(row[0]) for row in id_query.all()]
+            if not ids:
+                break
+            s.execute(
+                insert(archive).from_select(
+                    [
+                        "id",
+                        "kind",
+                        "user_id",
+                        "status",
+                        "attempts",
+                        "priority",
+                        "error",
+                        "created_at",
+                        "started_at",
+                        "finished_at",
+                    ],
+                    sa_select(
+                        jobs.c.id,
+                        jobs.c.kind,
+                        jobs.c.user_id,
+                        jobs.c.status,
+                        func.coalesce(jobs.c.attempts, 0),
+                        func.coalesce(jobs.c.priority, 0),
+                        func.substr(jobs.c.error, 1, _ARCHIVE_ERROR_MAX_CHARS),
+                        jobs.c.created_at,
+                        jobs.c.started_at,
+                        func.coalesce(jobs.c.finished_at, jobs.c.updated_at),
+                    ).where(jobs.c.id.in_(ids)),
+                )
+            )
+            s.execute(delete(jobs).where(jobs.c.id.in_(ids)))
             s.commit()
-        except (ProgrammingError, OperationalError) as e:
-            if "does not exist" in str(e).lower():
-                try:
-                    s.rollback()
-                except Exception:
-                    pass
-                ensure_job_table()
-                return
-            raise
+        archived += len(ids)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+    return {
+        "ok": True,
+        "dry_run": False,
+        "cutoff": cutoff.isoformat(),
+        "archived": archived,
+        "batches": batches,
+    }
+
+
+def compact_finished_jobs_from_env(*, dry_run: bool = False) -> dict[str, Any]:
+    if (os.getenv("BACKGROUND_JOBS_RETENTION_ENABLED") or "1").strip().lower() in {"0", "false", "no", "off"}:
+        return {"ok": True, "skipped": True, "reason": "BACKGROUND_JOBS_RETENTION_ENABLED=0"}
+    ensure_job_table()
+    return compact_finished_jobs(
+        older_than_hours=_env_int("BACKGROUND_JOBS_RETENTION_HOURS", 168),
+        batch_size=_env_int("BACKGROUND_JOBS_RETENTION_BATCH_SIZE", 500),
+        max_batches=_env_int("BACKGROUND_JOBS_RETENTION_MAX_BATCHES", 20),
+        dry_run=dry_run,
+    )
+
+
+def job_table_stats() -> dict[str, Any]:
+    """
+    Row counts and approximate payload/result bytes per status, plus on-disk table size
+    (Postgres) and archive row count.
+    """
+    if _is_postgres():
+        payload_bytes = func.coalesce(func.sum(func.pg_column_size(BackgroundJob.payload)), 0)
+        result_bytes = func.coalesce(func.sum(func.pg_column_size(BackgroundJob.result)), 0)
+    else:
+        payload_bytes = func.coalesce(func.sum(func.length(BackgroundJob.payload)), 0)
+        result_bytes = func.coalesce(func.sum(func.length(BackgroundJob.result)), 0)
+    statuses: dict[str, dict[str, int]] = {}
+    table_bytes = None
+    index_bytes = None
+    with SessionLocal() as s:
+        rows = (
+            s.query(BackgroundJob.status, func.count(BackgroundJob.id), payload_bytes, result_bytes)
+            .group_by(BackgroundJob.status)
+            .all()
+        )
+        for status, count, p_bytes, r_bytes in rows:
+            statuses[str(status or "unknown")] = {
+                "rows": int(count or 0),
+                "payload_bytes": int(p_bytes or 0),
+                "result_bytes": int(r_bytes or 0),
+            }
+        if _is_postgres():
+            sizes = s.execute(
+                sa_text(
+                    "SELECT pg_total_relation_size('background_jobs'), pg_indexes_size('background_jobs')"
+                )
+            ).first()
+            if sizes:
+                table_bytes = int(sizes[0] or 0)
+                index_bytes = int(sizes[1] or 0)
+        try:
+            archive_rows = int(s.query(func.count(BackgroundJobArchive.id)).scalar() or 0)
+        except (ProgrammingError, OperationalError):
+            s.rollback()
+            archive_rows = None
+    return {
+        "statuses": statuses,
+        "total_rows": sum(item["rows"] for item in statuses.values()),
+        "table_bytes": table_bytes,
+        "index_bytes": index_bytes,
+        "archive_rows": archive_rows,
+    }
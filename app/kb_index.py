@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from .db import _is_postgres
+from .models import KBSnippet, KBVector
+
+try:
+    import numpy as np
+except Exception:  # pragma: no cover - numpy ships with matplotlib, but stay importable without it
+    np = None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+# KB_INDEX_MODE: "all" caches every (pillar, concept) partition it serves, "hot" only
+# those listed in KB_INDEX_HOT_CONCEPTS ("pillar:concept,..."), "off" disables it.
+# Default is "all" off Postgres (no pgvector to lean on) and "hot" on Postgres.
+KB_INDEX_MAX_PARTITIONS = max(1, _env_int("KB_INDEX_MAX_PARTITIONS", 256))
+# Edits invalidate this process immediately; other workers catch up after the TTL.
+KB_INDEX_TTL_SEC = max(0, _env_int("KB_INDEX_TTL_SEC", 300))
+
+_partitions: "OrderedDict[tuple[str, str], KBPartition]" = OrderedDict()
+_lock = threading.Lock()
+_generation = 0
+_stats = {"hits": 0, "loads": 0, "invalidations": 0}
+
+
+class KBPartition:
+    """Snippets for one (pillar, concept) with an L2-normalised float32 embedding matrix."""
+
+    __slots__ = ("ids", "titles", "texts", "matrix", "loaded_at")
+
+    def __init__(self, ids: list[int], titles: list[Optional[str]], texts: list[str], matrix: Any):
+        self.ids = ids
+        self.titles = titles
+        self.texts = texts
+        self.matrix = matrix
+        self.loaded_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def top_k(self, qvec: list[float], k: int) -> list[tuple[float, int, Optional[str], str]]:
+        n = len(self.ids)
+        if n == 0 or k <= 0 or len(qvec) != self.matrix.shape[1]:
+            return []
+        q = np.asarray(qvec, dtype=np.float32)
+        q /= float(np.linalg.norm(q)) or 1.0
+        scores = self.matrix @ q
+        k = min(int(k), n)
+        idx = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return [(float(scores[i]), self.ids[i], self.titles[i], self.texts[i]) for i in idx]
+
+
+def kb_index_mode() -> str:
+    if np is None:
+        return "off"
+    mode = (os.getenv("KB_INDEX_MODE") or "").strip().lower()
+    if mode in {"all", "hot", "off"}:
+        return mode
+    return "hot" if _is_postgres() else "all"
+
+
+def _hot_concepts() -> set[tuple[str, str]]:
+    out: set[tuple[str, str]] = set()
+    for part in (os.getenv("KB_INDEX_HOT_CONCEPTS") or "").split(","):
+        if ":" not in part:
+            continue
+        pillar, concept = part.split(":", 1)
+        if pillar.strip() and concept.strip():
+            out.add((pillar.strip(), concept.strip()))
+    return out
+
+
+def should_index(pillar: str, concept_key: str) -> bool:
+    mode = kb_index_mode()
+    if mode == "all":
+        return True
+    if mode == "hot":
+        return (pillar, concept_key) in _hot_concepts()
+    return False
+
+
+def load_partition(s, pillar: str, concept_key: str, dim: Optional[int] = None) -> Optional[KBPartition]:
+    """Read one partition from kb_vectors. Rows whose dimension differs from `dim` are skipped."""
+    if np is None:
+        return None
+    rows = (
+        s.query(KBVector.embedding, KBSnippet.id, KBSnippet.title, KBSnippet.text)
+        .join(KBSnippet, KBVector.snippet_id == KBSnippet.id)
+        .filter(KBSnippet.pillar_key == pillar, KBSnippet.concept_code == concept_key)
+        .order_by(KBSnippet.id)
+        .all()
+    )
+    if dim is None:
+        dim = next((len(r.embedding) for r in rows if r.embedding), 0)
+    rows = [r for r in rows if r.embedding and len(r.embedding) == dim]
+    matrix = np.ascontiguousarray(
+        np.asarray([r.embedding for r in rows], dtype=np.float32).reshape(len(rows), dim)
+    )
+    if len(rows):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+    _stats["loads"] += 1
+    return KBPartition([r.id for r in rows], [r.title for r in rows], [r.text for r in rows], matrix)
+
+
+def get_partition(s, pillar: str, concept_key: str, dim: int) -> Optional[KBPartition]:
+    """Cached partition for (pillar, concept), loading it on a miss; None if not indexed."""
+    if not should_index(pillar, concept_key):
+        return None
+    key = (pillar, concept_key)
+    now = time.monotonic()
+    with _lock:
+        part = _partitions.get(key)
+        if part is not None and part.matrix.shape[1] == dim and (
+            KB_INDEX_TTL_SEC <= 0 or now - part.loaded_at < KB_INDEX_TTL_SEC
+        ):
+            _partitions.move_to_end(key)
+            _stats["hits"] += 1
+            return part
+        gen = _generation
+    part = load_partition(s, pillar, concept_key, dim)
+    if part is None:
+        return None
+    with _lock:
+        # An invalidation during the load means this copy may already be stale.
+        if gen == _generation:
+            _partitions[key] = part
+            _partitions.move_to_end(key)
+            while len(_partitions) > KB_INDEX_MAX_PARTITIONS:
+                _partitions.popitem(last=False)
+    return part
+
+
+def invalidate_kb_index(pillar: Optional[str] = None, concept_key: Optional[str] = None) -> None:
+    """Drop cached partitions: one (pillar, concept), every concept of a pillar, or everything."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _stats["invalidations"] += 1
+        if pillar is None:
+            _partitions.clear()
+            return
+        for key in [k for k in _partitions if k[0] == pillar and (concept_key is None or k[1] == concept_key)]:
+            _partitions.pop(key, None)
+
+
+def kb_index_stats() -> dict[str, Any]:
+    with _lock:
+        parts = [
+            {"pillar_key": k[0], "concept_code": k[1], "snippets": len(p), "dim": int(p.matrix.shape[1])}
+            for k, p in _partitions.items()
+        ]
+    return {
+        **_stats,
+        "mode": kb_index_mode(),
+        "partitions": parts,
+        "max_partitions": KB_INDEX_MAX_PARTITIONS,
+        "ttl_sec": KB_INDEX_TTL_SEC,
+    }
@@ -1,13 +1,17 @@
 # app/kb_ingest.py
 from __future__ import annotations
+import hashlib
 import json
 import re
 from typing import List, Dict, Any, Optional
 
-from sqlalchemy import select  # (kept if you use it elsewhere)
-from .db import SessionLocal
-from .models import KBSnippet, KBVector, EMBEDDING_DIM
-from .llm import embed_text
+from sqlalchemy import text as sql_text
+from .db import SessionLocal, _is_postgres, ensure_kb_vector_schema
+from .models import KBSnippet, KBVector
+from .embeddings import EMBED_DIM, embed_texts, embedding_model_id
+from .kb_index import invalidate_kb_index
+
+_IN_CHUNK = 500
 
 
 def _coalesce(d: Dict[str, Any], *keys, default=None):
@@ -25,98 +29,145 @@ def _derive_title(text: str, fallback: str) -> str:
     return (first[:80] or fallback).strip()
 
 
-def _version_str(v: Optional[str], fallback: str) -> str:
-    s = str(v or fallback)
-    return s[:16]  # KBVector.version is String(16)
+def _embedding_source(title: Optional[str], text: str) -> str:
+    # Same source string the admin snippet editor embeds.
+    return f"{title}\n{text}" if title else text
+
+
+def _content_hash(title: Optional[str], text: str) -> str:
+    return hashlib.sha256(_embedding_source(title, text).encode("utf-8")).hexdigest()
+
+
+def _chunks(seq: List[Any], size: int = _IN_CHUNK):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
 
 
-def upsert_kb(snippets_path: str, version: str = "1.0.0", locale_default: str = "en-GB"):
+def upsert_kb(snippets_path: str, version: str = "1.0.0", locale_default: str = "en-GB") -> Dict[str, int]:
     """
     Load snippets JSON and upsert into KBSnippet + KBVector.
 
     Accepts both legacy and new JSON keys:
       - pillar | pillar_key
-      - concept_id | concept_key
+      - concept_id | concept_key | concept_code
+
+    Snippets whose title/text hash matches the stored row (and that already have a
+    vector of the current dimension from the current embedding model) are not
+    re-embedded; new or changed ones, and ones embedded by another backend/model,
+    are embedded in batches and written with bulk inserts/updates.
+    `version`/`locale_default` are accepted for backward compatibility only.
     """
     with open(snippets_path, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    snips: List[Dict[str, Any]] = data.get("snippets", [])
-    root_version = data.get("version", version)
-
+    # ---------- Parse + validate ----------
+    incoming: Dict[int, Dict[str, Any]] = {}
+    skipped = 0
+    for sn in data.get("snippets", []):
+        text = (sn.get("text") or "").strip()
+        pillar_key = _coalesce(sn, "pillar_key", "pillar")
+        concept_code = _coalesce(sn, "concept_code", "concept_key", "concept_id")
+        try:
+            sid = int(sn["id"])
+        except Exception:
+            sid = None
+        if sid is None or not text or not pillar_key or not concept_code:
+            # Skip malformed entries
+            skipped += 1
+            continue
+        tags = sn.get("tags") or None
+        incoming[sid] = {
+            "id": sid,
+            "pillar_key": str(pillar_key),
+            "concept_code": str(concept_code),
+            "title": (sn.get("title") or _derive_title(text, fallback=str(sid)))[:200],
+            "text": text,
+            "tags": list(tags) if isinstance(tags, (list, tuple)) else tags,
+        }
+
+    stats = {"inserted": 0, "updated": 0, "unchanged": 0, "embedded": 0, "skipped": skipped}
+    if not incoming:
+        return stats
+
+    ensure_kb_vector_schema()
+    model_id = embedding_model_id()
     with SessionLocal() as s:
-        for sn in snips:
-            # Required fields
-            sid = sn["id"]
-            text = (sn.get("text") or "").strip()
-            if not text:
-                # Skip empty text; you can log if desired
+        # ---------- Load current state in bulk ----------
+        ids = list(incoming)
+        existing: Dict[int, Dict[str, Any]] = {}
+        has_vector: set[int] = set()
+        for chunk in _chunks(ids):
+            for row in (
+                s.query(KBSnippet.id, KBSnippet.pillar_key, KBSnippet.concept_code, KBSnippet.title, KBSnippet.text, KBSnippet.tags)
+                .filter(KBSnippet.id.in_(chunk))
+                .all()
+            ):
+                existing[row.id] = dict(row._mapping)
+            for sid, emb, emb_model in (
+                s.query(KBVector.snippet_id, KBVector.embedding, KBVector.embedding_model)
+                .filter(KBVector.snippet_id.in_(chunk))
+                .all()
+            ):
+                # A vector from another backend/model lives in a different space than
+                # the queries will; treat it as missing so the snippet is re-embedded.
+                if isinstance(emb, list) and len(emb) == EMBED_DIM and emb_model == model_id:
+                    has_vector.add(sid)
+
+        # ---------- Diff ----------
+        inserts: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        to_embed: List[int] = []
+        touched: set[tuple[str, Optional[str]]] = set()
+        for sid, row in incoming.items():
+            cur = existing.get(sid)
+            if cur is None:
+                inserts.append(row)
+                to_embed.append(sid)
+                touched.add((row["pillar_key"], row["concept_code"]))
                 continue
-
-            # Accept both legacy and new naming
-            pillar_key = _coalesce(sn, "pillar_key", "pillar")
-            concept_key = _coalesce(sn, "concept_key", "concept_id")
-            if not pillar_key or not concept_key:
-                # Skip malformed entries
-                continue
-
-            typ = sn.get("type", "definition")
-            locale = sn.get("locale") or locale_default
-            tags_list = sn.get("tags") or []
-            tags_csv = ",".join([str(t) for t in tags_list])[:250]
-            weight = float(sn.get("weight", 1.0))
-            ver = _version_str(sn.get("version"), root_version)
-
-            # ---------- KBSnippet UPSERT ----------
-            snippet_meta = {
-                "pillar_key": pillar_key,
-                "concept_key": concept_key,
-                "type": typ,
-                "locale": locale,
-                "tags": tags_csv,
-                "weight": weight,
-                "version": ver,
-            }
-            row = s.get(KBSnippet, sid)
-            if not row:
-                row = KBSnippet(id=sid, text=text, **snippet_meta)
-                s.add(row)
-            else:
-                row.text = text
-                for k, v in snippet_meta.items():
-                    setattr(row, k, v)
-
-            # ---------- Embedding ----------
-            vec = embed_text(text)  # -> List[float], length EMBEDDING_DIM
-            if not isinstance(vec, list) or len(vec) != EMBEDDING_DIM:
-                raise ValueError(f"Embedding dimension mismatch (got {len(vec)}, expected {EMBEDDING_DIM})")
-
-            # ---------- KBVector UPSERT (aligns with your model) ----------
-            title = sn.get("title") or _derive_title(text, fallback=sid)
-
-            kbv = s.get(KBVector, sid)
-            if not kbv:
-                kbv = KBVector(
-                    id=sid,
-                    pillar_key=pillar_key,
-                    concept_key=concept_key,
-                    type=typ,
-                    locale=locale,
-                    embedding=vec,       # Vector(1536), NOT NULL
-                    title=title,         # NOT NULL
-                    text=text,           # NOT NULL
-                    version=ver,         # String(16)
-                    # created_at uses model default if defined
-                )
-                s.add(kbv)
-            else:
-                kbv.pillar_key = pillar_key
-                kbv.concept_key = concept_key
-                kbv.type = typ
-                kbv.locale = locale
-                kbv.embedding = vec
-                kbv.title = title
-                kbv.text = text
-                kbv.version = ver
-
-        s.commit()
\ No newline at end of file
+            content_changed = _content_hash(cur["title"], cur["text"]) != _content_hash(row["title"], row["text"])
+            meta_changed = any(cur[k] != row[k] for k in ("pillar_key", "concept_code", "tags"))
+            if content_changed or meta_changed:
+                updates.append(row)
+                touched.add((cur["pillar_key"], cur["concept_code"]))
+                touched.add((row["pillar_key"], row["concept_code"]))
+            if content_changed or sid not in has_vector:
+                to_embed.append(sid)
+                touched.add((row["pillar_key"], row["concept_code"]))
+            if not (content_changed or meta_changed) and sid in has_vector:
+                stats["unchanged"] += 1
+
+        # ---------- Embed only what changed ----------
+        vectors = embed_texts([_embedding_source(incoming[sid]["title"], incoming[sid]["text"]) for sid in to_embed])
+        for vec in vectors:
+            if len(vec) != EMBED_DIM:
+                raise ValueError(f"Embedding dimension mismatch (got {len(vec)}, expected {EMBED_DIM})")
+
+        # ---------- Bulk writes ----------
+        if inserts:
+            s.bulk_insert_mappings(KBSnippet, inserts)
+        if updates:
+            s.bulk_update_mappings(KBSnippet, updates)
+        for chunk in _chunks(to_embed):
+            s.query(KBVector).filter(KBVector.snippet_id.in_(chunk)).delete(synchronize_session=False)
+        if to_embed:
+            s.bulk_insert_mappings(
+                KBVector,
+                [
+                    {"snippet_id": sid, "embedding": vec, "embedding_model": model_id}
+                    for sid, vec in zip(to_embed, vectors)
+                ],
+            )
+        if inserts and _is_postgres():
+            # Explicit ids bypass the serial; move it past them so admin-created snippets don't collide.
+            s.execute(sql_text(
+                "SELECT setval(pg_get_serial_sequence('kb_snippets', 'id'), (SELECT MAX(id) FROM kb_snippets))"
+            ))
+        s.commit()
+
+    stats["inserted"] = len(inserts)
+    stats["updated"] = len(updates)
+    stats["embedded"] = len(to_embed)
+    for pillar_key, concept_code in touched:
+        invalidate_kb_index(pillar_key, concept_code)
+    return stats
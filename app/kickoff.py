@@ -31,6 +31,7 @@ from . import llm as shared_llm
 from .programme_timeline import programme_blocks, week_anchor_date
 from .reporting import _reports_root_for_user
 from .prompts import podcast_prompt, build_prompt, run_llm_prompt, okrs_by_pillar_payload
+from .prompt_context import get_user_prompt_context
 from .touchpoints import log_touchpoint
 from . import general_support
 from .podcast import generate_podcast_audio
@@ -165,32 +166,15 @@ def generate_kickoff_podcast_transcript(
     """
     Build a personalised kickoff transcript. Uses LLM when available; otherwise returns a concise fallback.
     """
-    run, pillars = _latest_assessment(user_id)
     user: Optional[User] = None
     with SessionLocal() as s:
         user = s.query(User).get(user_id)
     name = (getattr(user, "first_name", "") or "").strip() or "there"
     # locale currently unused; kept for compatibility/future prompt tweaks
-    psych = _latest_psych(user_id)
-    psych_payload: Dict[str, Any] = {}
-    if psych:
-        psych_payload = {
-            "section_averages": getattr(psych, "section_averages", None),
-            "flags": getattr(psych, "flags", None),
-            "parameters": getattr(psych, "parameters", None),
-        }
-    scores = [
-        {
-            "pillar": getattr(p, "pillar_key", ""),
-            "score": int(getattr(p, "overall", 0) or 0),
-        }
-        for p in pillars
-    ]
-    programme = _programme_blocks(
-        getattr(run, "finished_at", None)
-        or getattr(run, "started_at", None)
-        or getattr(run, "created_at", None)
-    )
+    prompt_context = get_user_prompt_context(user_id)
+    psych_payload: Dict[str, Any] = prompt_context.psych_payload()
+    scores = prompt_context.scores()
+    programme = _programme_blocks(prompt_context.programme_start())
     first_block = programme[0] if programme else None
     current_block = None
     if programme:
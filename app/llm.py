@@ -5,6 +5,9 @@ from dotenv import load_dotenv
 import os
 from langchain_openai import ChatOpenAI
 
+from .llm_gateway import chat_client
+from .embeddings import embed_texts
+
 # Load environment variables from .env
 env_path = Path('.') / '.env'
 load_dotenv(dotenv_path=env_path)
@@ -51,8 +54,8 @@ def resolve_model_name_for_touchpoint(
     return assessment_model if is_assessment_touchpoint(touchpoint) else coaching_model
 
 
-_llm_assessment = ChatOpenAI(model=assessment_model, temperature=0, api_key=api_key)
-_llm_coaching = ChatOpenAI(model=coaching_model, temperature=0, api_key=api_key)
+_llm_assessment = chat_client(assessment_model)
+_llm_coaching = chat_client(coaching_model)
 
 # Backward compatibility for older imports.
 default_model = assessment_model
@@ -64,9 +67,8 @@ def get_llm_client(
     model_override: str | None = None,
 ) -> ChatOpenAI:
     model_name = resolve_model_name_for_touchpoint(touchpoint=touchpoint, model_override=model_override)
-    if (model_override or "").strip():
-        return ChatOpenAI(model=model_name, temperature=0, api_key=api_key)
-    return _llm_assessment if is_assessment_touchpoint(touchpoint) else _llm_coaching
+    # Overrides reuse a cached per-model client (and its pooled connections).
+    return chat_client(model_name)
 
 def compose_prompt(kind: str, context: dict) -> str:
     """
@@ -86,18 +88,9 @@ Write the message (max 220 chars)."""
     client = get_llm_client()
     return client.invoke(prompt).content.strip()
 
-EMBED_DIM = int(os.getenv("KB_EMBED_DIM", "1536"))
-
 def embed_text(text: str) -> list[float]:
     """
-    Return a length-EMBED_DIM embedding vector for text.
-    Implement using your embedding model. This stub returns a fixed-size hash vector.
-    Replace with a real call (e.g., OpenAI text-embedding-3-small).
+    Return a length-EMBED_DIM embedding vector for text via the configured
+    embedding backend (KB_EMBED_BACKEND; see app/embeddings.py).
     """
-    import hashlib, math, random
-    h = hashlib.sha256(text.encode("utf-8")).digest()
-    random.seed(h)
-    v = [random.random() - 0.5 for _ in range(EMBED_DIM)]
-    # L2 normalize
-    n = math.sqrt(sum(x*x for x in v)) or 1.0
-    return [x / n for x in v]
+    return embed_texts([text])[0]
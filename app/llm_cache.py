@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+
+from .db import SessionLocal, engine
+from .models import LLMResponseCache
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    raw = (os.getenv(name) or "").strip().lower()
+    if not raw:
+        return default
+    return raw in {"1", "true", "yes", "on"}
+
+
+# Response caching is opt-in: every touchpoint's TTL is 0 (not cached) unless set via
+# LLM_RESPONSE_CACHE_TTLS ("touchpoint=seconds,...") or _DEFAULT_CACHE_TTLS below. Good
+# candidates are prompts rebuilt byte-for-byte on reruns (assessment_scores,
+# assessment_okr, coaching_approach report narratives), where a hit is the same answer
+# the model would give again at temperature 0. Any template edit changes the prompt
+# text and therefore the key.
+_DEFAULT_CACHE_TTLS: dict[str, int] = {}
+
+LLM_RESPONSE_CACHE_LRU_SIZE = max(0, _env_int("LLM_RESPONSE_CACHE_LRU_SIZE", 256))
+
+_lru: "OrderedDict[str, tuple[str, Optional[datetime]]]" = OrderedDict()
+_lru_lock = threading.Lock()
+_table_ready = False
+_stats = {"lru_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+
+
+def _parse_ttls(raw: str) -> dict[str, int]:
+    out: dict[str, int] = {}
+    for part in (raw or "").split(","):
+        if "=" not in part:
+            continue
+        key, val = part.split("=", 1)
+        key = key.strip().lower()
+        try:
+            out[key] = max(0, int(val.strip()))
+        except Exception:
+            continue
+    return out
+
+
+def cache_ttl_for_touchpoint(touchpoint: Optional[str]) -> int:
+    """TTL in seconds for a touchpoint's cached responses; 0 means not cached."""
+    if not touchpoint or _env_flag("LLM_RESPONSE_CACHE_DISABLED"):
+        return 0
+    ttls = dict(_DEFAULT_CACHE_TTLS)
+    ttls.update(_parse_ttls(os.getenv("LLM_RESPONSE_CACHE_TTLS") or ""))
+    return int(ttls.get(touchpoint.strip().lower(), 0))
+
+
+def response_cache_key(model: str, prompt: str, response_format: Optional[str] = None) -> str:
+    raw = "\x00".join([(model or "").strip(), (response_format or "").strip().lower(), prompt or ""])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def ensure_llm_response_cache_table() -> None:
+    global _table_ready
+    if _table_ready:
+        return
+    LLMResponseCache.__table__.create(bind=engine, checkfirst=True)
+    _table_ready = True
+
+
+def _lru_get(key: str, now: datetime) -> Optional[str]:
+    with _lru_lock:
+        entry = _lru.get(key)
+        if entry is None:
+            return None
+        text, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            _lru.pop(key, None)
+            return None
+        _lru.move_to_end(key)
+        return text
+
+
+def _lru_put(key: str, text: str, expires_at: Optional[datetime]) -> None:
+    if LLM_RESPONSE_CACHE_LRU_SIZE <= 0:
+        return
+    with _lru_lock:
+        _lru[key] = (text, expires_at)
+        _lru.move_to_end(key)
+        while len(_lru) > LLM_RESPONSE_CACHE_LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def get_cached_response(key: str) -> Optional[str]:
+    now = datetime.utcnow()
+    text = _lru_get(key, now)
+    if text is not None:
+        _stats["lru_hits"] += 1
+        return text
+    try:
+        ensure_llm_response_cache_table()
+        with SessionLocal() as s:
+            row = s.get(LLMResponseCache, key)
+            if row is None or (row.expires_at is not None and row.expires_at <= now):
+                _stats["misses"] += 1
+                return None
+            text = row.response_text
+            expires_at = row.expires_at
+            s.execute(
+                update(LLMResponseCache)
+                .where(LLMResponseCache.cache_key == key)
+                .values(hit_count=LLMResponseCache.hit_count + 1, last_hit_at=now)
+            )
+            s.commit()
+    except Exception as e:
+        print(f"[llm_cache] lookup failed: {e}")
+        _stats["misses"] += 1
+        return None
+    _stats["db_hits"] += 1
+    _lru_put(key, text, expires_at)
+    return text
+
+
+def store_cached_response(
+    key: str,
+    text: str,
+    *,
+    model: str,
+    touchpoint: Optional[str],
+    ttl_seconds: int,
+    response_format: Optional[str] = None,
+) -> None:
+    if not text or ttl_seconds <= 0:
+        return
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=int(ttl_seconds))
+    _lru_put(key, text, expires_at)
+    values = {
+        "touchpoint": touchpoint,
+        "model": model,
+        "response_format": response_format or None,
+        "response_text": text,
+        "created_at": now,
+        "expires_at": expires_at,
+    }
+    try:
+        ensure_llm_response_cache_table()
+        with SessionLocal() as s:
+            row = s.get(LLMResponseCache, key)
+            if row is None:
+                s.add(LLMResponseCache(cache_key=key, hit_count=0, **values))
+            else:
+                for attr, val in values.items():
+                    setattr(row, attr, val)
+            try:
+                s.commit()
+            except IntegrityError:
+                # Another process stored the same key first; its answer is equivalent.
+                s.rollback()
+        _stats["stores"] += 1
+    except Exception as e:
+        print(f"[llm_cache] store failed: {e}")
+
+
+def cached_llm_text(
+    prompt: str,
+    *,
+    model: str,
+    touchpoint: Optional[str],
+    invoke: Callable[[], str],
+    response_format: Optional[str] = None,
+    ttl_seconds: Optional[int] = None,
+) -> tuple[str, bool]:
+    """
+    Return (text, cache_hit). `invoke` is only called on a miss; empty responses are
+    never cached. ttl_seconds defaults to the touchpoint's policy (0 = bypass).
+    """
+    ttl = cache_ttl_for_touchpoint(touchpoint) if ttl_seconds is None else max(0, int(ttl_seconds))
+    if ttl <= 0:
+        return invoke(), False
+    key = response_cache_key(model, prompt, response_format)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached, True
+    text = invoke()
+    store_cached_response(
+        key,
+        text,
+        model=model,
+        touchpoint=touchpoint,
+        ttl_seconds=ttl,
+        response_format=response_format,
+    )
+    return text, False
+
+
+def purge_expired_llm_responses(*, batch_size: int = 1000) -> int:
+    """Evict expired rows (and their LRU copies). Returns the number of rows deleted."""
+    now = datetime.utcnow()
+    with _lru_lock:
+        for key in [k for k, (_, exp) in _lru.items() if exp is not None and exp <= now]:
+            _lru.pop(key, None)
+    ensure_llm_response_cache_table()
+    total = 0
+    with SessionLocal() as s:
+        while True:
+            keys = [
+                k
+                for (k,) in s.query(LLMResponseCache.cache_key)
+                .filter(LLMResponseCache.expires_at <= now)
+                .limit(max(1, int(batch_size)))
+                .all()
+            ]
+            if not keys:
+                break
+            s.execute(delete(LLMResponseCache).where(LLMResponseCache.cache_key.in_(keys)))
+            s.commit()
+            total += len(keys)
+            if len(keys) < batch_size:
+                break
+    return total
+
+
+def llm_response_cache_stats() -> dict[str, Any]:
+    with _lru_lock:
+        size = len(_lru)
+    return {**_stats, "lru_size": size, "lru_capacity": LLM_RESPONSE_CACHE_LRU_SIZE}
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Mapping, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+# Shared by every fan-out in the process. Model calls are additionally bounded by
+# the gateway's own slots, so this mainly caps threads parked on slow prompts.
+LLM_FANOUT_MAX_WORKERS = max(1, _env_int("LLM_FANOUT_MAX_WORKERS", 8))
+LLM_FANOUT_TIMEOUT_SEC = max(0, _env_int("LLM_FANOUT_TIMEOUT_SEC", 180))
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_in_fanout = threading.local()
+_stats = {"fanouts": 0, "calls": 0, "errors": 0, "timeouts": 0, "inline": 0}
+
+
+@dataclass
+class FanOutResult:
+    value: Any = None
+    error: Optional[BaseException] = None
+    duration_ms: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=LLM_FANOUT_MAX_WORKERS, thread_name_prefix="llm-fanout")
+        return _pool
+
+
+def _call(fn: Callable[[], Any]) -> FanOutResult:
+    started = time.perf_counter()
+    outer = getattr(_in_fanout, "active", False)
+    _in_fanout.active = True
+    try:
+        return FanOutResult(value=fn(), duration_ms=int((time.perf_counter() - started) * 1000))
+    except Exception as e:
+        return FanOutResult(error=e, duration_ms=int((time.perf_counter() - started) * 1000))
+    finally:
+        _in_fanout.active = outer
+
+
+def fan_out(
+    calls: Mapping[str, Callable[[], Any]],
+    *,
+    timeout: Optional[float] = None,
+    label: str = "fanout",
+) -> Dict[str, FanOutResult]:
+    """
+    Run independent zero-arg callables (typically one LLM prompt each) concurrently
+    and return {name: FanOutResult}. Exceptions are captured per call, never raised.
+
+    Each call runs in a copy of the caller's context, so prompt-context/delivery
+    scopes apply and run_llm_prompt/log_llm_prompt log and account usage as usual.
+    `timeout` (default LLM_FANOUT_TIMEOUT_SEC, 0 = none) is per call, measured from
+    submission; a call that overruns is reported as TimeoutError and left to finish
+    in the background. Fan-outs started from inside a fan-out call run inline.
+    """
+    if not calls:
+        return {}
+    _stats["fanouts"] += 1
+    _stats["calls"] += len(calls)
+    limit = LLM_FANOUT_TIMEOUT_SEC if timeout is None else timeout
+    if len(calls) == 1 or getattr(_in_fanout, "active", False):
+        # Nested or trivial: avoid waiting on our own pool.
+        _stats["inline"] += len(calls)
+        results = {name: _call(fn) for name, fn in calls.items()}
+    else:
+        pool = _executor()
+        submitted_at = time.monotonic()
+        futures = {
+            name: pool.submit(contextvars.copy_context().run, _call, fn)
+            for name, fn in calls.items()
+        }
+        results = {}
+        for name, future in futures.items():
+            remaining = None if not limit else max(0.0, submitted_at + limit - time.monotonic())
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                _stats["timeouts"] += 1
+                results[name] = FanOutResult(
+                    error=TimeoutError(f"{label}:{name} exceeded {limit}s"),
+                    duration_ms=int((time.monotonic() - submitted_at) * 1000),
+                )
+    for name, res in results.items():
+        if res.error is not None and not isinstance(res.error, TimeoutError):
+            _stats["errors"] += 1
+        if res.error is not None:
+            print(f"[llm_fanout] WARN: {label}:{name} failed after {res.duration_ms}ms: {res.error!r}")
+    return results
+
+
+def llm_fanout_stats() -> Dict[str, Any]:
+    return {**_stats, "max_workers": LLM_FANOUT_MAX_WORKERS, "timeout_sec": LLM_FANOUT_TIMEOUT_SEC}
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import threading
+import weakref
+from typing import Any, Iterator
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    raw = (os.getenv(name) or "").strip().lower()
+    if not raw:
+        return default
+    return raw in {"1", "true", "yes", "on"}
+
+
+# Settings are read on first use rather than at import: app.llm imports this module
+# before it loads .env.
+def _max_concurrency() -> int:
+    """Max LLM calls in flight per process (LLM_MAX_CONCURRENCY; sync and async bounded separately)."""
+    return max(1, _env_int("LLM_MAX_CONCURRENCY", 16))
+
+
+_lock = threading.Lock()
+_http_client: httpx.Client | None = None
+_clients: dict[str, ChatOpenAI] = {}
+_sync_slots: threading.BoundedSemaphore | None = None
+_async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+class _InFlight:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.followers = 0
+
+
+_inflight: dict[str, _InFlight] = {}
+_async_inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Future]]" = (
+    weakref.WeakKeyDictionary()
+)
+_stats = {"calls": 0, "coalesced": 0, "errors": 0, "streams": 0}
+_stats_lock = threading.Lock()
+
+
+def _bump(*names: str) -> None:
+    with _stats_lock:
+        for name in names:
+            _stats[name] += 1
+
+
+def _sync_semaphore() -> threading.BoundedSemaphore:
+    global _sync_slots
+    if _sync_slots is None:
+        with _lock:
+            if _sync_slots is None:
+                _sync_slots = threading.BoundedSemaphore(_max_concurrency())
+    return _sync_slots
+
+
+def _shared_http_client() -> httpx.Client:
+    """
+    One keep-alive pool for every model: all models talk to the same API host, so
+    sharing the pool is what keeps TLS sessions warm across touchpoints/overrides.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max(1, _env_int("LLM_HTTP_MAX_CONNECTIONS", 32)),
+                max_keepalive_connections=max(1, _env_int("LLM_HTTP_MAX_KEEPALIVE", 16)),
+            ),
+            timeout=httpx.Timeout(float(max(1, _env_int("LLM_HTTP_TIMEOUT_SECONDS", 600))), connect=10.0),
+        )
+    return _http_client
+
+
+def chat_client(model_name: str) -> ChatOpenAI:
+    """Cached ChatOpenAI per model name, all sharing the pooled HTTP client."""
+    key = (model_name or "").strip()
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # Async calls use langchain's shared default async pool: an httpx.AsyncClient
+            # is bound to the loop that first used it, and we do not own that loop.
+            client = ChatOpenAI(
+                model=key,
+                temperature=0,
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=_shared_http_client(),
+            )
+            _clients[key] = client
+    return client
+
+
+def _request_key(model_name: str, prompt: Any) -> str:
+    raw = f"{model_name}\x00{prompt}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def invoke(prompt: Any, *, model: str, coalesce: bool | None = None) -> Any:
+    """
+    Bounded, coalesced synchronous invoke. Identical (model, prompt) requests that
+    arrive while one is already in flight wait for and share its response instead of
+    issuing a second call. Clients run at temperature 0, so the shared answer is the
+    one each caller would have received. Set LLM_COALESCE_DISABLED=1 to opt out.
+    """
+    if coalesce is None:
+        coalesce = not _env_flag("LLM_COALESCE_DISABLED")
+    client = chat_client(model)
+    if not coalesce:
+        return _invoke_bounded(client, prompt)
+
+    key = _request_key(model, prompt)
+    with _lock:
+        entry = _inflight.get(key)
+        leader = entry is None
+        if leader:
+            entry = _InFlight()
+            _inflight[key] = entry
+        else:
+            entry.followers += 1
+    if not leader:
+        _bump("coalesced")
+        entry.done.wait()
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+    try:
+        entry.result = _invoke_bounded(client, prompt)
+        return entry.result
+    except BaseException as exc:
+        entry.error = exc
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        entry.done.set()
+
+
+def _invoke_bounded(client: ChatOpenAI, prompt: Any) -> Any:
+    with _sync_semaphore():
+        _bump("calls")
+        try:
+            return client.invoke(prompt)
+        except Exception:
+            _bump("errors")
+            raise
+
+
+def stream(prompt: Any, *, model: str) -> Iterator[str]:
+    """
+    Bounded streaming invoke: yields text deltas as the model produces them. Streams
+    are never coalesced (each caller needs its own token feed); the concurrency slot
+    is held until the stream is exhausted or closed.
+    """
+    client = chat_client(model)
+    with _sync_semaphore():
+        _bump("calls", "streams")
+        try:
+            for chunk in client.stream(prompt):
+                content = getattr(chunk, "content", None)
+                if isinstance(content, str):
+                    if content:
+                        yield content
+                elif isinstance(content, list):
+                    for part in content:
+                        text = part.get("text") if isinstance(part, dict) else part
+                        if isinstance(text, str) and text:
+                            yield text
+        except Exception:
+            _bump("errors")
+            raise
+
+
+def _loop_slots(loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+    slots = _async_slots.get(loop)
+    if slots is None:
+        slots = asyncio.Semaphore(_max_concurrency())
+        _async_slots[loop] = slots
+    return slots
+
+
+async def ainvoke(prompt: Any, *, model: str, coalesce: bool | None = None) -> Any:
+    """Async counterpart of invoke(); bounded and coalesced per event loop."""
+    if coalesce is None:
+        coalesce = not _env_flag("LLM_COALESCE_DISABLED")
+    client = chat_client(model)
+    loop = asyncio.get_running_loop()
+    if not coalesce:
+        return await _ainvoke_bounded(client, prompt, loop)
+
+    pending = _async_inflight.setdefault(loop, {})
+    key = _request_key(model, prompt)
+    fut = pending.get(key)
+    if fut is not None:
+        _bump("coalesced")
+        return await asyncio.shield(fut)
+    fut = loop.create_future()
+    pending[key] = fut
+    try:
+        result = await _ainvoke_bounded(client, prompt, loop)
+        fut.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as exc:
+        fut.set_exception(exc)
+        # Mark retrieved so a leader-only failure does not log "exception never retrieved".
+        fut.exception()
+        raise
+    finally:
+        pending.pop(key, None)
+
+
+async def _ainvoke_bounded(client: ChatOpenAI, prompt: Any, loop: asyncio.AbstractEventLoop) -> Any:
+    async with _loop_slots(loop):
+        _bump("calls")
+        try:
+            return await client.ainvoke(prompt)
+        except Exception:
+            _bump("errors")
+            raise
+
+
+def gateway_stats() -> dict[str, Any]:
+    with _lock:
+        inflight = len(_inflight)
+        models = sorted(_clients)
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        **stats,
+        "inflight": inflight,
+        "models": models,
+        "max_concurrency": _max_concurrency(),
+    }
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional
+
+# Receives (touchpoint, delta) for every streamed text chunk in the current request.
+TokenSink = Callable[[Optional[str], str], None]
+
+_SINK: ContextVar[Optional[TokenSink]] = ContextVar("llm_stream_sink", default=None)
+
+
+@contextmanager
+def llm_stream_context(sink: TokenSink) -> Iterator[None]:
+    """
+    Stream LLM text produced within this scope: run_llm_prompt switches to the
+    gateway's streaming call for text responses and forwards each delta to `sink`,
+    while still assembling the full text for logging and the caller.
+    """
+    token = _SINK.set(sink)
+    try:
+        yield
+    finally:
+        _SINK.reset(token)
+
+
+def active_stream_sink() -> Optional[TokenSink]:
+    return _SINK.get()
@@ -57,28 +57,28 @@ def _ensure_message_log_schema() -> None:
                     pass
         _MESSAGE_LOG_SCHEMA_READY = True
 
-def _console_echo(phone_e164: Optional[str], direction: Optional[str], text: Optional[str]) -> None:
+def _console_echo(
+    phone_e164: Optional[str],
+    direction: Optional[str],
+    text: Optional[str],
+    user: object | None = None,
+) -> None:
     """
     Print a console echo for any message written to MessageLog.
     Format: [OUTBOUND] Julian #1 (+4477...) → first 120 chars
     """
-    # Local imports to avoid circular deps
-    try:
-        from .db import SessionLocal  # type: ignore
-        from .models import User as _User  # type: ignore
-    except Exception:
-        SessionLocal = None
-        _User = None
     phone = (phone_e164 or "").strip()
     label = "Unknown"
-    if SessionLocal and _User and phone:
+    u = user
+    if u is None and phone:
         try:
-            with SessionLocal() as _s:
-                u = _s.query(_User).filter(_User.phone == phone).first()
-                if u:
-                    label = f"{getattr(u, 'name', 'User')} #{getattr(u, 'id', '?')}"
+            from .user_identity import lookup_user_identity  # local import to avoid cycles
+
+            u = lookup_user_identity(phone)
         except Exception:
-            pass
+            u = None
+    if u is not None:
+        label = f"{getattr(u, 'name', 'User')} #{getattr(u, 'id', '?')}"
     preview = (text or "")[:120]
     dir_up = (direction or "").upper()
     phone_disp = phone if phone else "n/a"
@@ -155,11 +155,12 @@ def write_log(*args, **kwargs) -> None:
                 except Exception:
                     user_obj = None
 
-    # 2) Best-effort user resolution if not provided
+    # 2) Best-effort user resolution if not provided (id only; served from the identity cache)
     if user_obj is None and phone_e164:
         try:
-            with SessionLocal() as s:
-                user_obj = s.query(_User).filter(_User.phone == phone_e164).first()
+            from .user_identity import lookup_user_identity
+
+            user_obj = lookup_user_identity(phone_e164)
         except Exception:
             user_obj = None
 
@@ -196,7 +197,7 @@ def write_log(*args, **kwargs) -> None:
             )
             s.add(row)
             s.commit()
-            _console_echo(phone_e164, direction, text)
+            _console_echo(phone_e164, direction, text, user_obj)
     except Exception as e:
         try:
             s.rollback()
@@ -358,6 +358,32 @@ class LLMPromptLog(Base):
     user = relationship("User")
 
 
+
+class LLMResponseCache(Base):
+    """Content-addressed cache of deterministic (temperature=0) LLM responses."""
+    __tablename__ = "llm_response_cache"
+    cache_key       = Column(String(64), primary_key=True)  # sha256(model, response_format, prompt)
+    touchpoint      = Column(String(64), nullable=True, index=True)
+    model           = Column(String(120), nullable=False)
+    response_format = Column(String(32), nullable=True)
+    response_text   = Column(Text, nullable=False)
+    hit_count       = Column(Integer, nullable=False, server_default="0")
+    created_at      = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_hit_at     = Column(DateTime, nullable=True)
+    expires_at      = Column(DateTime, nullable=True, index=True)
+
+
+class QueryEmbeddingCache(Base):
+    """Embeddings of retrieval query text, keyed on normalised text + embedding model."""
+    __tablename__ = "query_embedding_cache"
+    cache_key   = Column(String(64), primary_key=True)  # sha256(model_id, normalised text)
+    model_id    = Column(String(160), nullable=False)
+    embedding   = Column(JSONType, nullable=False)
+    hit_count   = Column(Integer, nullable=False, server_default="0")
+    created_at  = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_hit_at = Column(DateTime, nullable=True, index=True)
+
+
 class PromptTemplate(Base):
     __tablename__ = "prompt_templates"
     id            = Column(Integer, primary_key=True)
@@ -381,6 +407,22 @@ class PromptTemplate(Base):
     )
 
 
+class PromptCacheVersion(Base):
+    """Single-row counter bumped on prompt template/settings writes; invalidates process-local prompt caches."""
+    __tablename__ = "prompt_cache_version"
+    id         = Column(Integer, primary_key=True)
+    version    = Column(BigInteger, nullable=False, server_default="0")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class SendRateBucket(Base):
+    """Token bucket shared by every process sending through one Twilio account (see send_rate_limiter)."""
+    __tablename__ = "send_rate_buckets"
+    name       = Column(String(64), primary_key=True)
+    tokens     = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
 class PromptSettings(Base):
     __tablename__ = "prompt_settings"
     id                = Column(Integer, primary_key=True)
@@ -657,6 +699,8 @@ class KbVector(Base):
     id         = Column(Integer, primary_key=True)
     snippet_id = Column(Integer, ForeignKey("kb_snippets.id", ondelete="CASCADE"), nullable=False, index=True)
     embedding  = Column(JSONType, nullable=False)
+    # embeddings.embedding_model_id() of the backend that produced `embedding`.
+    embedding_model = Column(String(160), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
@@ -1558,15 +1602,55 @@ class BackgroundJob(Base):
     result     = Column(JSONType, nullable=True)
     error      = Column(Text, nullable=True)
     attempts   = Column(Integer, nullable=False, server_default=text("0"))
+    priority   = Column(Integer, nullable=False, server_default=text("0"))  # higher claims first; see job_queue.JOB_LANE_PRIORITIES
+    dedup_key  = Column(String(64), nullable=True)  # sha256 of kind + payload_match; see job_queue.job_dedup_key
     available_at = Column(DateTime, nullable=True)
+    claim_rank = Column(Float, nullable=True)  # claimable-at epoch minus priority aging; see job_queue._claim_rank
     locked_at  = Column(DateTime, nullable=True)
     locked_by  = Column(String(120), nullable=True)
+    started_at = Column(DateTime, nullable=True)   # latest claim (UTC); enqueue-to-claim wait ends here
+    finished_at = Column(DateTime, nullable=True)  # latest attempt end (UTC); claim-to-finish run time ends here
     created_at = Column(DateTime, nullable=False, server_default=func.now())
     updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
 
     __table_args__ = (
         Index("ix_background_jobs_status_kind", "status", "kind"),
+        Index("ix_background_jobs_finished_at", "finished_at"),
         Index("ix_background_jobs_status_available_at", "status", "available_at"),
+        Index(
+            "ix_background_jobs_claim_rank",
+            "claim_rank",
+            "id",
+            postgresql_where=sa_text("status IN ('pending', 'retry', 'running')"),
+            sqlite_where=sa_text("status IN ('pending', 'retry', 'running')"),
+        ),
+        Index(
+            "ux_background_jobs_active_dedup_key",
+            "dedup_key",
+            unique=True,
+            postgresql_where=sa_text("dedup_key IS NOT NULL AND status IN ('pending', 'retry', 'running')"),
+            sqlite_where=sa_text("dedup_key IS NOT NULL AND status IN ('pending', 'retry', 'running')"),
+        ),
+    )
+
+class BackgroundJobArchive(Base):
+    """Compact record of finished background jobs moved out of background_jobs (no payload/result)."""
+    __tablename__ = "background_jobs_archive"
+
+    id          = Column(Integer, primary_key=True)   # original background_jobs.id
+    kind        = Column(String(64), nullable=False)
+    user_id     = Column(Integer, nullable=True, index=True)
+    status      = Column(String(32), nullable=False)  # done|error
+    attempts    = Column(Integer, nullable=False, server_default=text("0"))
+    priority    = Column(Integer, nullable=False, server_default=text("0"))
+    error       = Column(Text, nullable=True)         # truncated
+    created_at  = Column(DateTime, nullable=False)
+    started_at  = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)     # background_jobs.finished_at (or updated_at) at archive time
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_background_jobs_archive_kind_created", "kind", "created_at"),
     )
 
 class WeeklyFocus(Base):
@@ -13,6 +13,7 @@ from sqlalchemy.orm import Session
 from .db import SessionLocal
 from .job_queue import enqueue_job, should_use_worker
 from .coaching_delivery import send_coaching_text, send_coaching_media
+from .conversation_state import ConversationState
 from .debug_utils import debug_enabled
 from .models import (
     User,
@@ -180,8 +181,12 @@ def _state_key() -> str:
     return "weekstart_state"
 
 
-def _get_state(session: Session, user_id: int) -> Optional[dict]:
-    """Load the monday session state from UserPreference, if present."""
+def _get_state(
+    session: Session, user_id: int, conversation_state: Optional[ConversationState] = None
+) -> Optional[dict]:
+    """Load the monday session state from the routing snapshot or UserPreference, if present."""
+    if conversation_state is not None and conversation_state.covers(_state_key()):
+        return conversation_state.json(_state_key())
     pref = (
         session.query(UserPreference)
         .filter(UserPreference.user_id == user_id, UserPreference.key == _state_key())
@@ -213,8 +218,10 @@ def _set_state(session: Session, user_id: int, state: Optional[dict]):
         session.add(UserPreference(user_id=user_id, key=_state_key(), value=data))
 
 
-def has_active_state(user_id: int) -> bool:
+def has_active_state(user_id: int, conversation_state: Optional[ConversationState] = None) -> bool:
     """Check if a monday session state is stored for this user."""
+    if conversation_state is not None and conversation_state.covers(_state_key()):
+        return bool(conversation_state.json(_state_key()))
     with SessionLocal() as s:
         st = _get_state(s, user_id)
         return bool(st)
@@ -406,12 +413,12 @@ def start_weekstart(user: User, notes: str | None = None, debug: bool = False, s
             s.commit()
 
 
-def handle_message(user: User, text: str) -> None:
+def handle_message(user: User, text: str, conversation_state: Optional[ConversationState] = None) -> None:
     """Entry point for inbound monday/Weekstart chat messages."""
     msg = (text or "").strip()
     lower = msg.lower()
     with SessionLocal() as s:
-        state = _get_state(s, user.id)
+        state = _get_state(s, user.id, conversation_state)
 
         if lower.startswith("mondaydebug") and debug_enabled():
             _set_state(s, user.id, None); s.commit()
@@ -2,17 +2,22 @@
 from __future__ import annotations
 
 import os
-import queue
+import random
 import re
 import threading
 import time
 import json
 import base64
+import contextvars
 import urllib.request
 import urllib.error
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, time as dt_time, timedelta
+from typing import Callable
 
+from requests.adapters import HTTPAdapter
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
 from twilio.base.exceptions import TwilioRestException
 from .config import settings
 from .debug_utils import debug_log, debug_enabled
@@ -21,6 +26,13 @@ from .usage import log_usage_event, estimate_whatsapp_cost
 from .models import User
 from .virtual_clock import get_virtual_now_for_user
 from .db import SessionLocal, engine
+from .outbound_dispatcher import get_outbound_dispatcher, outbound_lane_workers
+from .send_rate_limiter import (
+    TWILIO_BULK_RESERVE_TOKENS,
+    TWILIO_INTERACTIVE_MAX_WAIT_SEC,
+    twilio_send_limiter,
+)
+from .user_identity import lookup_user_identity
 
 BUSINESS_START = dt_time(9, 0)
 BUSINESS_END   = dt_time(19, 0)
@@ -36,12 +48,8 @@ def in_business_hours(now_local: datetime) -> bool:
 
 E164 = re.compile(r"^\+?[1-9]\d{7,14}$")  # simple E.164 validator
 MIN_SEND_GAP_SEC = float(os.getenv("WHATSAPP_MIN_SEND_GAP", "0.4"))
-_SEND_LOCK_GUARD = threading.Lock()
-_SEND_LOCKS: dict[str, threading.Lock] = {}
-_LAST_SEND_MONO: dict[str, float] = {}
-_QUEUE_LOCK = threading.Lock()
-_SEND_QUEUES: dict[str, "queue.Queue[dict]"] = {}
-_QUEUE_THREADS: dict[str, threading.Thread] = {}
+_TWILIO_CLIENT: Client | None = None
+_TWILIO_CLIENT_LOCK = threading.Lock()
 _MAX_QUICK_REPLIES = 3
 _QUICK_REPLY_TITLE_LIMIT = 20
 _SESSION_REOPEN_ENV = "TWILIO_REOPEN_CONTENT_SID"
@@ -1089,25 +1097,6 @@ def ensure_quick_reply_templates(*, always_log: bool = False) -> None:
             print("[startup] Twilio quick replies: no changes.")
 
 
-def _lock_for_destination(dest: str) -> threading.Lock:
-    with _SEND_LOCK_GUARD:
-        lock = _SEND_LOCKS.get(dest)
-        if lock is None:
-            lock = threading.Lock()
-            _SEND_LOCKS[dest] = lock
-        return lock
-
-
-def _throttle_destination(dest: str):
-    try:
-        last = _LAST_SEND_MONO.get(dest, 0.0)
-        gap = MIN_SEND_GAP_SEC - (time.monotonic() - last)
-        if gap > 0:
-            time.sleep(gap)
-    except Exception:
-        pass
-
-
 def _normalize_whatsapp_phone(raw: str | None) -> str | None:
     """
     Return a number in the 'whatsapp:+441234567890' format, or None.
@@ -1137,22 +1126,74 @@ def _normalize_sms_phone(raw: str | None) -> str | None:
 
 def _lookup_user_id_for_whatsapp(to_norm: str | None) -> int | None:
     try:
-        if not to_norm:
-            return None
-        phone = to_norm.replace("whatsapp:", "")
-        with SessionLocal() as s:
-            row = s.query(User).filter(User.phone == phone).one_or_none()
-            return getattr(row, "id", None) if row else None
+        identity = lookup_user_identity(to_norm)
+        return identity.id if identity else None
     except Exception:
         return None
 
 
 def _twilio_client() -> Client | None:
-    try:
-        return Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-    except Exception as e:
-        print(f"❌ Twilio client init failed: {e!r}")
-        return None
+    """Shared Twilio client; its HTTP session keeps a connection pool sized for the dispatcher."""
+    global _TWILIO_CLIENT
+    if _TWILIO_CLIENT is not None:
+        return _TWILIO_CLIENT
+    with _TWILIO_CLIENT_LOCK:
+        if _TWILIO_CLIENT is not None:
+            return _TWILIO_CLIENT
+        try:
+            http_client = TwilioHttpClient(pool_connections=True)
+            session = getattr(http_client, "session", None)
+            if session is not None:
+                pool_size = max(10, int(os.getenv("OUTBOUND_DISPATCH_WORKERS", "8") or "8") * 2)
+                session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=pool_size))
+            _TWILIO_CLIENT = Client(
+                settings.TWILIO_ACCOUNT_SID,
+                settings.TWILIO_AUTH_TOKEN,
+                http_client=http_client,
+            )
+        except Exception as e:
+            print(f"❌ Twilio client init failed: {e!r}")
+            return None
+        return _TWILIO_CLIENT
+
+
+# Set while send_bulk is sending: routes sends to the bulk dispatcher lane and makes
+# them leave TWILIO_BULK_RESERVE_TOKENS in the rate bucket for interactive replies.
+_BULK_SEND: contextvars.ContextVar[bool] = contextvars.ContextVar("outbound_bulk_send", default=False)
+
+
+def _is_rate_limited(exc: TwilioRestException) -> bool:
+    return getattr(exc, "status", None) == 429 or getattr(exc, "code", None) == 20429
+
+
+def _twilio_create(client: Client, **kwargs):
+    """
+    messages.create behind the account-wide send limiter; 429s are retried with
+    exponential backoff (TWILIO_429_MAX_RETRIES, default 3). Interactive sends give
+    up after TWILIO_INTERACTIVE_MAX_WAIT_SEC of limiter waits and backoff combined,
+    so one throttled reply cannot hold an interactive dispatcher worker for minutes.
+    """
+    limiter = twilio_send_limiter()
+    bulk = _BULK_SEND.get()
+    reserve = TWILIO_BULK_RESERVE_TOKENS if bulk else 0.0
+    deadline = None if bulk else time.monotonic() + TWILIO_INTERACTIVE_MAX_WAIT_SEC
+    max_retries = max(0, int(os.getenv("TWILIO_429_MAX_RETRIES", "3") or "3"))
+    attempt = 0
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not limiter.acquire(timeout, reserve=reserve):
+            raise RuntimeError("Twilio send rate limit: timed out waiting for a send slot")
+        try:
+            return client.messages.create(**kwargs)
+        except TwilioRestException as exc:
+            if not _is_rate_limited(exc) or attempt >= max_retries:
+                raise
+            delay = min(30.0, (2 ** attempt)) + random.uniform(0, 0.5)
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise
+            attempt += 1
+            print(f"⚠️ Twilio 429 for {kwargs.get('to')}; retry {attempt}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
 
 
 # NOTE: write_log is defined ONLY in app.message_log and imported here; do not redefine.
@@ -1257,84 +1298,83 @@ def _perform_twilio_send(
     if not from_norm:
         raise RuntimeError("TWILIO_FROM must be a valid WhatsApp-enabled number (e.g., whatsapp:+1415...)")
 
-    lock = _lock_for_destination(to_norm)
-    with lock:
-        _throttle_destination(to_norm)
-        try:
-            if content_sid:
-                msg = client.messages.create(
-                    from_=from_norm,
-                    to=to_norm,
-                    content_sid=content_sid,
-                    content_variables=content_variables,
-                    status_callback=status_callback or None,
-                )
-            else:
-                msg = client.messages.create(
-                    from_=from_norm,
-                    body=text,
-                    media_url=media_urls,
-                    to=to_norm,
-                    status_callback=status_callback or None,
-                )
-        except TwilioRestException as exc:
-            code = getattr(exc, "code", None)
-            reopened = False
-            if code == 63016:
-                reopen_sid = _get_session_reopen_sid()
-                if reopen_sid and reopen_sid != content_sid:
+    # Per-destination ordering and MIN_SEND_GAP_SEC spacing are enforced by the
+    # outbound dispatcher that runs this function.
+    try:
+        if content_sid:
+            msg = _twilio_create(
+                client,
+                from_=from_norm,
+                to=to_norm,
+                content_sid=content_sid,
+                content_variables=content_variables,
+                status_callback=status_callback or None,
+            )
+        else:
+            msg = _twilio_create(
+                client,
+                from_=from_norm,
+                body=text,
+                media_url=media_urls,
+                to=to_norm,
+                status_callback=status_callback or None,
+            )
+    except TwilioRestException as exc:
+        code = getattr(exc, "code", None)
+        reopened = False
+        if code == 63016:
+            reopen_sid = _get_session_reopen_sid()
+            if reopen_sid and reopen_sid != content_sid:
+                try:
+                    reopen_vars = "{}"
                     try:
-                        reopen_vars = "{}"
-                        try:
-                            msg = client.messages.create(
-                                from_=from_norm,
-                                to=to_norm,
-                                content_sid=reopen_sid,
-                                content_variables=reopen_vars,
-                                status_callback=status_callback or None,
-                            )
-                        except TwilioRestException as exc_vars:
-                            # Compatibility fallback for older templates still requiring variables.
-                            err_text = str(getattr(exc_vars, "msg", "") or exc_vars).lower()
-                            if "variable" not in err_text and "content_variables" not in err_text and "content variable" not in err_text:
-                                raise
-                            user_id = _lookup_user_id_for_whatsapp(to_norm)
-                            first_name = None
-                            if user_id:
-                                try:
-                                    with SessionLocal() as s:
-                                        u = s.query(User).get(int(user_id))
-                                        first_name = (getattr(u, "first_name", None) or None) if u else None
-                                except Exception:
-                                    first_name = None
-                            reopen_vars = json.dumps(
-                                build_session_reopen_template_variables(
-                                    user_first_name=first_name,
-                                    coach_name=None,
-                                    message_text=text or get_default_session_reopen_message_text(),
-                                )
-                            )
-                            msg = client.messages.create(
-                                from_=from_norm,
-                                to=to_norm,
-                                content_sid=reopen_sid,
-                                content_variables=reopen_vars,
-                                status_callback=status_callback or None,
+                        msg = _twilio_create(
+                            client,
+                            from_=from_norm,
+                            to=to_norm,
+                            content_sid=reopen_sid,
+                            content_variables=reopen_vars,
+                            status_callback=status_callback or None,
+                        )
+                    except TwilioRestException as exc_vars:
+                        # Compatibility fallback for older templates still requiring variables.
+                        err_text = str(getattr(exc_vars, "msg", "") or exc_vars).lower()
+                        if "variable" not in err_text and "content_variables" not in err_text and "content variable" not in err_text:
+                            raise
+                        user_id = _lookup_user_id_for_whatsapp(to_norm)
+                        first_name = None
+                        if user_id:
+                            try:
+                                with SessionLocal() as s:
+                                    u = s.query(User).get(int(user_id))
+                                    first_name = (getattr(u, "first_name", None) or None) if u else None
+                            except Exception:
+                                first_name = None
+                        reopen_vars = json.dumps(
+                            build_session_reopen_template_variables(
+                                user_first_name=first_name,
+                                coach_name=None,
+                                message_text=text or get_default_session_reopen_message_text(),
                             )
-                        reopened = True
-                        content_sid = reopen_sid
-                        content_variables = reopen_vars
-                    except TwilioRestException as exc2:
-                        print(f"❌ Twilio reopen template failed to {to_norm}: {exc2.msg if hasattr(exc2, 'msg') else exc2}")
-            if not reopened:
-                print(f"❌ Twilio send failed to {to_norm}: {exc.msg if hasattr(exc, 'msg') else exc} (code={code})")
-                if code == 63016:
-                    print("💡 WhatsApp session expired (>24h). Configure TWILIO_REOPEN_CONTENT_SID for an approved template.")
-                raise
-        try:
-            _LAST_SEND_MONO[to_norm] = time.monotonic()
-        except Exception:
-            pass
+                        )
+                        msg = _twilio_create(
+                            client,
+                            from_=from_norm,
+                            to=to_norm,
+                            content_sid=reopen_sid,
+                            content_variables=reopen_vars,
+                            status_callback=status_callback or None,
+                        )
+                    reopened = True
+                    content_sid = reopen_sid
+                    content_variables = reopen_vars
+                except TwilioRestException as exc2:
+                    print(f"❌ Twilio reopen template failed to {to_norm}: {exc2.msg if hasattr(exc2, 'msg') else exc2}")
+        if not reopened:
+            print(f"❌ Twilio send failed to {to_norm}: {exc.msg if hasattr(exc, 'msg') else exc} (code={code})")
+            if code == 63016:
+                print("💡 WhatsApp session expired (>24h). Configure TWILIO_REOPEN_CONTENT_SID for an approved template.")
+            raise
 
     phone_e164 = to_norm.replace("whatsapp:", "")
     try:
@@ -1393,7 +1433,8 @@ def _perform_twilio_sms(*, text: str, to_norm: str) -> str:
     sms_from = (os.getenv("TWILIO_SMS_FROM") or "").strip()
     if not sms_from or not E164.match(sms_from):
         raise RuntimeError("TWILIO_SMS_FROM must be a valid E.164 number for SMS.")
-    msg = client.messages.create(
+    msg = _twilio_create(
+        client,
         from_=sms_from,
         to=to_norm,
         body=text,
@@ -1401,48 +1442,6 @@ def _perform_twilio_sms(*, text: str, to_norm: str) -> str:
     return getattr(msg, "sid", "")
 
 
-def _ensure_queue_worker(dest: str) -> queue.Queue:
-    with _QUEUE_LOCK:
-        q = _SEND_QUEUES.get(dest)
-        if q is None:
-            q = queue.Queue()
-            _SEND_QUEUES[dest] = q
-            t = threading.Thread(target=_queue_worker, args=(dest, q), daemon=True)
-            _QUEUE_THREADS[dest] = t
-            t.start()
-        return q
-
-
-def _queue_worker(dest: str, q: queue.Queue):
-    while True:
-        job = q.get()
-        if job is None:
-            q.task_done()
-            break
-        text = job["text"]
-        category = job["category"]
-        media_urls = job.get("media_urls")
-        content_sid = job.get("content_sid")
-        content_variables = job.get("content_variables")
-        event = job["event"]
-        result = job["result"]
-        try:
-            sid = _perform_twilio_send(
-                text=text,
-                to_norm=dest,
-                category=category,
-                media_urls=media_urls,
-                content_sid=content_sid,
-                content_variables=content_variables,
-            )
-            result["sid"] = sid
-        except Exception as e:
-            result["error"] = e
-        finally:
-            event.set()
-            q.task_done()
-
-
 def _enqueue_and_send(
     *,
     to_norm: str,
@@ -1452,24 +1451,25 @@ def _enqueue_and_send(
     content_sid: str | None = None,
     content_variables: str | None = None,
 ) -> str:
-    q = _ensure_queue_worker(to_norm)
-    event = threading.Event()
-    result: dict[str, str | Exception] = {}
-    q.put(
-        {
-            "text": text,
-            "category": category,
-            "media_urls": media_urls,
-            "content_sid": content_sid,
-            "content_variables": content_variables,
-            "event": event,
-            "result": result,
-        }
+    """
+    Send via the shared outbound dispatcher (per-destination FIFO + MIN_SEND_GAP_SEC)
+    and wait. send_bulk traffic uses the separate bulk lane.
+    """
+    lane = "bulk" if _BULK_SEND.get() else "interactive"
+    ctx = contextvars.copy_context()
+    future = get_outbound_dispatcher(MIN_SEND_GAP_SEC, lane=lane).submit(
+        to_norm,
+        lambda: ctx.run(
+            _perform_twilio_send,
+            text=text,
+            to_norm=to_norm,
+            category=category,
+            media_urls=media_urls,
+            content_sid=content_sid,
+            content_variables=content_variables,
+        ),
     )
-    event.wait()
-    if "error" in result:
-        raise result["error"]
-    return str(result.get("sid", ""))
+    return str(future.result() or "")
 
 
 def send_whatsapp(
@@ -1758,6 +1758,89 @@ def send_whatsapp_template(
     return result_sid
 
 
+def send_bulk(
+    messages: list[dict],
+    *,
+    concurrency: int | None = None,
+    on_result: Callable[[dict], None] | None = None,
+) -> list[dict]:
+    """
+    Send many messages as fast as the account-wide rate limit allows.
+
+    Each message is a dict with "to" plus one of:
+      - "template_sid" (+ optional "variables")  → send_whatsapp_template
+      - "media_url" (+ optional "caption")       → send_whatsapp_media
+      - "text" (+ optional "quick_replies"), "channel": "whatsapp" (default) | "sms"
+    and an optional "category". Sends run concurrently on the bulk dispatcher lane
+    (OUTBOUND_BULK_WORKERS by default) and leave TWILIO_BULK_RESERVE_TOKENS of the
+    rate bucket to interactive sends; per-destination ordering/spacing, 429 retries
+    and usage/message logging are those of the single-send functions.
+
+    Returns one outcome per message, in input order:
+    {"index", "to", "ok", "sid", "error"}. `on_result`, if given, is called with each
+    outcome as it completes (in the caller's thread), so callers can record progress
+    before the whole batch finishes.
+    """
+    def _send_one(msg: dict) -> str:
+        token = _BULK_SEND.set(True)
+        try:
+            return _send_one_bulk(msg)
+        finally:
+            _BULK_SEND.reset(token)
+
+    def _send_one_bulk(msg: dict) -> str:
+        to = msg.get("to")
+        category = msg.get("category")
+        if msg.get("template_sid"):
+            return send_whatsapp_template(
+                to=to,
+                template_sid=str(msg["template_sid"]),
+                variables=msg.get("variables"),
+                category=category,
+            )
+        if msg.get("media_url"):
+            return send_whatsapp_media(
+                media_url=str(msg["media_url"]),
+                to=to,
+                caption=msg.get("caption"),
+                category=category,
+            )
+        if str(msg.get("channel") or "whatsapp").strip().lower() == "sms":
+            return send_sms(str(msg.get("text") or ""), to=to)
+        return send_whatsapp(
+            text=str(msg.get("text") or ""),
+            to=to,
+            category=category,
+            quick_replies=msg.get("quick_replies"),
+        )
+
+    outcomes: list[dict] = [
+        {"index": idx, "to": (msg or {}).get("to"), "ok": False, "sid": None, "error": None}
+        for idx, msg in enumerate(messages or [])
+    ]
+    if not outcomes:
+        return outcomes
+    workers = concurrency or outbound_lane_workers("bulk")
+    workers = max(1, min(int(workers), len(outcomes)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="send-bulk") as pool:
+        futures = {pool.submit(_send_one, msg or {}): idx for idx, msg in enumerate(messages)}
+        for future in as_completed(futures):
+            outcome = outcomes[futures[future]]
+            try:
+                outcome["sid"] = future.result() or None
+                outcome["ok"] = True
+            except Exception as e:
+                outcome["error"] = str(e) or repr(e)
+            if on_result is not None:
+                try:
+                    on_result(outcome)
+                except Exception as e:
+                    print(f"[nudges] WARN: send_bulk on_result failed index={outcome['index']}: {e!r}")
+    sent = sum(1 for o in outcomes if o["ok"])
+    print(f"[nudges] send_bulk done sent={sent} failed={len(outcomes) - sent}")
+    return outcomes
+
+
 # Explicit admin notification helper
 def send_admin(text: str, category: str | None = None) -> str | None:
     """
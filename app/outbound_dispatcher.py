@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+class KeyedDispatcher:
+    """
+    Fixed pool of worker threads serving per-key FIFO queues.
+
+    Jobs for the same key run one at a time, in submission order, with at least
+    min_gap_sec between the end of one and the start of the next; different keys
+    run in parallel up to `workers`. Keys are scheduled through a single ready-time
+    heap, so an idle key costs nothing and a key's state is dropped once its queue
+    drains and its gap has elapsed: threads and memory stay flat however many keys
+    (destinations) are addressed.
+    """
+
+    def __init__(self, name: str, *, workers: int = 8, min_gap_sec: float = 0.0):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.min_gap_sec = max(0.0, float(min_gap_sec))
+        self._lock = threading.Lock()
+        # Workers wait on _cond for ready keys; drain() waits on _idle, so a
+        # schedule notify() always reaches a worker.
+        self._cond = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._queues: Dict[str, Deque[Tuple[Callable[[], Any], Future]]] = {}
+        self._ready: List[Tuple[float, int, str]] = []
+        self._scheduled: set[str] = set()
+        self._active: set[str] = set()
+        self._last_done: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0}
+
+    def _ensure_workers_locked(self) -> None:
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._run, name=f"{self.name}-{len(self._threads)}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _schedule_locked(self, key: str) -> None:
+        if key in self._scheduled or key in self._active or not self._queues.get(key):
+            return
+        ready_at = self._last_done.get(key, 0.0) + self.min_gap_sec
+        heapq.heappush(self._ready, (ready_at, next(self._seq), key))
+        self._scheduled.add(key)
+        self._cond.notify()
+
+    def submit(self, key: str, fn: Callable[[], Any]) -> Future:
+        fut: Future = Future()
+        with self._cond:
+            self._queues.setdefault(key, deque()).append((fn, fut))
+            self._stats["submitted"] += 1
+            self._ensure_workers_locked()
+            self._schedule_locked(key)
+        return fut
+
+    def _prune_locked(self, now: float) -> None:
+        # Forget gaps that have elapsed for keys with nothing queued.
+        if len(self._last_done) < 256:
+            return
+        horizon = now - self.min_gap_sec
+        for key in [k for k, done in self._last_done.items() if done <= horizon and k not in self._active]:
+            self._last_done.pop(key, None)
+
+    def _next_job(self) -> Tuple[str, Callable[[], Any], Future]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._ready and self._ready[0][0] <= now:
+                    _, _, key = heapq.heappop(self._ready)
+                    self._scheduled.discard(key)
+                    jobs = self._queues.get(key)
+                    if not jobs:
+                        self._queues.pop(key, None)
+                        continue
+                    fn, fut = jobs.popleft()
+                    self._active.add(key)
+                    return key, fn, fut
+                timeout = (self._ready[0][0] - now) if self._ready else None
+                self._cond.wait(timeout)
+
+    def _finish(self, key: str, outcome: str | None) -> None:
+        with self._cond:
+            if outcome is not None:
+                self._stats[outcome] += 1
+            now = time.monotonic()
+            self._active.discard(key)
+            self._last_done[key] = now
+            if self._queues.get(key):
+                self._schedule_locked(key)
+            else:
+                self._queues.pop(key, None)
+            self._prune_locked(now)
+            if not self._queues and not self._active:
+                self._idle.notify_all()
+
+    def drain(self, timeout: float) -> bool:
+        """Wait until every submitted job has run. Returns False if `timeout` elapses first."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            while self._queues or self._active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            key, fn, fut = self._next_job()
+            outcome = None
+            try:
+                if fut.set_running_or_notify_cancel():
+                    try:
+                        result = fn()
+                    except BaseException as e:
+                        outcome = "failed"
+                        fut.set_exception(e)
+                    else:
+                        outcome = "completed"
+                        fut.set_result(result)
+            except Exception as e:
+                print(f"[{self.name}] WARN: dispatch failed key={key}: {e!r}")
+            finally:
+                self._finish(key, outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queued = sum(len(q) for q in self._queues.values())
+            return {
+                **self._stats,
+                "queued": queued,
+                "queued_keys": len(self._queues),
+                "active_keys": len(self._active),
+                "tracked_gaps": len(self._last_done),
+                "workers": self.workers,
+                "live_workers": sum(1 for t in self._threads if t.is_alive()),
+                "min_gap_sec": self.min_gap_sec,
+            }
+
+
+# Interactive replies and bulk sweeps get separate worker pools, so a sweep parked
+# on the rate limiter or 429 backoff never holds the workers replies need.
+OUTBOUND_LANES = {
+    "interactive": ("outbound", "OUTBOUND_DISPATCH_WORKERS", 8),
+    "bulk": ("outbound-bulk", "OUTBOUND_BULK_WORKERS", 4),
+}
+
+_dispatchers: Dict[str, KeyedDispatcher] = {}
+_dispatcher_lock = threading.Lock()
+
+
+def outbound_lane_workers(lane: str) -> int:
+    _, env_name, default = OUTBOUND_LANES[lane]
+    return max(1, _env_int(env_name, default))
+
+
+def get_outbound_dispatcher(min_gap_sec: float, lane: str = "interactive") -> KeyedDispatcher:
+    """Process-wide dispatcher for outbound messages keyed by destination, one per lane."""
+    if lane not in OUTBOUND_LANES:
+        raise ValueError(f"unknown outbound lane: {lane!r}")
+    with _dispatcher_lock:
+        dispatcher = _dispatchers.get(lane)
+        if dispatcher is None:
+            dispatcher = _dispatchers[lane] = KeyedDispatcher(
+                OUTBOUND_LANES[lane][0],
+                workers=outbound_lane_workers(lane),
+                min_gap_sec=min_gap_sec,
+            )
+        return dispatcher
+
+
+def outbound_dispatcher_stats() -> Dict[str, Any]:
+    with _dispatcher_lock:
+        dispatchers = dict(_dispatchers)
+    return {
+        lane: dispatchers[lane].stats() if lane in dispatchers else {"workers": 0, "queued": 0}
+        for lane in OUTBOUND_LANES
+    }
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Hashable, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from .db import engine
+from .models import PromptCacheVersion
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    raw = (os.getenv(name) or "").strip().lower()
+    if not raw:
+        return default
+    return raw in {"1", "true", "yes", "on"}
+
+
+# Resolved prompt templates/settings (and per-user state overrides) only change on
+# admin writes, which bump the shared prompt_cache_version row. Each process reads
+# that row at most every PROMPT_CACHE_CHECK_SEC seconds and drops its cache when it
+# moves, so steady-state prompt assembly does not touch the database.
+PROMPT_CACHE_CHECK_SEC = max(0, _env_int("PROMPT_CACHE_CHECK_SEC", 5))
+PROMPT_CACHE_MAX_ENTRIES = max(1, _env_int("PROMPT_CACHE_MAX_ENTRIES", 4096))
+# Per-user entries grow with the user base, so they get their own LRU and cannot
+# evict the shared templates/settings.
+PROMPT_CACHE_MAX_USER_ENTRIES = max(1, _env_int("PROMPT_CACHE_MAX_USER_ENTRIES", 10000))
+
+_ROW_ID = 1
+_cache: "OrderedDict[Hashable, Any]" = OrderedDict()
+_user_cache: "OrderedDict[Hashable, Any]" = OrderedDict()
+_lock = threading.Lock()
+_generation = 0
+_seen_version: Optional[int] = None
+_checked_at = 0.0
+_table_ready = False
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "version_checks": 0}
+
+
+def ensure_prompt_cache_version_table() -> None:
+    global _table_ready
+    if _table_ready:
+        return
+    PromptCacheVersion.__table__.create(bind=engine, checkfirst=True)
+    _table_ready = True
+
+
+def _read_version() -> Optional[int]:
+    try:
+        ensure_prompt_cache_version_table()
+        with engine.connect() as conn:
+            val = conn.execute(
+                select(PromptCacheVersion.version).where(PromptCacheVersion.id == _ROW_ID)
+            ).scalar()
+        return int(val or 0)
+    except Exception as e:
+        print(f"[prompt_cache] WARN: version check failed: {e}")
+        return None
+
+
+def _clear_locked() -> None:
+    global _generation
+    _cache.clear()
+    _user_cache.clear()
+    _generation += 1
+    _stats["invalidations"] += 1
+
+
+def _sync_version() -> None:
+    global _seen_version, _checked_at
+    now = time.monotonic()
+    if _seen_version is not None and now - _checked_at < PROMPT_CACHE_CHECK_SEC:
+        return
+    _checked_at = now
+    _stats["version_checks"] += 1
+    version = _read_version()
+    if version is None:
+        # Can't confirm freshness: don't serve from cache until the check succeeds.
+        with _lock:
+            _clear_locked()
+            _seen_version = None
+        return
+    with _lock:
+        if version != _seen_version:
+            _clear_locked()
+            _seen_version = version
+
+
+def _cached(cache: "OrderedDict[Hashable, Any]", max_entries: int, key: Hashable, loader: Callable[[], Any]) -> Any:
+    if _env_flag("PROMPT_CACHE_DISABLED"):
+        return loader()
+    _sync_version()
+    with _lock:
+        if _seen_version is not None and key in cache:
+            cache.move_to_end(key)
+            _stats["hits"] += 1
+            return copy.deepcopy(cache[key])
+        gen = _generation
+    _stats["misses"] += 1
+    value = loader()
+    with _lock:
+        # Skip the store if an invalidation landed while we were loading.
+        if gen == _generation and _seen_version is not None:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > max_entries:
+                cache.popitem(last=False)
+    return copy.deepcopy(value)
+
+
+def cached_prompt_value(key: Hashable, loader: Callable[[], Any]) -> Any:
+    """
+    Return the cached value for key, calling loader() on a miss. Loader exceptions
+    propagate and are not cached. Callers get a deep copy, so mutation is safe.
+    """
+    return _cached(_cache, PROMPT_CACHE_MAX_ENTRIES, key, loader)
+
+
+def cached_user_prompt_value(key: Hashable, loader: Callable[[], Any]) -> Any:
+    """cached_prompt_value for per-user entries, kept in a separate bounded LRU."""
+    return _cached(_user_cache, PROMPT_CACHE_MAX_USER_ENTRIES, key, loader)
+
+
+def bump_prompt_cache_version() -> Optional[int]:
+    """
+    Invalidate prompt caches in this process immediately and in every other process
+    on its next version check. Call after committing template/settings/override writes.
+    """
+    global _seen_version, _checked_at
+    with _lock:
+        _clear_locked()
+        _seen_version = None
+    try:
+        ensure_prompt_cache_version_table()
+        with engine.begin() as conn:
+            res = conn.execute(
+                update(PromptCacheVersion)
+                .where(PromptCacheVersion.id == _ROW_ID)
+                .values(version=PromptCacheVersion.version + 1, updated_at=datetime.utcnow())
+            )
+            if not res.rowcount:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(
+                            PromptCacheVersion.__table__.insert().values(
+                                id=_ROW_ID, version=1, updated_at=datetime.utcnow()
+                            )
+                        )
+                except IntegrityError:
+                    # Another process created the row first; bump it instead.
+                    conn.execute(
+                        update(PromptCacheVersion)
+                        .where(PromptCacheVersion.id == _ROW_ID)
+                        .values(version=PromptCacheVersion.version + 1, updated_at=datetime.utcnow())
+                    )
+            version = conn.execute(
+                select(PromptCacheVersion.version).where(PromptCacheVersion.id == _ROW_ID)
+            ).scalar()
+    except Exception as e:
+        print(f"[prompt_cache] WARN: failed to bump version: {e}")
+        return None
+    with _lock:
+        _seen_version = int(version or 0)
+        _checked_at = time.monotonic()
+    return _seen_version
+
+
+def prompt_cache_stats() -> dict[str, Any]:
+    with _lock:
+        size = len(_cache)
+        user_size = len(_user_cache)
+        version = _seen_version
+    return {
+        **_stats,
+        "size": size,
+        "max_entries": PROMPT_CACHE_MAX_ENTRIES,
+        "user_size": user_size,
+        "max_user_entries": PROMPT_CACHE_MAX_USER_ENTRIES,
+        "version": version,
+        "check_interval_sec": PROMPT_CACHE_CHECK_SEC,
+    }
@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import copy
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+
+def _load_assessment_inputs(session: Session, user_id: int) -> Dict[str, Any]:
+    """Latest assessment scores, its programme start and the latest psych payload."""
+    from .models import AssessmentRun, PillarResult, PsychProfile
+
+    run = (
+        session.query(AssessmentRun)
+        .filter(AssessmentRun.user_id == user_id)
+        .order_by(AssessmentRun.id.desc())
+        .first()
+    )
+    pillars = (
+        session.query(PillarResult.pillar_key, PillarResult.overall)
+        .filter(PillarResult.run_id == run.id)
+        .order_by(PillarResult.id.asc())
+        .all()
+        if run is not None
+        else []
+    )
+    psych = (
+        session.query(PsychProfile)
+        .filter(PsychProfile.user_id == user_id)
+        .order_by(PsychProfile.completed_at.desc().nullslast(), PsychProfile.id.desc())
+        .first()
+    )
+    psych_payload: Dict[str, Any] = {}
+    if psych is not None:
+        psych_payload = {
+            "section_averages": getattr(psych, "section_averages", None),
+            "flags": getattr(psych, "flags", None),
+            "parameters": getattr(psych, "parameters", None),
+        }
+    return {
+        "scores": [{"pillar": pillar_key or "", "score": int(overall or 0)} for pillar_key, overall in pillars],
+        "programme_start": (
+            getattr(run, "finished_at", None) or getattr(run, "started_at", None) or getattr(run, "created_at", None)
+        ),
+        "psych_payload": psych_payload,
+    }
+
+
+class UserPromptContext:
+    """
+    Snapshot of the per-user data prompt builders read:
+
+    - KRs: one current_krs_context(max_krs=None) load per week_no; max_krs/primary/
+      by-pillar views are slices of it (select_top_krs_for_user only truncates by limit).
+    - Assessment inputs: latest pillar scores, programme start and psych payload.
+    - Tracker context: one daily_habits generation-context build per selected concept,
+      plus the coach-home history lines derived from it.
+
+    load() fetches the KRs and assessment inputs in one session (and optionally the
+    tracker context); prompt_context_scope(user_id=...) calls it when a request or job
+    opens its scope. Anything not preloaded is fetched on first use, and every later
+    reader in the scope shares it. Readers get deep copies.
+
+    Flushes of SessionLocal sessions inside the scope refresh the snapshot of each
+    user whose rows they write (see PromptContextSession); call refresh() yourself
+    after raw-SQL or bulk writes.
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = int(user_id)
+        self._krs: Dict[Optional[int], List[Dict[str, Any]]] = {}
+        self._assessment: Optional[Dict[str, Any]] = None
+        self._tracker: Dict[Optional[str], Dict[str, Any]] = {}
+        self._history_lines: Dict[Optional[str], List[str]] = {}
+
+    def refresh(self) -> None:
+        self._krs.clear()
+        self._assessment = None
+        self._tracker.clear()
+        self._history_lines.clear()
+
+    def load(self, *, week_no: Optional[int] = None, tracker: bool = False) -> "UserPromptContext":
+        from .db import SessionLocal
+        from .prompts import current_krs_context
+
+        with SessionLocal() as s:
+            if week_no not in self._krs:
+                ctx = current_krs_context(self.user_id, week_no=week_no, max_krs=None, session=s)
+                self._krs[week_no] = list(ctx.get("krs") or [])
+            if self._assessment is None:
+                self._assessment = _load_assessment_inputs(s, self.user_id)
+        if tracker:
+            self._tracker_entry(None)
+        return self
+
+    def _all_krs(self, week_no: Optional[int]) -> List[Dict[str, Any]]:
+        if week_no not in self._krs:
+            from .prompts import current_krs_context
+
+            ctx = current_krs_context(self.user_id, week_no=week_no, max_krs=None)
+            self._krs[week_no] = list(ctx.get("krs") or [])
+        return self._krs[week_no]
+
+    def krs(self, week_no: Optional[int] = None, max_krs: Optional[int] = 3) -> List[Dict[str, Any]]:
+        rows = self._all_krs(week_no)
+        return copy.deepcopy(rows if max_krs is None else rows[:max_krs])
+
+    def primary_kr(self, week_no: Optional[int] = None) -> Dict[str, Any]:
+        rows = self.krs(week_no=week_no, max_krs=1)
+        return rows[0] if rows else {}
+
+    def krs_by_pillar(self, week_no: Optional[int] = None, max_krs: Optional[int] = 3) -> Dict[str, List[Dict[str, Any]]]:
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        for kr in self.krs(week_no=week_no, max_krs=max_krs):
+            out.setdefault(kr["pillar"], []).append(
+                {
+                    "description": kr.get("description"),
+                    "target": kr.get("target"),
+                    "actual": kr.get("actual"),
+                    "habit_steps": kr.get("habit_steps") or [],
+                }
+            )
+        return out
+
+    def _assessment_inputs(self) -> Dict[str, Any]:
+        if self._assessment is None:
+            from .db import SessionLocal
+
+            with SessionLocal() as s:
+                self._assessment = _load_assessment_inputs(s, self.user_id)
+        return self._assessment
+
+    def scores(self) -> List[Dict[str, Any]]:
+        """[{"pillar": ..., "score": ...}] from the latest assessment run."""
+        return copy.deepcopy(self._assessment_inputs()["scores"])
+
+    def psych_payload(self) -> Dict[str, Any]:
+        return copy.deepcopy(self._assessment_inputs()["psych_payload"])
+
+    def programme_start(self) -> Optional[datetime]:
+        return self._assessment_inputs()["programme_start"]
+
+    def _tracker_entry(self, selected_concept_key: Optional[str]) -> Dict[str, Any]:
+        if selected_concept_key not in self._tracker:
+            from .daily_habits import _build_generation_context, _context_hash
+
+            context = _build_generation_context(self.user_id, selected_concept_key=selected_concept_key)
+            self._tracker[selected_concept_key] = {"context": context, "context_hash": _context_hash(context)}
+        return self._tracker[selected_concept_key]
+
+    def tracker_snapshot(self, selected_concept_key: Optional[str] = None) -> Dict[str, Any]:
+        """{"context": ..., "context_hash": ...} as built by daily_habits."""
+        return copy.deepcopy(self._tracker_entry(selected_concept_key))
+
+    def tracker_context(self, selected_concept_key: Optional[str] = None) -> Dict[str, Any]:
+        return self.tracker_snapshot(selected_concept_key)["context"]
+
+    def history_lines(self, selected_concept_key: Optional[str] = None) -> List[str]:
+        """Coach-home history lines for the tracker context (no habit steps)."""
+        if selected_concept_key not in self._history_lines:
+            from .prompts import _coach_home_history_lines
+
+            context = self._tracker_entry(selected_concept_key)["context"]
+            self._history_lines[selected_concept_key] = _coach_home_history_lines(context, include_habit_steps=False)
+        return list(self._history_lines[selected_concept_key])
+
+
+_SCOPE: ContextVar[Optional[Dict[int, UserPromptContext]]] = ContextVar("prompt_context_scope", default=None)
+
+
+@contextmanager
+def prompt_context_scope(
+    *contexts: UserPromptContext,
+    user_id: Optional[int] = None,
+    tracker: bool = False,
+) -> Iterator[None]:
+    """
+    Memoise UserPromptContext per user for the duration of a request/job. With user_id
+    the user's prompt inputs are loaded up front (tracker=True adds the daily tracker
+    context). Nested scopes share the outer scope's snapshots; explicit contexts are
+    registered on it.
+    """
+    current = _SCOPE.get()
+    scope = current if current is not None else {}
+    for ctx in contexts:
+        scope.setdefault(ctx.user_id, ctx)
+    if user_id is not None and int(user_id) not in scope:
+        ctx = UserPromptContext(int(user_id))
+        try:
+            ctx.load(tracker=tracker)
+        except Exception as e:
+            # Whatever failed is retried on first use.
+            print(f"[prompt_context] WARN: preload failed user_id={user_id}: {e}")
+        scope[ctx.user_id] = ctx
+    if current is not None:
+        yield
+        return
+    token = _SCOPE.set(scope)
+    try:
+        yield
+    finally:
+        _SCOPE.reset(token)
+
+
+def active_prompt_context(user_id: int) -> Optional[UserPromptContext]:
+    """The scope's snapshot for user_id (created on first use), or None outside a scope."""
+    scope = _SCOPE.get()
+    if scope is None:
+        return None
+    key = int(user_id)
+    ctx = scope.get(key)
+    if ctx is None:
+        ctx = scope[key] = UserPromptContext(key)
+    return ctx
+
+
+def get_user_prompt_context(user_id: int) -> UserPromptContext:
+    """Scope-shared snapshot when inside prompt_context_scope, else a fresh one."""
+    return active_prompt_context(user_id) or UserPromptContext(user_id)
+
+
+# Append-only audit/log tables: writing them never changes what prompts read.
+_NON_CONTEXT_TABLES = {
+    "llm_prompt_logs",
+    "usage_events",
+    "message_logs",
+    "job_audits",
+    "background_jobs",
+}
+
+
+def _refresh_scope_on_write(scope: Dict[int, UserPromptContext], written: Iterable[Any]) -> None:
+    refresh_all = False
+    user_ids: set[int] = set()
+    for obj in written:
+        if getattr(obj, "__tablename__", None) in _NON_CONTEXT_TABLES:
+            continue
+        uid = getattr(obj, "user_id", None)
+        if uid is None:
+            uid = getattr(obj, "owner_user_id", None)
+        if isinstance(uid, int):
+            user_ids.add(uid)
+        else:
+            # e.g. OKR key results / habit steps, keyed by objective rather than user.
+            refresh_all = True
+            break
+    for uid, ctx in scope.items():
+        if refresh_all or uid in user_ids:
+            ctx.refresh()
+
+
+class PromptContextSession(Session):
+    """
+    SessionLocal's session class. A flush made while a prompt_context_scope is active
+    refreshes the scope's snapshots for the users whose rows it wrote; outside a scope
+    flush is unchanged.
+    """
+
+    def flush(self, objects=None) -> None:
+        scope = _SCOPE.get()
+        if not scope:
+            return super().flush(objects)
+        written = [*self.new, *self.dirty, *self.deleted]
+        super().flush(objects)
+        if written:
+            _refresh_scope_on_write(scope, written)
@@ -25,11 +25,12 @@ Callers should pass data only; keep LLM instructions here for reviewability.
 """
 from __future__ import annotations
 
+import asyncio
 import json
 import os
 import socket
 import threading
-from datetime import datetime, timedelta
+import time
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 
@@ -43,8 +44,21 @@ from .focus import select_top_krs_for_user
 from .job_queue import enqueue_job, should_use_worker, ensure_prompt_settings_schema
 from .models import OKRKeyResult, OKRObjective, OKRKrHabitStep, PromptTemplate, PromptSettings
 from . import llm as shared_llm
-from .models import LLMPromptLog, UsageEvent
+from . import llm_gateway
+from .llm_cache import (
+    cache_ttl_for_touchpoint,
+    cached_llm_text,
+    get_cached_response,
+    response_cache_key,
+    store_cached_response,
+)
+from .models import LLMPromptLog, UserPreference
+from .prompt_cache import bump_prompt_cache_version, cached_prompt_value, cached_user_prompt_value
+from .prompt_context import UserPromptContext, active_prompt_context, prompt_context_scope
+from .llm_stream import TokenSink, active_stream_sink
+from .buffered_writer import BufferedBatchWriter
 from .usage import log_usage_event, estimate_tokens, estimate_llm_cost
+from .token_budget import daily_token_limit, daily_token_limit_reached, record_llm_tokens
 
 PROMPT_STATE_ALIASES = {"production": "live", "stage": "beta"}
 PROMPT_STATE_ORDER = ["live", "beta", "develop"]
@@ -830,6 +844,9 @@ def _merge_template_meta(meta: Optional[Dict[str, Any]], template: Optional[Dict
         model_override = str(template.get("model_override") or "").strip() if isinstance(template, dict) else ""
         if model_override:
             merged["template_model_override"] = model_override
+        response_format = str(template.get("response_format") or "").strip() if isinstance(template, dict) else ""
+        if response_format:
+            merged["template_response_format"] = response_format
     return merged
 
 
@@ -912,37 +929,65 @@ def _template_prompt_with_data(
     return assembly
 
 
+def _template_row_payload(row: PromptTemplate) -> Dict[str, Any]:
+    return {
+        "task_block": getattr(row, "task_block", None),
+        "block_order": getattr(row, "block_order", None),
+        "include_blocks": getattr(row, "include_blocks", None),
+        "okr_scope": getattr(row, "okr_scope", None),
+        "programme_scope": getattr(row, "programme_scope", None),
+        "response_format": getattr(row, "response_format", None),
+        "model_override": getattr(row, "model_override", None),
+        "state": _canonical_state(getattr(row, "state", None)),
+        "version": getattr(row, "version", None),
+    }
+
+
+def _query_prompt_template(touchpoint: str) -> Optional[Dict[str, Any]]:
+    _ensure_prompt_template_schema()
+    with SessionLocal() as s:
+        row = (
+            s.query(PromptTemplate)
+            .filter(PromptTemplate.touchpoint == touchpoint, PromptTemplate.is_active == True)
+            .order_by(
+                _state_priority_expr(),
+                PromptTemplate.version.desc(),
+                PromptTemplate.id.desc(),
+            )
+            .first()
+        )
+        return _template_row_payload(row) if row else None
+
+
+def _query_prompt_template_with_state(touchpoint: str, target_state: str) -> Optional[Dict[str, Any]]:
+    _ensure_prompt_template_schema()
+    with SessionLocal() as s:
+        row = (
+            s.query(PromptTemplate)
+            .filter(
+                PromptTemplate.touchpoint == touchpoint,
+                PromptTemplate.is_active == True,
+                PromptTemplate.state.in_(
+                    [
+                        target_state,
+                        "stage" if target_state == "beta" else target_state,
+                        "production" if target_state == "live" else target_state,
+                    ]
+                ),
+            )
+            .order_by(PromptTemplate.version.desc(), PromptTemplate.id.desc())
+            .first()
+        )
+        return _template_row_payload(row) if row else None
+
+
 def _load_prompt_template(touchpoint: str) -> Optional[Dict[str, Any]]:
     """
     Fetch a prompt template row for this touchpoint (if any), preferring live > beta > develop.
+    Served from the prompt cache (see prompt_cache.py) after the first load.
     """
     try:
-        _ensure_prompt_template_schema()
-        with SessionLocal() as s:
-            row = (
-                s.query(PromptTemplate)
-                .filter(PromptTemplate.touchpoint == touchpoint, PromptTemplate.is_active == True)
-                .order_by(
-                    _state_priority_expr(),
-                    PromptTemplate.version.desc(),
-                    PromptTemplate.id.desc(),
-                )
-                .first()
-            )
-            if not row:
-                return None
-            state_val = _canonical_state(getattr(row, "state", None))
-            return {
-                "task_block": getattr(row, "task_block", None),
-                "block_order": getattr(row, "block_order", None),
-                "include_blocks": getattr(row, "include_blocks", None),
-                "okr_scope": getattr(row, "okr_scope", None),
-                "programme_scope": getattr(row, "programme_scope", None),
-                "response_format": getattr(row, "response_format", None),
-                "model_override": getattr(row, "model_override", None),
-                "state": state_val,
-                "version": getattr(row, "version", None),
-            }
+        return cached_prompt_value(("template", touchpoint, None), lambda: _query_prompt_template(touchpoint))
     except Exception as e:
         print(f"[prompts] WARN: failed to load prompt template for {touchpoint}: {e}")
         return None
@@ -954,40 +999,31 @@ def _load_prompt_template_with_state(touchpoint: str, state: str) -> Optional[Di
     """
     target_state = _canonical_state(state)
     try:
-        _ensure_prompt_template_schema()
+        template = cached_prompt_value(
+            ("template", touchpoint, target_state),
+            lambda: _query_prompt_template_with_state(touchpoint, target_state),
+        )
+    except Exception:
+        template = None
+    return template if template else _load_prompt_template(touchpoint)
+
+
+def _load_user_prompt_state_override(user_id: int) -> Optional[str]:
+    """Per-user prompt_state_override preference (live|beta|develop), cached like templates."""
+    def _query() -> Optional[str]:
         with SessionLocal() as s:
-            row = (
-                s.query(PromptTemplate)
-                .filter(
-                    PromptTemplate.touchpoint == touchpoint,
-                    PromptTemplate.is_active == True,
-                    PromptTemplate.state.in_(
-                        [
-                            target_state,
-                            "stage" if target_state == "beta" else target_state,
-                            "production" if target_state == "live" else target_state,
-                        ]
-                    ),
-                )
-                .order_by(PromptTemplate.version.desc(), PromptTemplate.id.desc())
+            pref = (
+                s.query(UserPreference)
+                .filter(UserPreference.user_id == user_id, UserPreference.key == "prompt_state_override")
                 .first()
             )
-            if not row:
-                return _load_prompt_template(touchpoint)
-            state_val = _canonical_state(getattr(row, "state", None))
-            return {
-                "task_block": getattr(row, "task_block", None),
-                "block_order": getattr(row, "block_order", None),
-                "include_blocks": getattr(row, "include_blocks", None),
-                "okr_scope": getattr(row, "okr_scope", None),
-                "programme_scope": getattr(row, "programme_scope", None),
-                "response_format": getattr(row, "response_format", None),
-                "model_override": getattr(row, "model_override", None),
-                "state": state_val,
-                "version": getattr(row, "version", None),
-            }
+            value = (pref.value or "").strip().lower() if pref else ""
+            return value if value in {"live", "beta", "develop"} else None
+
+    try:
+        return cached_user_prompt_value(("state_override", user_id), _query)
     except Exception:
-        return _load_prompt_template(touchpoint)
+        return None
 
 
 def ensure_builtin_prompt_templates(touchpoints: List[str] | None = None) -> int:
@@ -1053,41 +1089,47 @@ def ensure_builtin_prompt_templates(touchpoints: List[str] | None = None) -> int
                 if created:
                     s.commit()
             _BUILTIN_PROMPT_TEMPLATES_READY.update(missing)
+        if created:
+            bump_prompt_cache_version()
         return created
     except Exception as e:
         print(f"[prompts] WARN: failed to ensure builtin prompt templates: {e}")
         return 0
 
 
-def _load_prompt_settings() -> Dict[str, Any]:
-    """
-    Load global prompt settings (singleton). Falls back to defaults if missing.
-    """
-    defaults = {
+def _query_prompt_settings() -> Dict[str, Any]:
+    ensure_prompt_settings_schema()
+    with SessionLocal() as s:
+        row = s.query(PromptSettings).order_by(PromptSettings.id.asc()).first()
+        if not row:
+            return _default_prompt_settings()
+        order = getattr(row, "default_block_order", None) or DEFAULT_PROMPT_BLOCK_ORDER
+        order = [b for b in order if b not in _BANNED_BLOCKS]
+        return {
+            "system_block": getattr(row, "system_block", None),
+            "locale_block": getattr(row, "locale_block", None),
+            "default_block_order": order or DEFAULT_PROMPT_BLOCK_ORDER,
+        }
+
+
+def _default_prompt_settings() -> Dict[str, Any]:
+    return {
         "system_block": None,
         "locale_block": None,
         "default_block_order": DEFAULT_PROMPT_BLOCK_ORDER,
     }
+
+
+def _load_prompt_settings() -> Dict[str, Any]:
+    """
+    Load global prompt settings (singleton). Falls back to defaults if missing.
+    Served from the prompt cache (see prompt_cache.py) after the first load.
+    """
     try:
-        ensure_prompt_settings_schema()
-    except Exception:
-        return defaults
-    try:
-        with SessionLocal() as s:
-            row = s.query(PromptSettings).order_by(PromptSettings.id.asc()).first()
-            if not row:
-                return defaults
-            order = getattr(row, "default_block_order", None) or DEFAULT_PROMPT_BLOCK_ORDER
-            order = [b for b in order if b not in _BANNED_BLOCKS]
-            data = {
-                "system_block": getattr(row, "system_block", None),
-                "locale_block": getattr(row, "locale_block", None),
-                "default_block_order": order or DEFAULT_PROMPT_BLOCK_ORDER,
-            }
-            return data
+        return cached_prompt_value(("settings",), _query_prompt_settings)
     except Exception as e:
         print(f"[prompts] WARN: failed to load prompt settings: {e}")
-        return defaults
+        return _default_prompt_settings()
 
 
 def _prompt_assembly(
@@ -1490,6 +1532,9 @@ def kr_payload_list(
     session: Optional[Session] = None,
 ) -> List[Dict[str, Any]]:
     """Convenience wrapper: list of KR payload dicts for prompts."""
+    snapshot = active_prompt_context(user_id) if session is None else None
+    if snapshot is not None:
+        return snapshot.krs(week_no=week_no, max_krs=max_krs)
     ctx = current_krs_context(user_id, week_no=week_no, max_krs=max_krs, session=session)
     return ctx.get("krs", [])
 
@@ -1500,6 +1545,9 @@ def primary_kr_payload(
     session: Optional[Session] = None,
 ) -> Dict[str, Any]:
     """Convenience wrapper: single primary KR payload dict (or empty dict)."""
+    snapshot = active_prompt_context(user_id) if session is None else None
+    if snapshot is not None:
+        return snapshot.primary_kr(week_no=week_no)
     ctx = current_krs_context(user_id, week_no=week_no, max_krs=1, session=session)
     return ctx.get("primary_kr") or {}
 
@@ -1511,6 +1559,9 @@ def okrs_by_pillar_payload(
     session: Optional[Session] = None,
 ) -> Dict[str, List[str]]:
     """Convenience wrapper: pillar→KR descriptions mapping for podcast prompts."""
+    snapshot = active_prompt_context(user_id) if session is None else None
+    if snapshot is not None:
+        return snapshot.krs_by_pillar(week_no=week_no, max_krs=max_krs)
     ctx = current_krs_context(user_id, week_no=week_no, max_krs=max_krs, session=session)
     return ctx.get("krs_by_pillar", {})
 
@@ -1550,6 +1601,7 @@ def build_prompt(
     user_name: str,
     locale: str = "UK",
     use_state: Optional[str] = None,
+    prompt_context: Optional[UserPromptContext] = None,
     **data,
 ) -> PromptAssembly:
     """
@@ -1559,7 +1611,24 @@ def build_prompt(
     - initial_habit_steps_generator
     - assessment_okr_structured
     - daily_habit_plan
+
+    KR lookups go through the user's UserPromptContext when one is passed or a
+    prompt_context_scope is active, so they share a single load. Callers take scores,
+    psych payload and tracker history lines from the same snapshot.
     """
+    with prompt_context_scope(*([prompt_context] if prompt_context is not None else [])):
+        return _build_prompt(touchpoint, user_id, coach_name, user_name, locale, use_state, **data)
+
+
+def _build_prompt(
+    touchpoint: str,
+    user_id: int,
+    coach_name: str,
+    user_name: str,
+    locale: str = "UK",
+    use_state: Optional[str] = None,
+    **data,
+) -> PromptAssembly:
     tp = touchpoint.lower()
     # Legacy alias: keep old touchpoint key working while live templates are migrated.
     if tp == "sunday_actions":
@@ -1569,17 +1638,7 @@ def build_prompt(
     settings = _load_prompt_settings()
     preferred_state = _canonical_state(use_state or "live")
     if preferred_state in {"live", None}:
-        try:
-            with SessionLocal() as s:
-                pref = (
-                    s.query(UserPreference)
-                    .filter(UserPreference.user_id == user_id, UserPreference.key == "prompt_state_override")
-                    .first()
-                )
-                if pref and (pref.value or "").strip().lower() in {"live", "beta", "develop"}:
-                    preferred_state = (pref.value or "").strip().lower()
-        except Exception:
-            pass
+        preferred_state = _load_user_prompt_state_override(user_id) or preferred_state
     template = _load_prompt_template(tp) if not preferred_state else _load_prompt_template_with_state(tp, preferred_state)
     if tp == "podcast_weekstart":
         scores = data.get("scores", [])
@@ -1833,8 +1892,10 @@ def build_prompt(
             okr_txt, okr_meta = okr_block_with_scope(okr_scope, krs)
         history_lines: List[str] = []
         if tracker_summary_mode:
-            tracker_context = data.get("tracker_context") or {}
-            history_lines.extend(_coach_home_history_lines(tracker_context, include_habit_steps=False))
+            tracker_lines = data.get("tracker_history_lines")
+            if tracker_lines is None:
+                tracker_lines = _coach_home_history_lines(data.get("tracker_context") or {}, include_habit_steps=False)
+            history_lines.extend(tracker_lines)
         if history and not tracker_summary_mode:
             history_lines.extend(history.splitlines())
         history_label = (
@@ -2402,55 +2463,13 @@ def build_prompt(
     raise ValueError(f"Unsupported touchpoint: {touchpoint}")
 
 
-def run_llm_prompt(
-    prompt: str,
-    user_id: Optional[int] = None,
-    touchpoint: Optional[str] = None,
-    model: Optional[str] = None,
-    context_meta: Optional[Dict[str, Any]] = None,
-    prompt_variant: Optional[str] = None,
-    task_label: Optional[str] = None,
-    prompt_blocks: Optional[Dict[str, str]] = None,
-    block_order: Optional[List[str]] = None,
-    log: Optional[bool] = None,
-) -> str:
-    """
-    Invoke the shared LLM client and optionally log the prompt/preview to DB.
-    Logging is controlled via the `log` flag OR env LOG_LLM_PROMPTS=true.
-    """
-    limit_raw = (os.getenv("MAX_DAILY_LLM_TOKENS") or "").strip()
-    limit_val = None
-    if limit_raw:
-        try:
-            limit_val = int(float(limit_raw))
-        except Exception:
-            limit_val = None
-    if limit_val and limit_val > 0:
-        est_tokens = estimate_tokens(prompt)
-        try:
-            now = datetime.utcnow()
-            day_start = datetime(now.year, now.month, now.day)
-            day_end = day_start + timedelta(days=1)
-            with SessionLocal() as s:
-                q = s.query(func.coalesce(func.sum(UsageEvent.units), 0.0)).filter(
-                    UsageEvent.product == "llm",
-                    UsageEvent.unit_type.in_(["tokens_in", "tokens_out"]),
-                    UsageEvent.created_at >= day_start,
-                    UsageEvent.created_at < day_end,
-                )
-                if user_id is not None:
-                    q = q.filter(UsageEvent.user_id == user_id)
-                used_tokens = float(q.scalar() or 0.0)
-        except Exception as e:
-            used_tokens = None
-            print(f"[prompts] daily token limit check failed: {e}")
-        if used_tokens is not None and (used_tokens + est_tokens) > limit_val:
-            scope = f"user_id={user_id}" if user_id is not None else "global"
-            print(
-                f"[prompts] daily token limit reached ({scope}): "
-                f"used={int(used_tokens)} + est={est_tokens} > limit={limit_val}"
-            )
-            return ""
+def _daily_token_limit_reached(prompt: str, user_id: Optional[int]) -> bool:
+    if daily_token_limit() is None:
+        return False
+    return daily_token_limit_reached(estimate_tokens(prompt), user_id)
+
+
+def _effective_prompt_model(model: Optional[str], prompt_blocks: Optional[Dict[str, str]]) -> Optional[str]:
     template_model = ""
     if isinstance(prompt_blocks, dict):
         for key in ("template_model_override", "model_override"):
@@ -2461,25 +2480,31 @@ def run_llm_prompt(
             if cand:
                 template_model = cand
                 break
-    effective_model = (model or "").strip() or template_model or None
+    return (model or "").strip() or template_model or None
 
-    client = shared_llm.get_llm_client(touchpoint=touchpoint, model_override=effective_model)
-    content = ""
-    duration = None
-    model_name = shared_llm.resolve_model_name_for_touchpoint(touchpoint=touchpoint, model_override=effective_model)
-    if client:
-        try:
-            import time
-            t0 = time.perf_counter()
-            resp = client.invoke(prompt)
-            duration = time.perf_counter() - t0
-            content = _coerce_llm_content(getattr(resp, "content", None)).strip()
-        except Exception as e:
-            print(f"[prompts] LLM invoke failed for touchpoint={touchpoint}: {e}")
-            content = ""
-    else:
-        print(f"[prompts] LLM client missing; skipping invoke for touchpoint={touchpoint}")
 
+def _prompt_response_format(prompt_blocks: Optional[Dict[str, str]]) -> Optional[str]:
+    if not isinstance(prompt_blocks, dict):
+        return None
+    val = prompt_blocks.get("template_response_format") or prompt_blocks.get("response_format")
+    return str(val).strip() or None if val is not None else None
+
+
+def _finish_llm_prompt(
+    *,
+    prompt: str,
+    content: str,
+    duration: Optional[float],
+    model_name: str,
+    user_id: Optional[int],
+    touchpoint: Optional[str],
+    context_meta: Optional[Dict[str, Any]],
+    prompt_variant: Optional[str],
+    task_label: Optional[str],
+    prompt_blocks: Optional[Dict[str, str]],
+    block_order: Optional[List[str]],
+    log: Optional[bool],
+) -> None:
     env_val = os.getenv("LOG_LLM_PROMPTS")
     env_flag = True if env_val is None else env_val.lower() in {"1", "true", "yes", "on"}
     should_log = env_flag if log is None else bool(log)
@@ -2500,6 +2525,165 @@ def run_llm_prompt(
         )
     elif should_log and not touchpoint:
         print(f"[prompts] logging skipped: touchpoint not provided for user_id={user_id}")
+
+
+def _invoke_streaming(prompt: str, model_name: str, touchpoint: Optional[str], sink: TokenSink) -> str:
+    parts: List[str] = []
+    live_sink: Optional[TokenSink] = sink
+    for delta in llm_gateway.stream(prompt, model=model_name):
+        parts.append(delta)
+        if live_sink is None:
+            continue
+        try:
+            live_sink(touchpoint, delta)
+        except Exception as e:
+            # A gone-away listener must not cost us the reply; keep assembling it.
+            print(f"[prompts] stream sink failed touchpoint={touchpoint}: {e}")
+            live_sink = None
+    return "".join(parts).strip()
+
+
+def run_llm_prompt(
+    prompt: str,
+    user_id: Optional[int] = None,
+    touchpoint: Optional[str] = None,
+    model: Optional[str] = None,
+    context_meta: Optional[Dict[str, Any]] = None,
+    prompt_variant: Optional[str] = None,
+    task_label: Optional[str] = None,
+    prompt_blocks: Optional[Dict[str, str]] = None,
+    block_order: Optional[List[str]] = None,
+    log: Optional[bool] = None,
+) -> str:
+    """
+    Invoke the LLM through the pooled gateway and optionally log the prompt/preview to DB.
+    Logging is controlled via the `log` flag OR env LOG_LLM_PROMPTS=true.
+    Touchpoints that opt in to the response cache (llm_cache) skip the call and the
+    token spend when an identical prompt was answered before; the hit is still logged,
+    flagged response_cache_hit in context_meta.
+    """
+    if _daily_token_limit_reached(prompt, user_id):
+        return ""
+    effective_model = _effective_prompt_model(model, prompt_blocks)
+    model_name = shared_llm.resolve_model_name_for_touchpoint(touchpoint=touchpoint, model_override=effective_model)
+    content = ""
+    duration = None
+    cache_hit = False
+    response_format = _prompt_response_format(prompt_blocks)
+    # Inside llm_stream_context (e.g. the app chat SSE endpoint) text replies stream
+    # token by token; JSON responses aren't user-facing prose, so they never stream.
+    sink = active_stream_sink() if (response_format or "").lower() != "json" else None
+    try:
+        t0 = time.perf_counter()
+
+        def _invoke() -> str:
+            if sink is not None:
+                return _invoke_streaming(prompt, model_name, touchpoint, sink)
+            resp = llm_gateway.invoke(prompt, model=model_name)
+            return _coerce_llm_content(getattr(resp, "content", None)).strip()
+
+        content, cache_hit = cached_llm_text(
+            prompt,
+            model=model_name,
+            touchpoint=touchpoint,
+            invoke=_invoke,
+            response_format=response_format,
+        )
+        duration = time.perf_counter() - t0
+    except Exception as e:
+        print(f"[prompts] LLM invoke failed for touchpoint={touchpoint}: {e}")
+        content = ""
+    if cache_hit:
+        print(f"[prompts] LLM response cache hit touchpoint={touchpoint} user_id={user_id}")
+        context_meta = {**(context_meta or {}), "response_cache_hit": True}
+
+    _finish_llm_prompt(
+        prompt=prompt,
+        content=content,
+        duration=duration,
+        model_name=model_name,
+        user_id=user_id,
+        touchpoint=touchpoint,
+        context_meta=context_meta,
+        prompt_variant=prompt_variant,
+        task_label=task_label,
+        prompt_blocks=prompt_blocks,
+        block_order=block_order,
+        log=log,
+    )
+    return content
+
+
+async def arun_llm_prompt(
+    prompt: str,
+    user_id: Optional[int] = None,
+    touchpoint: Optional[str] = None,
+    model: Optional[str] = None,
+    context_meta: Optional[Dict[str, Any]] = None,
+    prompt_variant: Optional[str] = None,
+    task_label: Optional[str] = None,
+    prompt_blocks: Optional[Dict[str, str]] = None,
+    block_order: Optional[List[str]] = None,
+    log: Optional[bool] = None,
+) -> str:
+    """
+    Async run_llm_prompt: the LLM call is awaited on the gateway (no thread per prompt);
+    the budget check and prompt logging still hit the DB, so they run off-loop.
+    """
+    if await asyncio.to_thread(_daily_token_limit_reached, prompt, user_id):
+        return ""
+    effective_model = _effective_prompt_model(model, prompt_blocks)
+    model_name = shared_llm.resolve_model_name_for_touchpoint(touchpoint=touchpoint, model_override=effective_model)
+    content = ""
+    duration = None
+    cache_ttl = cache_ttl_for_touchpoint(touchpoint)
+    cache_key = (
+        response_cache_key(model_name, prompt, _prompt_response_format(prompt_blocks)) if cache_ttl > 0 else None
+    )
+    cached = None
+    if cache_key:
+        t0 = time.perf_counter()
+        cached = await asyncio.to_thread(get_cached_response, cache_key)
+        if cached is not None:
+            print(f"[prompts] LLM response cache hit touchpoint={touchpoint} user_id={user_id}")
+            duration = time.perf_counter() - t0
+            content = cached
+            context_meta = {**(context_meta or {}), "response_cache_hit": True}
+    if cached is None:
+        try:
+            t0 = time.perf_counter()
+            resp = await llm_gateway.ainvoke(prompt, model=model_name)
+            duration = time.perf_counter() - t0
+            content = _coerce_llm_content(getattr(resp, "content", None)).strip()
+        except Exception as e:
+            print(f"[prompts] LLM invoke failed for touchpoint={touchpoint}: {e}")
+            content = ""
+    if cache_key and content and cached is None:
+        await asyncio.to_thread(
+            store_cached_response,
+            cache_key,
+            content,
+            model=model_name,
+            touchpoint=touchpoint,
+            ttl_seconds=cache_ttl,
+            response_format=_prompt_response_format(prompt_blocks),
+        )
+
+    await asyncio.to_thread(
+        _finish_llm_prompt,
+        prompt=prompt,
+        content=content,
+        duration=duration,
+        model_name=model_name,
+        user_id=user_id,
+        touchpoint=touchpoint,
+        context_meta=context_meta,
+        prompt_variant=prompt_variant,
+        task_label=task_label,
+        prompt_blocks=prompt_blocks,
+        block_order=block_order,
+        log=log,
+    )
     return content
 
 
@@ -2628,8 +2812,9 @@ def run_llm_prompt_or_enqueue(
 
 
 def _should_async_log(touchpoint: str | None) -> bool:
-    env_flag = (os.getenv("PROMPT_LOG_ASYNC") or "").strip().lower() in {"1", "true", "yes"}
-    if env_flag:
+    raw = (os.getenv("PROMPT_LOG_ASYNC") or "").strip().lower()
+    if raw not in {"0", "false", "no", "off"}:
+        # Default: every touchpoint goes through the buffered writer.
         return True
     if not touchpoint:
         return False
@@ -2637,6 +2822,48 @@ def _should_async_log(touchpoint: str | None) -> bool:
     return key.startswith("podcast_") or key in {"kickoff", "weekstart", "weekstart_podcast"}
 
 
+def _prompt_log_env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+def _write_llm_prompt_log_batch(batch: List[tuple]) -> int:
+    entries: List[Dict[str, Any]] = []
+    for args in batch:
+        try:
+            entries.append(_prepare_llm_prompt_log(*args))
+        except Exception as e:
+            print(f"[prompts] failed to log LLM prompt ({args[1]}): {e}")
+    return _write_llm_prompt_logs(entries)
+
+
+# One background writer per process; prompt logs (and their usage events) are
+# inserted in batches off the request path. When the buffer stays full for
+# PROMPT_LOG_BLOCK_MS the caller writes inline (PROMPT_LOG_OVERFLOW=sync, default)
+# or the row is dropped and counted (PROMPT_LOG_OVERFLOW=drop).
+_PROMPT_LOG_WRITER = BufferedBatchWriter(
+    "prompt_log",
+    _write_llm_prompt_log_batch,
+    max_queue=_prompt_log_env_int("PROMPT_LOG_QUEUE_SIZE", 2000),
+    batch_size=_prompt_log_env_int("PROMPT_LOG_BATCH_SIZE", 50),
+    linger_ms=_prompt_log_env_int("PROMPT_LOG_FLUSH_MS", 250),
+    block_ms=_prompt_log_env_int("PROMPT_LOG_BLOCK_MS", 50),
+    shutdown_timeout_sec=_prompt_log_env_int("PROMPT_LOG_SHUTDOWN_FLUSH_SEC", 10),
+)
+_prompt_log_overflow = {"inline": 0, "dropped": 0}
+
+
+def flush_llm_prompt_logs(timeout: Optional[float] = None) -> bool:
+    """Block until buffered prompt logs are written (call on shutdown)."""
+    return _PROMPT_LOG_WRITER.flush(timeout)
+
+
+def llm_prompt_log_writer_stats() -> Dict[str, Any]:
+    return {**_PROMPT_LOG_WRITER.stats(), "overflow_inline": _prompt_log_overflow["inline"], "overflow_dropped": _prompt_log_overflow["dropped"]}
+
+
 def log_llm_prompt(
     user_id: Optional[int],
     touchpoint: str,
@@ -2654,38 +2881,28 @@ def log_llm_prompt(
     Persist the prompt sent to the LLM (optional response preview) with structured blocks.
     Enable by calling explicitly where needed; kept separate from run_llm_prompt for control.
     """
-    if _should_async_log(touchpoint):
-        threading.Thread(
-            target=_log_llm_prompt_sync,
-            args=(
-                user_id,
-                touchpoint,
-                prompt_text,
-                model,
-                duration_ms,
-                response_preview,
-                context_meta,
-                prompt_variant,
-                task_label,
-                prompt_blocks,
-                block_order,
-            ),
-            daemon=True,
-        ).start()
-        return
-    _log_llm_prompt_sync(
+    args = (
         user_id,
         touchpoint,
         prompt_text,
         model,
         duration_ms,
         response_preview,
-        context_meta,
+        # Shallow copies: the caller may reuse these after we return.
+        dict(context_meta) if isinstance(context_meta, dict) else context_meta,
         prompt_variant,
         task_label,
-        prompt_blocks,
-        block_order,
+        dict(prompt_blocks) if isinstance(prompt_blocks, dict) else prompt_blocks,
+        list(block_order) if block_order is not None else None,
     )
+    if _should_async_log(touchpoint):
+        if _PROMPT_LOG_WRITER.submit(args):
+            return
+        if (os.getenv("PROMPT_LOG_OVERFLOW") or "").strip().lower() == "drop":
+            _prompt_log_overflow["dropped"] += 1
+            return
+        _prompt_log_overflow["inline"] += 1
+    _log_llm_prompt_sync(*args)
 
 
 def _log_llm_prompt_sync(
@@ -2701,217 +2918,316 @@ def _log_llm_prompt_sync(
     prompt_blocks: Optional[Dict[str, str]] = None,
     block_order: Optional[List[str]] = None,
 ) -> None:
-    debug = debug_enabled()
+    try:
+        entry = _prepare_llm_prompt_log(
+            user_id,
+            touchpoint,
+            prompt_text,
+            model,
+            duration_ms,
+            response_preview,
+            context_meta,
+            prompt_variant,
+            task_label,
+            prompt_blocks,
+            block_order,
+        )
+    except Exception as e:
+        print(f"[prompts] failed to log LLM prompt ({touchpoint}): {e}")
+        return
+    _write_llm_prompt_logs([entry])
+
+
+def _prepare_llm_prompt_log(
+    user_id: Optional[int],
+    touchpoint: str,
+    prompt_text: str,
+    model: Optional[str] = None,
+    duration_ms: Optional[int] = None,
+    response_preview: Optional[str] = None,
+    context_meta: Optional[Dict[str, Any]] = None,
+    prompt_variant: Optional[str] = None,
+    task_label: Optional[str] = None,
+    prompt_blocks: Optional[Dict[str, str]] = None,
+    block_order: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Normalise one log call into LLMPromptLog column values (no DB access)."""
     debug_log = _prompt_log_debug_enabled()
     if model is None:
         model = shared_llm.resolve_model_name_for_touchpoint(touchpoint=touchpoint)
-    print(f"[prompts] logging LLM prompt touchpoint={touchpoint} user_id={user_id}")
+    if response_preview is not None and not isinstance(response_preview, str):
+        response_preview = _coerce_llm_content(response_preview)
+    if context_meta is not None:
+        try:
+            context_meta = json.loads(json.dumps(context_meta, default=str))
+        except Exception:
+            context_meta = {"_raw": str(context_meta)}
+        if not isinstance(context_meta, dict):
+            context_meta = {"_raw": str(context_meta)}
+    if context_meta is None:
+        context_meta = {}
+    if user_id is not None and context_meta.get("user_id") in {None, ""}:
+        context_meta["user_id"] = int(user_id)
+    in_worker = _in_worker_process()
+    src_raw = context_meta.get("execution_source")
+    src = str(src_raw).strip().lower() if src_raw is not None else ""
+    if src not in {"api", "worker"}:
+        context_meta["execution_source"] = "worker" if in_worker else "api"
+    worker_process_raw = context_meta.get("worker_process")
+    if not isinstance(worker_process_raw, bool):
+        context_meta["worker_process"] = bool(in_worker)
+    if in_worker:
+        worker_id_raw = context_meta.get("worker_id")
+        worker_id = str(worker_id_raw).strip() if worker_id_raw is not None else ""
+        if not worker_id:
+            context_meta["worker_id"] = _resolve_worker_id()
+        worker_pid_raw = context_meta.get("worker_pid")
+        try:
+            worker_pid = int(worker_pid_raw) if worker_pid_raw is not None else None
+        except Exception:
+            worker_pid = None
+        if worker_pid is None:
+            context_meta["worker_pid"] = os.getpid()
+    known_blocks, extra_blocks, resolved_order, assembled_from_blocks = _normalize_prompt_blocks(
+        prompt_blocks, preferred_order=block_order
+    )
+    template_state = extra_blocks.pop("template_state", None)
+    template_version = extra_blocks.pop("template_version", None)
+    okr_scope = extra_blocks.pop("okr_scope", None)
+    if context_meta:
+        template_state = template_state or context_meta.get("template_state")
+        template_version = template_version or context_meta.get("template_version")
     try:
-        _ensure_llm_prompt_log_schema()
-        if response_preview is not None and not isinstance(response_preview, str):
-            response_preview = _coerce_llm_content(response_preview)
-        if context_meta is not None and not isinstance(context_meta, dict):
-            try:
-                context_meta = json.loads(json.dumps(context_meta, default=str))
-            except Exception:
-                context_meta = {"_raw": str(context_meta)}
-        elif isinstance(context_meta, dict):
-            try:
-                context_meta = json.loads(json.dumps(context_meta, default=str))
-            except Exception:
-                context_meta = {"_raw": str(context_meta)}
-        if context_meta is None:
-            context_meta = {}
-        if isinstance(context_meta, dict):
-            if user_id is not None and context_meta.get("user_id") in {None, ""}:
-                context_meta["user_id"] = int(user_id)
-            in_worker = _in_worker_process()
-            src_raw = context_meta.get("execution_source")
-            src = str(src_raw).strip().lower() if src_raw is not None else ""
-            if src not in {"api", "worker"}:
-                context_meta["execution_source"] = "worker" if in_worker else "api"
-            worker_process_raw = context_meta.get("worker_process")
-            if not isinstance(worker_process_raw, bool):
-                context_meta["worker_process"] = bool(in_worker)
-            if in_worker:
-                worker_id_raw = context_meta.get("worker_id")
-                worker_id = str(worker_id_raw).strip() if worker_id_raw is not None else ""
-                if not worker_id:
-                    context_meta["worker_id"] = _resolve_worker_id()
-                worker_pid_raw = context_meta.get("worker_pid")
-                try:
-                    worker_pid = int(worker_pid_raw) if worker_pid_raw is not None else None
-                except Exception:
-                    worker_pid = None
-                if worker_pid is None:
-                    context_meta["worker_pid"] = os.getpid()
-        known_blocks, extra_blocks, resolved_order, assembled_from_blocks = _normalize_prompt_blocks(
-            prompt_blocks, preferred_order=block_order
+        template_version_int = int(template_version) if template_version not in {None, ""} else None
+    except Exception:
+        template_version_int = None
+    final_prompt = prompt_text or assembled_from_blocks
+    # Keep legacy prompt_text column populated for back-compat.
+    prompt_text_value = final_prompt or ""
+    block_order_value = block_order or resolved_order or DEFAULT_PROMPT_BLOCK_ORDER
+    if debug_log:
+        sizes = _prompt_log_payload_sizes(
+            prompt_text_value=prompt_text_value,
+            final_prompt=final_prompt,
+            response_preview=response_preview if isinstance(response_preview, str) else None,
+            known_blocks=known_blocks,
+            extra_blocks=extra_blocks,
+            block_order_value=block_order_value,
+            context_meta=context_meta,
         )
-        template_state = extra_blocks.pop("template_state", None)
-        template_version = extra_blocks.pop("template_version", None)
-        if context_meta:
-            template_state = template_state or context_meta.get("template_state")
-            template_version = template_version or context_meta.get("template_version")
+        print(f"[prompts][debug] payload sizes touchpoint={touchpoint} user_id={user_id} sizes={sizes}")
+    return {
+        "user_id": user_id,
+        "touchpoint": touchpoint,
+        "model": model,
+        "prompt_variant": prompt_variant,
+        "final_prompt": final_prompt,
+        "response_preview": response_preview,
+        "cache_hit": bool(context_meta.get("response_cache_hit")),
+        "row": dict(
+            user_id=user_id,
+            touchpoint=touchpoint,
+            model=model,
+            duration_ms=duration_ms,
+            prompt_variant=prompt_variant,
+            task_label=task_label,
+            system_block=known_blocks.get("system"),
+            locale_block=known_blocks.get("locale"),
+            okr_block=known_blocks.get("okr"),
+            okr_scope=okr_scope,
+            scores_block=known_blocks.get("scores"),
+            habit_block=known_blocks.get("habit"),
+            task_block=known_blocks.get("task"),
+            template_state=template_state,
+            template_version=template_version_int,
+            user_block=known_blocks.get("user"),
+            extra_blocks=extra_blocks or None,
+            block_order=block_order_value or None,
+            payload_truncated=False,
+            sent_payload=final_prompt,
+            prompt_text=prompt_text_value,
+            assembled_prompt=final_prompt,
+            response_preview=response_preview,
+            context_meta=context_meta,
+        ),
+    }
+
+
+def _trimmed_llm_prompt_log_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    response_preview = row.get("response_preview")
+    return {
+        **row,
+        "system_block": _truncate_text(row.get("system_block"), 2000),
+        "locale_block": _truncate_text(row.get("locale_block"), 2000),
+        "okr_block": _truncate_text(row.get("okr_block"), 4000),
+        "scores_block": _truncate_text(row.get("scores_block"), 2000),
+        "habit_block": _truncate_text(row.get("habit_block"), 2000),
+        "task_block": _truncate_text(row.get("task_block"), 4000),
+        "user_block": _truncate_text(row.get("user_block"), 2000),
+        "extra_blocks": None,
+        "payload_truncated": True,
+        "sent_payload": _truncate_text(row.get("sent_payload"), 8000),
+        "prompt_text": _truncate_text(row.get("prompt_text"), 8000),
+        "assembled_prompt": _truncate_text(row.get("assembled_prompt"), 8000),
+        "response_preview": _truncate_text(response_preview, 2000) if isinstance(response_preview, str) else None,
+    }
+
+
+def _apply_prompt_log_timeout(s: Session) -> None:
+    try:
+        if _is_postgres():
+            timeout_ms = _prompt_log_timeout_ms()
+            if timeout_ms is not None:
+                s.execute(text(f"SET LOCAL statement_timeout = '{int(timeout_ms)}ms'"))
+    except Exception:
+        pass
+
+
+def _insert_llm_prompt_log_row(s: Session, entry: Dict[str, Any]) -> Optional[int]:
+    debug_log = _prompt_log_debug_enabled()
+    touchpoint = entry["touchpoint"]
+    user_id = entry["user_id"]
+    _apply_prompt_log_timeout(s)
+    try:
+        row = LLMPromptLog(**entry["row"])
+        s.add(row)
+        s.flush()
+    except DBAPIError as e:
+        if not _is_statement_timeout(e):
+            raise
         try:
-            template_version_int = int(template_version) if template_version not in {None, ""} else None
+            s.rollback()
         except Exception:
-            template_version_int = None
-        final_prompt = prompt_text or assembled_from_blocks
-        # Keep legacy prompt_text column populated for back-compat.
-        prompt_text_value = final_prompt or ""
-        block_order_value = block_order or resolved_order or DEFAULT_PROMPT_BLOCK_ORDER
+            pass
+        # Retry with trimmed payload to avoid timeouts.
+        _apply_prompt_log_timeout(s)
+        row = LLMPromptLog(**_trimmed_llm_prompt_log_row(entry["row"]))
+        s.add(row)
         if debug_log:
-            sizes = _prompt_log_payload_sizes(
-                prompt_text_value=prompt_text_value,
-                final_prompt=final_prompt,
-                response_preview=response_preview if isinstance(response_preview, str) else None,
-                known_blocks=known_blocks,
-                extra_blocks=extra_blocks,
-                block_order_value=block_order_value,
-                context_meta=context_meta,
-            )
-            print(f"[prompts][debug] payload sizes touchpoint={touchpoint} user_id={user_id} sizes={sizes}")
+            print(f"[prompts][debug] flush start (trimmed) touchpoint={touchpoint} user_id={user_id}")
+        s.flush()
+    prompt_log_id = row.id
+    s.commit()
+    return prompt_log_id
 
-        prompt_log_id = None
-        with SessionLocal() as s:
+
+def _insert_llm_prompt_logs(s: Session, entries: List[Dict[str, Any]]) -> List[tuple]:
+    """
+    Insert all entries with one flush (a multi-row INSERT on Postgres). If the batch
+    fails, fall back to row-at-a-time inserts so one bad row only loses itself.
+    Returns [(entry, prompt_log_id)] for the rows written.
+    """
+    if len(entries) > 1:
+        _apply_prompt_log_timeout(s)
+        try:
+            rows = [LLMPromptLog(**entry["row"]) for entry in entries]
+            s.add_all(rows)
+            s.flush()
+            ids = [row.id for row in rows]
+            s.commit()
+            return list(zip(entries, ids))
+        except Exception as e:
             try:
-                if _is_postgres():
-                    timeout_ms = _prompt_log_timeout_ms()
-                    if timeout_ms is not None:
-                        s.execute(text(f"SET LOCAL statement_timeout = '{int(timeout_ms)}ms'"))
+                s.rollback()
             except Exception:
                 pass
+            print(f"[prompts] WARN: batched prompt log insert failed ({len(entries)} rows), retrying per row: {e}")
+    written: List[tuple] = []
+    for entry in entries:
+        try:
+            written.append((entry, _insert_llm_prompt_log_row(s, entry)))
+        except Exception as e:
             try:
-                if debug_log:
-                    print(f"[prompts][debug] insert start touchpoint={touchpoint} user_id={user_id}")
-                row = LLMPromptLog(
-                        user_id=user_id,
-                        touchpoint=touchpoint,
-                        model=model,
-                        duration_ms=duration_ms,
-                        prompt_variant=prompt_variant,
-                        task_label=task_label,
-                        system_block=known_blocks.get("system"),
-                        locale_block=known_blocks.get("locale"),
-                        okr_block=known_blocks.get("okr"),
-                        okr_scope=extra_blocks.pop("okr_scope", None),
-                        scores_block=known_blocks.get("scores"),
-                        habit_block=known_blocks.get("habit"),
-                        task_block=known_blocks.get("task"),
-                        template_state=template_state,
-                        template_version=template_version_int,
-                        user_block=known_blocks.get("user"),
-                        extra_blocks=extra_blocks or None,
-                        block_order=block_order_value or None,
-                        payload_truncated=False,
-                        sent_payload=final_prompt,
-                        prompt_text=prompt_text_value,
-                        assembled_prompt=final_prompt,
-                        response_preview=response_preview,
-                        context_meta=context_meta,
-                    )
-                s.add(row)
-                if debug_log:
-                    print(f"[prompts][debug] flush start touchpoint={touchpoint} user_id={user_id}")
-                s.flush()
-                if debug_log:
-                    print(f"[prompts][debug] flush done touchpoint={touchpoint} user_id={user_id}")
-            except DBAPIError as e:
-                if _is_statement_timeout(e):
-                    try:
-                        s.rollback()
-                    except Exception:
-                        pass
-                    # Retry with trimmed payload to avoid timeouts.
-                    row = LLMPromptLog(
-                        user_id=user_id,
-                        touchpoint=touchpoint,
-                        model=model,
-                        duration_ms=duration_ms,
-                        prompt_variant=prompt_variant,
-                        task_label=task_label,
-                        system_block=_truncate_text(known_blocks.get("system"), 2000),
-                        locale_block=_truncate_text(known_blocks.get("locale"), 2000),
-                        okr_block=_truncate_text(known_blocks.get("okr"), 4000),
-                        okr_scope=extra_blocks.pop("okr_scope", None),
-                        scores_block=_truncate_text(known_blocks.get("scores"), 2000),
-                        habit_block=_truncate_text(known_blocks.get("habit"), 2000),
-                        task_block=_truncate_text(known_blocks.get("task"), 4000),
-                        template_state=template_state,
-                        template_version=template_version_int,
-                        user_block=_truncate_text(known_blocks.get("user"), 2000),
-                        extra_blocks=None,
-                        block_order=block_order_value or None,
-                        payload_truncated=True,
-                        sent_payload=_truncate_text(final_prompt, 8000),
-                        prompt_text=_truncate_text(prompt_text_value, 8000),
-                        assembled_prompt=_truncate_text(final_prompt, 8000),
-                        response_preview=_truncate_text(response_preview, 2000) if isinstance(response_preview, str) else None,
-                        context_meta=context_meta,
-                    )
-                    s.add(row)
-                    if debug_log:
-                        print(f"[prompts][debug] flush start (trimmed) touchpoint={touchpoint} user_id={user_id}")
-                    s.flush()
-                    if debug_log:
-                        print(f"[prompts][debug] flush done (trimmed) touchpoint={touchpoint} user_id={user_id}")
-                else:
-                    raise
-            prompt_log_id = row.id
-            if debug_log:
-                print(f"[prompts][debug] commit start touchpoint={touchpoint} user_id={user_id}")
-            s.commit()
-            if debug_log:
-                print(f"[prompts][debug] commit done touchpoint={touchpoint} user_id={user_id} id={prompt_log_id}")
+                s.rollback()
+            except Exception:
+                pass
+            # Best-effort: surface failures for missing tables or permissions
+            print(f"[prompts] failed to log LLM prompt ({entry['touchpoint']}): {e}")
+    return written
 
+
+def _add_llm_prompt_usage_events(s: Session, entry: Dict[str, Any], prompt_log_id: Optional[int]) -> int:
+    """
+    Usage rows for one logged prompt; returns the billed tokens. Response cache hits are
+    recorded as cached_tokens_in/out at no cost, so they show up in usage without
+    counting towards spend or the daily token budget.
+    """
+    user_id = entry["user_id"]
+    touchpoint = entry["touchpoint"]
+    model = entry["model"]
+    cache_hit = bool(entry.get("cache_hit"))
+    tag = _usage_tag_for_touchpoint(touchpoint)
+    tokens_in = estimate_tokens(entry["final_prompt"])
+    tokens_out = estimate_tokens(entry["response_preview"] or "")
+    _, rate_in, rate_out, rate_source = estimate_llm_cost(tokens_in, tokens_out, model=model)
+    if cache_hit:
+        rate_in = rate_out = 0.0
+    unit_prefix = "cached_" if cache_hit else ""
+    request_id = str(prompt_log_id) if prompt_log_id else None
+    meta = {
+        "prompt_log_id": prompt_log_id,
+        "touchpoint": touchpoint,
+        "prompt_variant": entry["prompt_variant"],
+        "rate_source": rate_source,
+        "rate_in": rate_in,
+        "rate_out": rate_out,
+        "response_cache_hit": cache_hit,
+    }
+    provider = (os.getenv("LLM_PROVIDER") or "openai").strip() or "openai"
+    if tokens_in:
+        log_usage_event(
+            user_id=user_id,
+            provider=provider,
+            product="llm",
+            model=model,
+            units=float(tokens_in),
+            unit_type=f"{unit_prefix}tokens_in",
+            cost_estimate=0.0 if cache_hit else ((tokens_in / 1_000_000.0) * rate_in if rate_in else None),
+            request_id=request_id,
+            tag=tag,
+            meta=meta,
+            session=s,
+            commit=False,
+            ensure=False,
+        )
+    if tokens_out:
+        log_usage_event(
+            user_id=user_id,
+            provider=provider,
+            product="llm",
+            model=model,
+            units=float(tokens_out),
+            unit_type=f"{unit_prefix}tokens_out",
+            cost_estimate=0.0 if cache_hit else ((tokens_out / 1_000_000.0) * rate_out if rate_out else None),
+            request_id=request_id,
+            tag=tag,
+            meta=meta,
+            session=s,
+            commit=False,
+            ensure=False,
+        )
+    return 0 if cache_hit else tokens_in + tokens_out
+
+
+def _write_llm_prompt_logs(entries: List[Dict[str, Any]]) -> int:
+    """Insert prompt log rows plus their usage events; returns how many rows were written."""
+    if not entries:
+        return 0
+    debug = debug_enabled()
+    try:
+        _ensure_llm_prompt_log_schema()
+        with SessionLocal() as s:
+            written = _insert_llm_prompt_logs(s, entries)
+            if not written:
+                return 0
             try:
-                tag = _usage_tag_for_touchpoint(touchpoint)
-                tokens_in = estimate_tokens(final_prompt)
-                tokens_out = estimate_tokens(response_preview or "")
-                _, rate_in, rate_out, rate_source = estimate_llm_cost(tokens_in, tokens_out, model=model)
-                request_id = str(prompt_log_id) if prompt_log_id else None
-                meta = {
-                    "prompt_log_id": prompt_log_id,
-                    "touchpoint": touchpoint,
-                    "prompt_variant": prompt_variant,
-                    "rate_source": rate_source,
-                    "rate_in": rate_in,
-                    "rate_out": rate_out,
-                }
-                if tokens_in:
-                    log_usage_event(
-                        user_id=user_id,
-                        provider=(os.getenv("LLM_PROVIDER") or "openai").strip() or "openai",
-                        product="llm",
-                        model=model,
-                        units=float(tokens_in),
-                        unit_type="tokens_in",
-                        cost_estimate=(tokens_in / 1_000_000.0) * rate_in if rate_in else None,
-                        request_id=request_id,
-                        tag=tag,
-                        meta=meta,
-                        session=s,
-                        commit=False,
-                        ensure=False,
-                    )
-                if tokens_out:
-                    log_usage_event(
-                        user_id=user_id,
-                        provider=(os.getenv("LLM_PROVIDER") or "openai").strip() or "openai",
-                        product="llm",
-                        model=model,
-                        units=float(tokens_out),
-                        unit_type="tokens_out",
-                        cost_estimate=(tokens_out / 1_000_000.0) * rate_out if rate_out else None,
-                        request_id=request_id,
-                        tag=tag,
-                        meta=meta,
-                        session=s,
-                        commit=False,
-                        ensure=False,
-                    )
+                tokens_by_user = [
+                    (entry["user_id"], _add_llm_prompt_usage_events(s, entry, prompt_log_id))
+                    for entry, prompt_log_id in written
+                ]
                 s.commit()
+                for user_id, tokens in tokens_by_user:
+                    record_llm_tokens(tokens, user_id)
             except Exception as e:
                 try:
                     s.rollback()
@@ -2919,17 +3235,20 @@ def _log_llm_prompt_sync(
                     pass
                 print(f"[usage] llm log failed: {e}")
 
+            total = None
             if debug:
                 try:
                     total = s.query(func.count(LLMPromptLog.id)).scalar()
-                    print(f"[prompts] logged LLM prompt touchpoint={touchpoint} user_id={user_id} (count={total})")
                 except Exception as e:
                     print(f"[prompts] logged but count check failed: {e}")
-            else:
-                print(f"[prompts] logged LLM prompt touchpoint={touchpoint} user_id={user_id}")
+            for entry, _ in written:
+                suffix = f" (count={total})" if total is not None else ""
+                print(f"[prompts] logged LLM prompt touchpoint={entry['touchpoint']} user_id={entry['user_id']}{suffix}")
+            return len(written)
     except Exception as e:
         # Best-effort: surface failures for missing tables or permissions
-        print(f"[prompts] failed to log LLM prompt ({touchpoint}): {e}")
+        print(f"[prompts] failed to log LLM prompts ({len(entries)}): {e}")
+        return 0
 
 
 def _usage_tag_for_touchpoint(touchpoint: str | None) -> str | None:
@@ -10,6 +10,7 @@ from typing import Optional
 from .db import SessionLocal
 from .models import User, UserPreference, PsychProfile, AssessSession, AssessmentRun, JobAudit
 from .coaching_delivery import send_coaching_text
+from .conversation_state import ConversationState
 
 
 def _send_safe(user: User, text: str):
@@ -31,7 +32,9 @@ OPTIONS = "1️⃣ Strongly disagree | 2️⃣ Disagree | 3️⃣ Unsure | 4️
 TOTAL_QUESTIONS = len(QUESTIONS)
 
 
-def _get_state(session, user_id: int) -> Optional[dict]:
+def _get_state(session, user_id: int, conversation_state: Optional[ConversationState] = None) -> Optional[dict]:
+    if conversation_state is not None and conversation_state.covers(STATE_KEY):
+        return conversation_state.json(STATE_KEY)
     pref = (
         session.query(UserPreference)
         .filter(UserPreference.user_id == user_id, UserPreference.key == STATE_KEY)
@@ -93,7 +96,9 @@ def pop_pending_summary(session, user_id: int) -> Optional[str]:
     return msg
 
 
-def has_active_state(user_id: int) -> bool:
+def has_active_state(user_id: int, conversation_state: Optional[ConversationState] = None) -> bool:
+    if conversation_state is not None and conversation_state.covers(STATE_KEY):
+        return conversation_state.json(STATE_KEY) is not None
     with SessionLocal() as s:
         return _get_state(s, user_id) is not None
 
@@ -219,11 +224,11 @@ def _derive_profile(scores: dict) -> tuple[dict, dict, dict]:
     return sec, flags, params
 
 
-def handle_message(user: User, text: str):
+def handle_message(user: User, text: str, conversation_state: Optional[ConversationState] = None):
     msg = (text or "").strip()
     lower = msg.lower()
     with SessionLocal() as s:
-        state = _get_state(s, user.id)
+        state = _get_state(s, user.id, conversation_state)
         if state is None:
             # allow manual start
             start(user)
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from .db import SessionLocal, engine
+from .embeddings import embed_texts, embedding_backend_is_remote, embedding_model_id
+from .models import QueryEmbeddingCache
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    raw = (os.getenv(name) or "").strip().lower()
+    if not raw:
+        return default
+    return raw in {"1", "true", "yes", "on"}
+
+
+# Concept prompts recur across users, so a modest LRU absorbs most assessor turns;
+# the table survives restarts and is shared by every worker.
+QUERY_EMBED_CACHE_LRU_SIZE = max(0, _env_int("QUERY_EMBED_CACHE_LRU_SIZE", 2048))
+# Rows not hit for this many days are purged by the retention job (0 = keep forever).
+QUERY_EMBED_CACHE_MAX_IDLE_DAYS = max(0, _env_int("QUERY_EMBED_CACHE_MAX_IDLE_DAYS", 30))
+
+_lru: "OrderedDict[str, list[float]]" = OrderedDict()
+_lru_lock = threading.Lock()
+_table_ready = False
+_stats = {"lru_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+_WS_RE = re.compile(r"\s+")
+
+
+def normalise_query_text(text: str) -> str:
+    # Whitespace only: case can matter to the backend, and the normalised string is
+    # what gets embedded, so every text sharing a key gets its own correct vector.
+    return _WS_RE.sub(" ", (text or "").strip())
+
+
+def query_embedding_key(model_id: str, text: str) -> str:
+    raw = f"{model_id}\x00{normalise_query_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def ensure_query_embedding_cache_table() -> None:
+    global _table_ready
+    if _table_ready:
+        return
+    QueryEmbeddingCache.__table__.create(bind=engine, checkfirst=True)
+    _table_ready = True
+
+
+def _lru_get(key: str) -> Optional[list[float]]:
+    with _lru_lock:
+        vec = _lru.get(key)
+        if vec is not None:
+            _lru.move_to_end(key)
+        return vec
+
+
+def _lru_put(key: str, vec: list[float]) -> None:
+    if QUERY_EMBED_CACHE_LRU_SIZE <= 0:
+        return
+    with _lru_lock:
+        _lru[key] = vec
+        _lru.move_to_end(key)
+        while len(_lru) > QUERY_EMBED_CACHE_LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _db_get(key: str) -> Optional[list[float]]:
+    try:
+        ensure_query_embedding_cache_table()
+        with SessionLocal() as s:
+            row = s.get(QueryEmbeddingCache, key)
+            if row is None:
+                return None
+            vec = list(row.embedding or [])
+            s.execute(
+                update(QueryEmbeddingCache)
+                .where(QueryEmbeddingCache.cache_key == key)
+                .values(hit_count=QueryEmbeddingCache.hit_count + 1, last_hit_at=datetime.utcnow())
+            )
+            s.commit()
+            return vec or None
+    except Exception as e:
+        print(f"[query_embedding_cache] lookup failed: {e}")
+        return None
+
+
+def _db_put(key: str, model_id: str, vec: list[float]) -> None:
+    try:
+        ensure_query_embedding_cache_table()
+        with SessionLocal() as s:
+            s.add(QueryEmbeddingCache(cache_key=key, model_id=model_id, embedding=vec, hit_count=0))
+            try:
+                s.commit()
+            except IntegrityError:
+                # Another worker stored the same query first; the vector is identical.
+                s.rollback()
+        _stats["stores"] += 1
+    except Exception as e:
+        print(f"[query_embedding_cache] store failed: {e}")
+
+
+def embed_query(text: str) -> list[float]:
+    """
+    Embedding for retrieval query text (whitespace-normalised), served from the LRU,
+    then the table, then the embedding backend. The table tier is only used for
+    remote backends; a local backend embeds faster than a DB round trip.
+    QUERY_EMBED_CACHE_DISABLED=1 always calls the backend.
+    """
+    query = normalise_query_text(text)
+    if _env_flag("QUERY_EMBED_CACHE_DISABLED"):
+        return embed_texts([query])[0]
+    model_id = embedding_model_id()
+    key = query_embedding_key(model_id, query)
+    vec = _lru_get(key)
+    if vec is not None:
+        _stats["lru_hits"] += 1
+        return vec
+    use_db = embedding_backend_is_remote()
+    if use_db:
+        vec = _db_get(key)
+        if vec is not None:
+            _stats["db_hits"] += 1
+            _lru_put(key, vec)
+            return vec
+    _stats["misses"] += 1
+    vec = embed_texts([query])[0]
+    _lru_put(key, vec)
+    if use_db:
+        _db_put(key, model_id, vec)
+    return vec
+
+
+def purge_idle_query_embeddings(*, max_idle_days: Optional[int] = None, batch_size: int = 1000) -> int:
+    """Delete rows not hit within max_idle_days (default QUERY_EMBED_CACHE_MAX_IDLE_DAYS)."""
+    days = QUERY_EMBED_CACHE_MAX_IDLE_DAYS if max_idle_days is None else max(0, int(max_idle_days))
+    if days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    ensure_query_embedding_cache_table()
+    idle = or_(
+        QueryEmbeddingCache.last_hit_at < cutoff,
+        (QueryEmbeddingCache.last_hit_at.is_(None)) & (QueryEmbeddingCache.created_at < cutoff),
+    )
+    total = 0
+    with SessionLocal() as s:
+        while True:
+            keys = [k for (k,) in s.query(QueryEmbeddingCache.cache_key).filter(idle).limit(max(1, int(batch_size))).all()]
+            if not keys:
+                break
+            s.execute(delete(QueryEmbeddingCache).where(QueryEmbeddingCache.cache_key.in_(keys)))
+            s.commit()
+            total += len(keys)
+            if len(keys) < batch_size:
+                break
+    return total
+
+
+def query_embedding_cache_stats() -> dict[str, Any]:
+    with _lru_lock:
+        size = len(_lru)
+    lookups = _stats["lru_hits"] + _stats["db_hits"] + _stats["misses"]
+    hits = _stats["lru_hits"] + _stats["db_hits"]
+    return {
+        **_stats,
+        "hit_rate": round(hits / lookups, 4) if lookups else None,
+        "lru_size": size,
+        "lru_capacity": QUERY_EMBED_CACHE_LRU_SIZE,
+        "model_id": embedding_model_id(),
+        "db_tier": embedding_backend_is_remote(),
+    }
@@ -61,6 +61,9 @@ from .prompts import (
     PromptAssembly,
 )
 from .debug_utils import debug_log
+from .prompt_context import get_user_prompt_context
+from .llm_cache import cached_llm_text
+from .llm_fanout import fan_out
 from .job_queue import ensure_prompt_settings_schema, enqueue_job_once, should_use_worker
 from .programme_timeline import programme_block_map, programme_blocks as build_programme_blocks
 from .reports_paths import resolve_reports_dir
@@ -155,8 +158,6 @@ def _assemble_prompt_for_report(touchpoint: str, user_id: int, as_of_date: date
     """
     try:
         from .kickoff import (
-            _latest_assessment as kickoff_latest_assessment,
-            _latest_psych as kickoff_latest_psych,
             _okr_by_pillar as kickoff_okr_by_pillar,
             _programme_blocks as kickoff_programme_blocks,
         )
@@ -164,24 +165,10 @@ def _assemble_prompt_for_report(touchpoint: str, user_id: int, as_of_date: date
 
         tp_lower = touchpoint.lower()
         extra_kwargs = {}
-        run, pillars = kickoff_latest_assessment(user_id)
-        psych = kickoff_latest_psych(user_id)
-        scores_payload = [
-            {"pillar": getattr(p, "pillar_key", ""), "score": int(getattr(p, "overall", 0) or 0)}
-            for p in (pillars or [])
-        ]
-        psych_payload = {}
-        if psych:
-            psych_payload = {
-                "section_averages": getattr(psych, "section_averages", None),
-                "flags": getattr(psych, "flags", None),
-                "parameters": getattr(psych, "parameters", None),
-            }
-        programme = kickoff_programme_blocks(
-            getattr(run, "finished_at", None)
-            or getattr(run, "started_at", None)
-            or getattr(run, "created_at", None)
-        )
+        prompt_context = get_user_prompt_context(int(user_id))
+        scores_payload = prompt_context.scores()
+        psych_payload = prompt_context.psych_payload()
+        programme = kickoff_programme_blocks(prompt_context.programme_start())
         first_block = programme[0] if programme else None
 
         if tp_lower in {"podcast_kickoff", "podcast_weekstart"}:
@@ -681,6 +668,21 @@ def generate_llm_prompt_log_report_html(user_id: int, limit: int = 100) -> str:
     return _report_link(user_id, "llm_review.html")
 
 
+def _report_llm_text(client, prompt: str, *, touchpoint: str) -> tuple[str, Optional[str], bool]:
+    """
+    Invoke a report narrative prompt through the response cache.
+    Returns (text, model, cache_hit); reruns of an unchanged report prompt are served from cache.
+    """
+    model = getattr(client, "model_name", None) or shared_llm.assessment_model
+
+    def _invoke() -> str:
+        resp = client.invoke(prompt)
+        return resp.content.strip() if hasattr(resp, "content") else str(resp).strip()
+
+    text, cache_hit = cached_llm_text(prompt, model=model, touchpoint=touchpoint, invoke=_invoke)
+    return text, model, cache_hit
+
+
 def _coaching_approach_text(user_id: int, first_name: str | None = None, *, allow_llm: bool = True) -> str:
     with SessionLocal() as s:
         prof = (
@@ -711,20 +713,21 @@ def _coaching_approach_text(user_id: int, first_name: str | None = None, *, allo
         try:
             t0 = time.perf_counter()
             _report_log(f"[report_llm] coaching_approach start user_id={user_id}")
-            resp = client.invoke(prompt)
+            candidate, model_name, cache_hit = _report_llm_text(client, prompt, touchpoint="coaching_approach")
             duration_ms = int((time.perf_counter() - t0) * 1000)
-            candidate = (getattr(resp, "content", None) or "").strip()
             if candidate:
                 text = candidate
-            _report_log(f"[report_llm] coaching_approach done user_id={user_id} ms={duration_ms}")
+            _report_log(
+                f"[report_llm] coaching_approach done user_id={user_id} ms={duration_ms} cache_hit={cache_hit}"
+            )
             try:
                 log_llm_prompt(
                     user_id=user_id,
                     touchpoint="coaching_approach",
                     prompt_text=prompt,
-                    model=getattr(resp, "model", None),
+                    model=model_name,
                     response_preview=text[:200] if text else None,
-                    context_meta={"profile_id": getattr(prof, "id", None)},
+                    context_meta={"profile_id": getattr(prof, "id", None), "response_cache_hit": cache_hit},
                     prompt_variant="coaching_approach",
                     task_label="coaching_approach",
                     prompt_blocks={**assembly.blocks, **(assembly.meta or {})},
@@ -770,18 +773,17 @@ def _score_narrative_from_llm(user: User, combined: int, payload: list[dict]) ->
     try:
         t0 = time.perf_counter()
         _report_log(f"[report_llm] score_narrative start user_id={getattr(user,'id',None)} combined={combined}")
-        resp = _llm.invoke(prompt)
+        text, model_name, cache_hit = _report_llm_text(_llm, prompt, touchpoint="assessment_scores")
         duration_ms = int((time.perf_counter() - t0) * 1000)
-        text = resp.content.strip() if hasattr(resp, "content") else str(resp).strip()
-        _report_log(f"[report_llm] score_narrative done user_id={getattr(user,'id',None)} ms={duration_ms}")
+        _report_log(f"[report_llm] score_narrative done user_id={getattr(user,'id',None)} ms={duration_ms} cache_hit={cache_hit}")
         try:
             log_llm_prompt(
                 user_id=getattr(user, "id", None),
                 touchpoint="assessment_scores",
                 prompt_text=prompt,
-                model=getattr(resp, "model", None),
+                model=model_name,
                 response_preview=text[:200] if text else None,
-                context_meta={"combined": combined, "scores": payload},
+                context_meta={"combined": combined, "scores": payload, "response_cache_hit": cache_hit},
                 prompt_variant="assessment_scores",
                 task_label="assessment_scores",
                 prompt_blocks={**assembly.blocks, **(assembly.meta or {})},
@@ -812,18 +814,17 @@ def _okr_narrative_from_llm(user: User, payload: list[dict]) -> str:
     try:
         t0 = time.perf_counter()
         _report_log(f"[report_llm] okr_narrative start user_id={getattr(user,'id',None)}")
-        resp = _llm.invoke(prompt)
+        text, model_name, cache_hit = _report_llm_text(_llm, prompt, touchpoint="assessment_okr")
         duration_ms = int((time.perf_counter() - t0) * 1000)
-        text = resp.content.strip() if hasattr(resp, "content") else str(resp).strip()
-        _report_log(f"[report_llm] okr_narrative done user_id={getattr(user,'id',None)} ms={duration_ms}")
+        _report_log(f"[report_llm] okr_narrative done user_id={getattr(user,'id',None)} ms={duration_ms} cache_hit={cache_hit}")
         try:
             log_llm_prompt(
                 user_id=getattr(user, "id", None),
                 touchpoint="assessment_okr",
                 prompt_text=prompt,
-                model=getattr(resp, "model", None),
+                model=model_name,
                 response_preview=text[:200] if text else None,
-                context_meta={"okr_payload": payload},
+                context_meta={"okr_payload": payload, "response_cache_hit": cache_hit},
                 prompt_variant="assessment_okr",
                 task_label="assessment_okr",
                 prompt_blocks={**assembly.blocks, **(assembly.meta or {})},
@@ -4410,35 +4411,50 @@ def build_assessment_dashboard_data(
 
         if include_llm and not cached_ok:
             did_generate = False
-            t5 = t4
-            t6 = t4
+            # Score, OKR and coaching narratives are independent prompts: run them
+            # concurrently so the build waits for the slowest, not the sum.
+            narrative_calls = {}
             if generate_core_narratives:
-                score_narrative = _score_narrative_from_llm(user, combined, pillar_payload)
+                narrative_calls["score"] = lambda: _score_narrative_from_llm(user, combined, pillar_payload)
+                narrative_calls["okr"] = lambda: _okr_narrative_from_llm(user, okr_payload)
+            if generate_habit_narrative and has_psych_profile:
+                narrative_calls["coaching"] = lambda: _coaching_approach_text(
+                    getattr(user, "id", None), allow_llm=include_llm
+                )
+            narrative_results = fan_out(narrative_calls, label=f"assessment_narratives:{run_id}")
+            if narrative_calls:
+                _report_log(
+                    f"[report_build] narratives_fanout run_id={run_id} calls={len(narrative_calls)} "
+                    f"ms={int((time.perf_counter() - t4)*1000)}"
+                )
+
+            if generate_core_narratives:
+                score_res = narrative_results["score"]
+                score_narrative = score_res.value if score_res.ok else ""
                 if not score_narrative:
                     score_narrative = _scores_narrative_fallback(combined, pillar_payload)
-                t5 = time.perf_counter()
                 _report_log(
                     f"[report_build] score_narrative run_id={run_id} llm={include_llm} "
-                    f"ms={int((t5 - t4)*1000)}"
+                    f"ms={score_res.duration_ms}"
                 )
-                okr_narrative = _okr_narrative_from_llm(user, okr_payload)
+                okr_res = narrative_results["okr"]
+                okr_narrative = okr_res.value if okr_res.ok else ""
                 if not okr_narrative:
                     okr_narrative = _okr_narrative_fallback(okr_payload)
-                t6 = time.perf_counter()
                 _report_log(
                     f"[report_build] okr_narrative run_id={run_id} llm={include_llm} "
-                    f"ms={int((t6 - t5)*1000)}"
+                    f"ms={okr_res.duration_ms}"
                 )
                 did_generate = True
             else:
                 _report_log(f"[report_build] score_okr_narratives skipped run_id={run_id} reason=core_disabled")
 
             if generate_habit_narrative and has_psych_profile:
-                coaching_text = _coaching_approach_text(getattr(user, "id", None), allow_llm=include_llm)
-                t7 = time.perf_counter()
+                coaching_res = narrative_results["coaching"]
+                coaching_text = coaching_res.value if coaching_res.ok else ""
                 _report_log(
                     f"[report_build] coaching_narrative run_id={run_id} llm={include_llm} "
-                    f"ms={int((t7 - t6)*1000)}"
+                    f"ms={coaching_res.duration_ms}"
                 )
                 did_generate = True
             elif generate_habit_narrative and not has_psych_profile:
@@ -4462,30 +4478,29 @@ def build_assessment_dashboard_data(
                         txt = " ".join(txt.split())
                         return _html.unescape(txt).strip()
 
-                    score_plain = _plain(score_narrative)
-                    okr_plain = _plain(okr_narrative)
-                    coaching_plain = _plain(coaching_text)
-                    if score_plain and not score_audio_url:
-                        score_audio_url = generate_podcast_audio(
-                            score_plain,
-                            user.id,
-                            filename=f"assessment_{run.id}_score.mp3",
-                            usage_tag="assessment",
-                        )
-                    if okr_plain and not okr_audio_url:
-                        okr_audio_url = generate_podcast_audio(
-                            okr_plain,
-                            user.id,
-                            filename=f"assessment_{run.id}_okr.mp3",
-                            usage_tag="assessment",
-                        )
-                    if coaching_plain and not coaching_audio_url:
-                        coaching_audio_url = generate_podcast_audio(
-                            coaching_plain,
-                            user.id,
-                            filename=f"assessment_{run.id}_coaching.mp3",
-                            usage_tag="assessment",
-                        )
+                    audio_calls = {}
+                    for audio_key, audio_text, audio_url in (
+                        ("score", score_narrative, score_audio_url),
+                        ("okr", okr_narrative, okr_audio_url),
+                        ("coaching", coaching_text, coaching_audio_url),
+                    ):
+                        audio_plain = _plain(audio_text)
+                        if audio_plain and not audio_url:
+                            audio_calls[audio_key] = (
+                                lambda plain=audio_plain, key=audio_key: generate_podcast_audio(
+                                    plain,
+                                    user.id,
+                                    filename=f"assessment_{run.id}_{key}.mp3",
+                                    usage_tag="assessment",
+                                )
+                            )
+                    audio_results = fan_out(audio_calls, label=f"assessment_narrative_audio:{run_id}")
+                    if "score" in audio_results and audio_results["score"].ok:
+                        score_audio_url = audio_results["score"].value
+                    if "okr" in audio_results and audio_results["okr"].ok:
+                        okr_audio_url = audio_results["okr"].value
+                    if "coaching" in audio_results and audio_results["coaching"].ok:
+                        coaching_audio_url = audio_results["coaching"].value
                 except Exception as e:
                     _report_log(f"[report_build] narrative_audio_failed run_id={run_id} err={e!r}")
                 try:
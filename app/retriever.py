@@ -1,9 +1,62 @@
 # app/retriever.py
 from __future__ import annotations
+import os
 from typing import List, Dict, Any
-from .db import SessionLocal
+from sqlalchemy import text
+from .db import SessionLocal, KB_EMBED_DIM, _is_postgres
 from .models import KBVector, KBSnippet
-from .llm import embed_text
+from .query_embedding_cache import embed_query
+from . import kb_index
+
+KB_IVFFLAT_PROBES = max(1, int(os.getenv("KB_IVFFLAT_PROBES", "10") or 10))
+
+# Ordered cosine-distance query over the vector shadow column; the pillar/concept
+# filter uses kb_meta_idx and ORDER BY ... LIMIT lets pgvector use kb_vec_idx.
+_PG_NEAREST_SQL_TEMPLATE = """
+    SELECT sn.id, sn.title, sn.text,
+           1 - (v.embedding_vec <=> CAST(:qvec AS vector)) AS score
+      FROM kb_vectors v
+      JOIN kb_snippets sn ON sn.id = v.snippet_id
+     WHERE sn.pillar_key = :pillar
+       AND sn.concept_code = :concept
+       AND v.embedding_vec IS NOT NULL
+     ORDER BY {order_by}
+     LIMIT :top_k
+"""
+_PG_NEAREST_SQL = text(_PG_NEAREST_SQL_TEMPLATE.format(order_by="v.embedding_vec <=> CAST(:qvec AS vector)"))
+# Same query, exact: ordering by an expression the index can't serve forces a scan
+# of the (filtered) partition instead of the approximate ivfflat lists.
+_PG_NEAREST_EXACT_SQL = text(_PG_NEAREST_SQL_TEMPLATE.format(order_by="(v.embedding_vec <=> CAST(:qvec AS vector)) + 0"))
+_PG_PARTITION_COUNT_SQL = text("""
+    SELECT count(*)
+      FROM kb_vectors v
+      JOIN kb_snippets sn ON sn.id = v.snippet_id
+     WHERE sn.pillar_key = :pillar
+       AND sn.concept_code = :concept
+       AND v.embedding_vec IS NOT NULL
+""")
+
+# ivfflat.iterative_scan only exists from pgvector 0.8; setting it on older versions
+# fails ("invalid configuration parameter"), so it is checked once per process.
+_pgvector_iterative_scan: bool | None = None
+
+
+def _parse_version(raw: str) -> tuple[int, ...]:
+    parts = []
+    for piece in str(raw or "").split("."):
+        digits = "".join(ch for ch in piece if ch.isdigit())
+        if not digits:
+            break
+        parts.append(int(digits))
+    return tuple(parts)
+
+
+def _supports_iterative_scan(s) -> bool:
+    global _pgvector_iterative_scan
+    if _pgvector_iterative_scan is None:
+        version = s.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+        _pgvector_iterative_scan = _parse_version(version) >= (0, 8)
+    return _pgvector_iterative_scan
 
 def _cosine(a: list[float], b: list[float]) -> float:
     import math
@@ -12,29 +65,72 @@ def _cosine(a: list[float], b: list[float]) -> float:
     nb = math.sqrt(sum(y*y for y in b)) or 1.0
     return dot / (na * nb)
 
+def _vector_literal(vec: list[float]) -> str:
+    return "[" + ",".join(repr(float(x)) for x in vec) + "]"
+
+def _pg_nearest(s, pillar: str, concept_key: str, qvec: list[float], top_k: int) -> list[tuple[float, int, str | None, str]]:
+    # SET LOCAL scopes these to this transaction only. The filter is applied after the
+    # ivfflat scan, so a small pillar/concept partition can have fewer than top_k rows
+    # in the probed lists: pgvector >= 0.8 keeps scanning further lists (iterative
+    # scan), and if the index still comes up short while the partition holds more
+    # rows than it returned, the partition is scored exactly.
+    s.execute(text(f"SET LOCAL ivfflat.probes = {int(KB_IVFFLAT_PROBES)}"))
+    if _supports_iterative_scan(s):
+        s.execute(text("SET LOCAL ivfflat.iterative_scan = relaxed_order"))
+    params = {"qvec": _vector_literal(qvec), "pillar": pillar, "concept": concept_key, "top_k": int(top_k)}
+    rows = s.execute(_PG_NEAREST_SQL, params).all()
+    if len(rows) < top_k and int(s.execute(_PG_PARTITION_COUNT_SQL, params).scalar() or 0) > len(rows):
+        rows = s.execute(_PG_NEAREST_EXACT_SQL, params).all()
+    scored = [(float(r.score), r.id, r.title, r.text) for r in rows]
+    # relaxed_order may return rows slightly out of order.
+    scored.sort(key=lambda t: (t[0], t[1]), reverse=True)
+    return scored
+
+def _local_nearest(s, pillar: str, concept_key: str, qvec: list[float], top_k: int) -> list[tuple[float, int, str | None, str]]:
+    part = kb_index.load_partition(s, pillar, concept_key, len(qvec))
+    if part is not None:
+        return part.top_k(qvec, top_k)
+    # No NumPy: score row by row.
+    rows = (
+        s.query(KBVector.embedding, KBSnippet.id, KBSnippet.title, KBSnippet.text)
+        .join(KBSnippet, KBVector.snippet_id == KBSnippet.id)
+        .filter(KBSnippet.pillar_key == pillar, KBSnippet.concept_code == concept_key)
+        .all()
+    )
+    scored = [(_cosine(r.embedding, qvec), r.id, r.title, r.text) for r in rows if r.embedding and len(r.embedding) == len(qvec)]
+    scored.sort(key=lambda t: (t[0], t[1]), reverse=True)
+    return scored[:top_k]
+
 def retrieve_snippets(pillar: str, concept_key: str, query_text: str, locale: str = "en-GB", top_k: int = 8) -> List[Dict[str, Any]]:
-    qvec = embed_text(query_text)
-    out: List[Dict[str, Any]] = []
+    qvec = embed_query(query_text)
+    if top_k <= 0:
+        return []
+    scored = None
     with SessionLocal() as s:
-        rows = (
-            s.query(KBVector, KBSnippet)
-            .join(KBSnippet, KBVector.snippet_id == KBSnippet.id)
-            .filter(KBSnippet.pillar_key == pillar, KBSnippet.concept_code == concept_key)
-            .all()
+        part = kb_index.get_partition(s, pillar, concept_key, len(qvec))
+        if part is not None:
+            scored = part.top_k(qvec, top_k)
+        elif _is_postgres() and len(qvec) == KB_EMBED_DIM:
+            try:
+                scored = _pg_nearest(s, pillar, concept_key, qvec, top_k)
+            except Exception as e:
+                # pgvector missing / shadow column not built yet — fall back to local scoring.
+                print(f"[retriever] WARN: pgvector search failed, scoring locally: {e}")
+                s.rollback()
+        if scored is None:
+            scored = _local_nearest(s, pillar, concept_key, qvec, top_k)
+    out: List[Dict[str, Any]] = []
+    for sc, sid, title, body in scored:
+        out.append(
+            {
+                "id": sid,
+                "type": "snippet",
+                "title": title,
+                "text": body,
+                "score": sc,
+                "locale": locale,
+            }
         )
-        scored = [(_cosine(v.embedding, qvec), sn.id, sn) for v, sn in rows]
-        scored.sort(reverse=True)
-        for sc, sid, sn in scored[:top_k]:
-            out.append(
-                {
-                    "id": sid,
-                    "type": "snippet",
-                    "title": sn.title,
-                    "text": sn.text,
-                    "score": sc,
-                    "locale": locale,
-                }
-            )
     return out
 
 def diversify(snippets: List[Dict[str, Any]], want_types: List[str] | None = None, max_total: int = 5) -> List[Dict[str, Any]]:
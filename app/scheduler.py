@@ -37,7 +37,7 @@ LEGACY_DAY_PROMPTS_RETIRED = True
 LEGACY_DAY_PROMPT_KEYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
 from .nudges import (
     send_message,
-    send_whatsapp_template,
+    send_bulk,
     _get_session_reopen_sid,
     _get_day_reopen_sid,
     ensure_quick_reply_templates,
@@ -50,7 +50,9 @@ from .nudges import (
 from .debug_utils import debug_log, debug_enabled
 from .llm import compose_prompt
 from .coaching_delivery import preferred_channel_for_user
-from .job_queue import enqueue_job, should_use_worker
+from .job_queue import compact_finished_jobs_from_env, enqueue_job, should_use_worker
+from .llm_cache import purge_expired_llm_responses
+from .query_embedding_cache import purge_idle_query_embeddings
 from .programme_timeline import first_monday_on_or_after
 from .weekly_plan import ensure_weekly_plan
 from .reports_retention import run_reports_retention_from_env
@@ -487,6 +489,8 @@ def send_out_of_session_messages() -> None:
             "sent": 0,
             "failed": 0,
         }
+        recipients: list[tuple[int, int]] = []
+        messages: list[dict] = []
         for user in users:
             stats["users"] += 1
             if not getattr(user, "phone", None):
@@ -528,11 +532,12 @@ def send_out_of_session_messages() -> None:
             if general_max_sends > 0 and send_count >= general_max_sends:
                 stats["max_reached"] += 1
                 continue
-            try:
-                send_whatsapp_template(
-                    to=user.phone,
-                    template_sid=template_sid,
-                    variables=build_session_reopen_template_variables(
+            recipients.append((int(user.id), send_count))
+            messages.append(
+                {
+                    "to": user.phone,
+                    "template_sid": template_sid,
+                    "variables": build_session_reopen_template_variables(
                         user_first_name=getattr(user, "first_name", None),
                         coach_name=None,
                         message_text=_render_reopen_message_for_day(
@@ -542,16 +547,33 @@ def send_out_of_session_messages() -> None:
                             coach_name=None,
                         ),
                     ),
-                    category="session-reopen",
-                )
-                _set_user_pref(s, user.id, "out_of_session_last_sent_at", now.isoformat())
-                _set_user_pref(s, int(user.id), OUT_OF_SESSION_GENERAL_SEND_COUNT_PREF_KEY, str(send_count + 1))
-                s.commit()
-                stats["sent"] += 1
-            except Exception as e:
-                stats["failed"] += 1
-                debug_log("out-of-session send failed", {"user_id": user.id, "error": repr(e)}, tag="scheduler")
-        debug_log("out-of-session pass", stats, tag="scheduler")
+                    "category": "session-reopen",
+                }
+            )
+        # End the read transaction before the broadcast, which can take minutes.
+        s.commit()
+
+    def _record_outcome(outcome: dict) -> None:
+        # Record each send as it completes so a crash or an overlapping pass only
+        # re-sends what was still in flight.
+        user_id, send_count = recipients[outcome["index"]]
+        if not outcome["ok"]:
+            stats["failed"] += 1
+            debug_log("out-of-session send failed", {"user_id": user_id, "error": outcome["error"]}, tag="scheduler")
+            return
+        try:
+            with SessionLocal() as ws:
+                _set_user_pref(ws, user_id, "out_of_session_last_sent_at", now.isoformat())
+                _set_user_pref(ws, user_id, OUT_OF_SESSION_GENERAL_SEND_COUNT_PREF_KEY, str(send_count + 1))
+                ws.commit()
+            stats["sent"] += 1
+        except Exception as e:
+            stats["failed"] += 1
+            debug_log("out-of-session pref update failed", {"user_id": user_id, "error": repr(e)}, tag="scheduler")
+
+    # Send the whole sweep at the account rate limit instead of one user at a time.
+    send_bulk(messages, on_result=_record_outcome)
+    debug_log("out-of-session pass", stats, tag="scheduler")
 
 
 def _tz(user: User) -> zoneinfo.ZoneInfo:
@@ -1058,6 +1080,54 @@ def schedule_reports_retention() -> None:
         print(f"[scheduler] failed to schedule reports retention job: {e}")
 
 
+def run_background_jobs_retention_job() -> None:
+    try:
+        purged = purge_expired_llm_responses()
+        if purged:
+            print(f"[scheduler] purged {purged} expired LLM response cache rows")
+    except Exception as e:
+        print(f"[scheduler] LLM response cache purge failed: {e}")
+    try:
+        purged = purge_idle_query_embeddings()
+        if purged:
+            print(f"[scheduler] purged {purged} idle query embedding cache rows")
+    except Exception as e:
+        print(f"[scheduler] query embedding cache purge failed: {e}")
+    try:
+        result = compact_finished_jobs_from_env(dry_run=False)
+    except Exception as e:
+        print(f"[scheduler] background jobs retention failed: {e}")
+        return
+    if result.get("skipped"):
+        print(f"[scheduler] background jobs retention skipped ({result.get('reason')})")
+    elif result.get("archived"):
+        print(
+            "[scheduler] background jobs retention complete "
+            f"archived={result.get('archived', 0)} batches={result.get('batches', 0)}"
+        )
+
+
+def schedule_background_jobs_retention() -> None:
+    interval_minutes = max(5, int((os.getenv("BACKGROUND_JOBS_RETENTION_INTERVAL_MINUTES") or "60").strip() or "60"))
+    try:
+        _safe_add_job(
+            run_background_jobs_retention_job,
+            trigger="interval",
+            minutes=interval_minutes,
+            id="background_jobs_retention",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+            misfire_grace_time=600,
+        )
+        debug_log(
+            f"scheduled background jobs retention every {interval_minutes}m",
+            tag="scheduler",
+        )
+    except Exception as e:
+        print(f"[scheduler] failed to schedule background jobs retention job: {e}")
+
+
 def enable_coaching(user_id: int, fast_minutes: int | None = None) -> bool:
     """Enable coaching/Gia access for a user. Legacy weekday prompt jobs are not scheduled."""
     with SessionLocal() as s:
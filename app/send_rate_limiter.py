@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+from .db import _is_postgres, engine
+from .models import SendRateBucket
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+# Account-wide Twilio message throughput shared by the API, worker and scheduler
+# processes. 0 disables the limiter.
+TWILIO_SEND_RATE_PER_SEC = max(0.0, _env_float("TWILIO_SEND_RATE_PER_SEC", 20.0))
+TWILIO_SEND_BURST = max(1.0, _env_float("TWILIO_SEND_BURST", TWILIO_SEND_RATE_PER_SEC or 1.0))
+# Longest a single send waits for a token before giving up.
+TWILIO_SEND_MAX_WAIT_SEC = max(0.0, _env_float("TWILIO_SEND_MAX_WAIT_SEC", 120.0))
+# Cap on the total wait (token waits plus 429 backoff) of an interactive, non-bulk send.
+TWILIO_INTERACTIVE_MAX_WAIT_SEC = max(0.0, _env_float("TWILIO_INTERACTIVE_MAX_WAIT_SEC", 10.0))
+# Tokens bulk sends leave in the bucket for interactive replies.
+TWILIO_BULK_RESERVE_TOKENS = max(0.0, _env_float("TWILIO_BULK_RESERVE_TOKENS", 2.0))
+
+_ACQUIRE_SQL = text(
+    """
+    UPDATE send_rate_buckets
+    SET tokens = LEAST(:capacity, tokens + EXTRACT(EPOCH FROM (clock_timestamp()::timestamp - updated_at)) * :rate) - 1,
+        updated_at = clock_timestamp()::timestamp
+    WHERE name = :name
+      AND LEAST(:capacity, tokens + EXTRACT(EPOCH FROM (clock_timestamp()::timestamp - updated_at)) * :rate) >= :needed
+    RETURNING tokens
+    """
+)
+_AVAILABLE_SQL = text(
+    """
+    SELECT LEAST(:capacity, tokens + EXTRACT(EPOCH FROM (clock_timestamp()::timestamp - updated_at)) * :rate)
+    FROM send_rate_buckets
+    WHERE name = :name
+    """
+)
+_SEED_SQL = text(
+    """
+    INSERT INTO send_rate_buckets (name, tokens, updated_at)
+    VALUES (:name, :capacity, clock_timestamp()::timestamp)
+    ON CONFLICT (name) DO NOTHING
+    """
+)
+
+
+class SendRateLimiter:
+    """
+    Token bucket of `rate` sends/second with `burst` capacity. On Postgres the bucket
+    is a send_rate_buckets row updated with one atomic statement per token, so every
+    process draws from the same budget; elsewhere (or if the DB call fails) it falls
+    back to an in-process bucket. Callers passing `reserve` only take a token while
+    at least that many more remain, so lower-priority (bulk) sends yield to others.
+    """
+
+    def __init__(self, name: str, *, rate: float, burst: float):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self._lock = threading.Lock()
+        self._local_tokens = self.capacity
+        self._local_at = time.monotonic()
+        self._seeded = False
+        self._stats = {"acquired": 0, "waits": 0, "wait_ms": 0, "timeouts": 0, "db_errors": 0}
+
+    def _params(self) -> Dict[str, Any]:
+        return {"name": self.name, "capacity": self.capacity, "rate": self.rate}
+
+    def _try_db(self, needed: float) -> float:
+        """0 when a token was taken, else seconds until one should be available."""
+        with engine.begin() as conn:
+            if not self._seeded:
+                SendRateBucket.__table__.create(bind=conn, checkfirst=True)
+                conn.execute(_SEED_SQL, self._params())
+                self._seeded = True
+            if conn.execute(_ACQUIRE_SQL, {**self._params(), "needed": needed}).first() is not None:
+                return 0.0
+            available = conn.execute(_AVAILABLE_SQL, self._params()).scalar()
+        return max(0.001, (needed - float(available or 0.0)) / self.rate)
+
+    def _try_local(self, needed: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._local_tokens = min(self.capacity, self._local_tokens + (now - self._local_at) * self.rate)
+            self._local_at = now
+            if self._local_tokens >= needed:
+                self._local_tokens -= 1.0
+                return 0.0
+            return max(0.001, (needed - self._local_tokens) / self.rate)
+
+    def _try_acquire(self, needed: float) -> float:
+        if _is_postgres():
+            try:
+                return self._try_db(needed)
+            except Exception as e:
+                self._stats["db_errors"] += 1
+                print(f"[send_rate_limiter] WARN: shared bucket unavailable, using local bucket: {e}")
+        return self._try_local(needed)
+
+    def acquire(self, timeout: Optional[float] = None, *, reserve: float = 0.0) -> bool:
+        """Block until a send token is available. Returns False if `timeout` elapses first."""
+        if self.rate <= 0:
+            return True
+        # Never demand more than the bucket can hold, or low-priority sends would starve.
+        needed = 1.0 + min(max(0.0, reserve), self.capacity - 1.0)
+        limit = TWILIO_SEND_MAX_WAIT_SEC if timeout is None else max(0.0, timeout)
+        started = time.monotonic()
+        waited = False
+        while True:
+            wait = self._try_acquire(needed)
+            if wait <= 0:
+                self._stats["acquired"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                    self._stats["wait_ms"] += int((time.monotonic() - started) * 1000)
+                return True
+            remaining = limit - (time.monotonic() - started)
+            if remaining <= 0:
+                self._stats["timeouts"] += 1
+                return False
+            waited = True
+            time.sleep(min(wait, remaining, 1.0))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "name": self.name,
+            "rate_per_sec": self.rate,
+            "burst": self.capacity,
+            "shared": _is_postgres(),
+        }
+
+
+_limiters: Dict[str, SendRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def twilio_send_limiter() -> SendRateLimiter:
+    """Account-wide limiter for Twilio message sends (WhatsApp and SMS)."""
+    with _limiters_lock:
+        limiter = _limiters.get("twilio")
+        if limiter is None:
+            limiter = _limiters["twilio"] = SendRateLimiter(
+                "twilio", rate=TWILIO_SEND_RATE_PER_SEC, burst=TWILIO_SEND_BURST
+            )
+        return limiter
+
+
+def send_rate_limiter_stats() -> Dict[str, Any]:
+    with _limiters_lock:
+        return {name: limiter.stats() for name, limiter in _limiters.items()}
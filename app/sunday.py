@@ -21,6 +21,7 @@ from .job_queue import enqueue_job, should_use_worker
 from .kickoff import COACH_NAME
 from .models import AssessmentRun, JobAudit, OKRKeyResult, OKRKrEntry, OKRKrHabitStep, User, UserPreference, WeeklyFocus
 from .coaching_delivery import send_coaching_text
+from .conversation_state import ConversationState
 from .prompts import build_prompt, kr_payload_list, run_llm_prompt
 from .programme_timeline import BLOCK_WEEKS, PILLAR_SEQUENCE, week_anchor_date, week_no_for_date, week_no_for_focus_start
 from .touchpoints import log_touchpoint
@@ -219,7 +220,11 @@ def _infer_week_no(session: Session, user_id: int, wf: WeeklyFocus) -> int:
         return 1
 
 
-def _get_state(session: Session, user_id: int) -> Optional[dict]:
+def _get_state(
+    session: Session, user_id: int, conversation_state: Optional[ConversationState] = None
+) -> Optional[dict]:
+    if conversation_state is not None and conversation_state.covers(STATE_KEY):
+        return conversation_state.json(STATE_KEY)
     pref = (
         session.query(UserPreference)
         .filter(UserPreference.user_id == user_id, UserPreference.key == STATE_KEY)
@@ -249,7 +254,9 @@ def _set_state(session: Session, user_id: int, state: Optional[dict]) -> None:
         session.add(UserPreference(user_id=user_id, key=STATE_KEY, value=json.dumps(state)))
 
 
-def has_active_state(user_id: int) -> bool:
+def has_active_state(user_id: int, conversation_state: Optional[ConversationState] = None) -> bool:
+    if conversation_state is not None and conversation_state.covers(STATE_KEY):
+        return conversation_state.json(STATE_KEY) is not None
     with SessionLocal() as s:
         return _get_state(s, user_id) is not None
 
@@ -704,12 +711,12 @@ def _apply_okr_updates_in_whatsapp(session: Session, krs: list[OKRKeyResult], te
     return True
 
 
-def handle_message(user: User, body: str) -> None:
+def handle_message(user: User, body: str, conversation_state: Optional[ConversationState] = None) -> None:
     text = (body or "").strip()
     if not text:
         return
     with SessionLocal() as s:
-        state = _get_state(s, user.id)
+        state = _get_state(s, user.id, conversation_state)
         if not state:
             return
         mode = str(state.get("mode") or "")
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func
+
+from .db import SessionLocal
+from .models import UsageEvent
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+# Counters are reloaded from usage_events at most this often per scope, which is
+# also how quickly usage logged by other processes becomes visible here.
+TOKEN_BUDGET_RECONCILE_SEC = max(1, _env_int("TOKEN_BUDGET_RECONCILE_SEC", 60))
+# How long a check for a scope with no loaded value yet waits on another thread's reload.
+TOKEN_BUDGET_LOAD_WAIT_SEC = 5.0
+
+_GLOBAL = "global"
+
+
+class _Counter:
+    __slots__ = ("db_used", "local", "loaded_at", "reconciling")
+
+    def __init__(self) -> None:
+        self.db_used: Optional[float] = None
+        self.local = 0.0
+        self.loaded_at = 0.0
+        self.reconciling = False
+
+    def used(self) -> float:
+        return float(self.db_used or 0.0) + self.local
+
+
+_lock = threading.Lock()
+_reconciled = threading.Condition(_lock)
+_day: Optional[datetime] = None
+_counters: Dict[Any, _Counter] = {}
+_stats = {"checks": 0, "reconciles": 0, "reconcile_failures": 0, "stale_served": 0, "recorded_tokens": 0.0, "blocked": 0}
+
+
+def daily_token_limit() -> Optional[int]:
+    limit_raw = (os.getenv("MAX_DAILY_LLM_TOKENS") or "").strip()
+    if not limit_raw:
+        return None
+    try:
+        limit_val = int(float(limit_raw))
+    except Exception:
+        return None
+    return limit_val if limit_val > 0 else None
+
+
+def _today() -> datetime:
+    now = datetime.utcnow()
+    return datetime(now.year, now.month, now.day)
+
+
+def _roll_day_locked() -> datetime:
+    global _day
+    today = _today()
+    if _day != today:
+        _day = today
+        _counters.clear()
+    return today
+
+
+def _query_used(day_start: datetime, user_id: Optional[int]) -> float:
+    with SessionLocal() as s:
+        q = s.query(func.coalesce(func.sum(UsageEvent.units), 0.0)).filter(
+            UsageEvent.product == "llm",
+            UsageEvent.unit_type.in_(["tokens_in", "tokens_out"]),
+            UsageEvent.created_at >= day_start,
+            UsageEvent.created_at < day_start + timedelta(days=1),
+        )
+        if user_id is not None:
+            q = q.filter(UsageEvent.user_id == user_id)
+        return float(q.scalar() or 0.0)
+
+
+def _reconcile(key: Any, user_id: Optional[int]) -> None:
+    with _lock:
+        day_start = _roll_day_locked()
+        counter = _counters.setdefault(key, _Counter())
+        if counter.reconciling:
+            return
+        counter.reconciling = True
+        counter.loaded_at = time.monotonic()
+        local_before = counter.local
+    try:
+        used = _query_used(day_start, user_id)
+    except Exception as e:
+        _stats["reconcile_failures"] += 1
+        print(f"[token_budget] WARN: reconcile failed ({key}): {e}")
+        used = None
+    with _lock:
+        counter.reconciling = False
+        _reconciled.notify_all()
+        if used is None or _day != day_start or _counters.get(key) is not counter:
+            return
+        # Local increments recorded before the query are committed and now in `used`;
+        # anything recorded since stays on top (briefly over-counting, never under).
+        counter.local = max(0.0, counter.local - local_before)
+        counter.db_used = used
+    _stats["reconciles"] += 1
+
+
+def _used_tokens(key: Any, user_id: Optional[int]) -> Optional[float]:
+    with _lock:
+        _roll_day_locked()
+        counter = _counters.get(key)
+        if counter is not None and counter.db_used is not None:
+            if time.monotonic() - counter.loaded_at < TOKEN_BUDGET_RECONCILE_SEC:
+                return counter.used()
+            if counter.reconciling:
+                # One reload per scope at a time; the others keep using the stale value.
+                _stats["stale_served"] += 1
+                return counter.used()
+    _reconcile(key, user_id)
+    with _lock:
+        # Only the first load of a scope has nothing stale to serve, so wait it out.
+        _reconciled.wait_for(
+            lambda: not (_counters.get(key) is not None and _counters[key].reconciling),
+            timeout=TOKEN_BUDGET_LOAD_WAIT_SEC,
+        )
+        counter = _counters.get(key)
+        if counter is None or counter.db_used is None:
+            return None
+        return counter.used()
+
+
+def record_llm_tokens(tokens: float, user_id: Optional[int] = None) -> None:
+    """Add committed LLM usage to today's in-memory counters (global and per user)."""
+    if not tokens or tokens <= 0:
+        return
+    with _lock:
+        _roll_day_locked()
+        for key in (_GLOBAL, user_id):
+            if key is None:
+                continue
+            counter = _counters.get(key)
+            if counter is not None:
+                counter.local += float(tokens)
+        _stats["recorded_tokens"] += float(tokens)
+
+
+def daily_token_limit_reached(est_tokens: int, user_id: Optional[int]) -> bool:
+    """
+    True when today's LLM token usage (per user, or global when user_id is None) plus
+    est_tokens exceeds MAX_DAILY_LLM_TOKENS. Served from memory; each scope is
+    reconciled against usage_events every TOKEN_BUDGET_RECONCILE_SEC seconds.
+    """
+    limit_val = daily_token_limit()
+    if limit_val is None:
+        return False
+    _stats["checks"] += 1
+    key = _GLOBAL if user_id is None else int(user_id)
+    used_tokens = _used_tokens(key, None if user_id is None else int(user_id))
+    if used_tokens is not None and (used_tokens + est_tokens) > limit_val:
+        _stats["blocked"] += 1
+        scope = f"user_id={user_id}" if user_id is not None else "global"
+        print(
+            f"[prompts] daily token limit reached ({scope}): "
+            f"used={int(used_tokens)} + est={est_tokens} > limit={limit_val}"
+        )
+        return True
+    return False
+
+
+def token_budget_stats() -> Dict[str, Any]:
+    with _lock:
+        scopes = len(_counters)
+        global_counter = _counters.get(_GLOBAL)
+        global_used = global_counter.used() if global_counter is not None and global_counter.db_used is not None else None
+        day = _day.date().isoformat() if _day else None
+    return {
+        **_stats,
+        "day": day,
+        "limit": daily_token_limit(),
+        "tracked_scopes": scopes,
+        "global_used": global_used,
+        "reconcile_sec": TOKEN_BUDGET_RECONCILE_SEC,
+    }
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+
+from .db import SessionLocal
+from .models import User
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip() or default)
+    except Exception:
+        return default
+
+
+# Phone -> user identity for messaging paths (webhook, write_log, sends). Entries are
+# dropped when a user insert/update/delete in this process commits (or rolls back);
+# the TTL bounds staleness for changes made by other processes. 0 disables caching.
+USER_IDENTITY_CACHE_TTL_SEC = max(0, _env_int("USER_IDENTITY_CACHE_TTL_SEC", 300))
+USER_IDENTITY_CACHE_SIZE = max(1, _env_int("USER_IDENTITY_CACHE_SIZE", 10000))
+
+
+@dataclass(frozen=True)
+class PhoneIdentity:
+    """The identity fields messaging needs; stands in for User where only id/phone are read."""
+
+    id: int
+    phone: str
+    first_name: Optional[str] = None
+    surname: Optional[str] = None
+
+
+_lock = threading.Lock()
+_by_phone: "OrderedDict[str, tuple[float, PhoneIdentity]]" = OrderedDict()
+_phone_by_user: Dict[int, str] = {}
+_stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0, "lookup_errors": 0}
+
+
+def normalize_phone_key(raw: Optional[str]) -> Optional[str]:
+    """E.164 cache key: drops the whatsapp: prefix and separators, maps 00/bare digits to +."""
+    s = str(raw or "").strip()
+    if s.startswith("whatsapp:"):
+        s = s[len("whatsapp:"):]
+    s = s.replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
+    if s.startswith("00") and s[2:].isdigit():
+        s = "+" + s[2:]
+    elif s.isdigit():
+        s = "+" + s
+    return s or None
+
+
+def _drop_locked(phone: str) -> None:
+    entry = _by_phone.pop(phone, None)
+    if entry is not None and _phone_by_user.get(entry[1].id) == phone:
+        _phone_by_user.pop(entry[1].id, None)
+
+
+def _store(identity: PhoneIdentity) -> None:
+    if USER_IDENTITY_CACHE_TTL_SEC <= 0:
+        return
+    with _lock:
+        stale_phone = _phone_by_user.get(identity.id)
+        if stale_phone and stale_phone != identity.phone:
+            _drop_locked(stale_phone)
+        _by_phone[identity.phone] = (time.monotonic() + USER_IDENTITY_CACHE_TTL_SEC, identity)
+        _by_phone.move_to_end(identity.phone)
+        _phone_by_user[identity.id] = identity.phone
+        while len(_by_phone) > USER_IDENTITY_CACHE_SIZE:
+            oldest, _ = next(iter(_by_phone.items()))
+            _drop_locked(oldest)
+            _stats["evictions"] += 1
+
+
+def remember_user_identity(user: Any) -> Optional[PhoneIdentity]:
+    """Cache the identity of a User row the caller has already loaded."""
+    user_id = getattr(user, "id", None)
+    phone = normalize_phone_key(getattr(user, "phone", None))
+    if not user_id or not phone:
+        return None
+    identity = PhoneIdentity(
+        id=int(user_id),
+        phone=phone,
+        first_name=getattr(user, "first_name", None),
+        surname=getattr(user, "surname", None),
+    )
+    _store(identity)
+    return identity
+
+
+def lookup_user_identity(phone: Optional[str]) -> Optional[PhoneIdentity]:
+    """Identity for a phone number (with or without whatsapp:), or None if no user has it."""
+    key = normalize_phone_key(phone)
+    if not key:
+        return None
+    # Stored numbers aren't guaranteed to be normalised; match the number as given too.
+    raw = str(phone or "").strip()
+    if raw.startswith("whatsapp:"):
+        raw = raw[len("whatsapp:"):]
+    candidates = {key, raw} if raw else {key}
+    with _lock:
+        entry = _by_phone.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                _by_phone.move_to_end(key)
+                _stats["hits"] += 1
+                return entry[1]
+            _drop_locked(key)
+            _stats["expired"] += 1
+        _stats["misses"] += 1
+    try:
+        with SessionLocal() as s:
+            row = (
+                s.query(User.id, User.phone, User.first_name, User.surname)
+                .filter(User.phone.in_(candidates))
+                .order_by((User.phone == key).desc(), User.id.asc())
+                .first()
+            )
+    except Exception as e:
+        _stats["lookup_errors"] += 1
+        print(f"[user_identity] WARN: lookup failed phone={key}: {e}")
+        return None
+    if row is None:
+        return None
+    identity = PhoneIdentity(id=int(row.id), phone=key, first_name=row.first_name, surname=row.surname)
+    _store(identity)
+    return identity
+
+
+def invalidate_user_identity(*, phone: Optional[str] = None, user_id: Optional[int] = None) -> None:
+    with _lock:
+        key = normalize_phone_key(phone)
+        if key:
+            _drop_locked(key)
+        if user_id is not None:
+            cached_phone = _phone_by_user.pop(int(user_id), None)
+            if cached_phone:
+                _by_phone.pop(cached_phone, None)
+        _stats["invalidations"] += 1
+
+
+def clear_user_identity_cache() -> None:
+    with _lock:
+        _by_phone.clear()
+        _phone_by_user.clear()
+
+
+def user_identity_cache_stats() -> Dict[str, Any]:
+    with _lock:
+        size = len(_by_phone)
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "size": size,
+        "max_size": USER_IDENTITY_CACHE_SIZE,
+        "ttl_sec": USER_IDENTITY_CACHE_TTL_SEC,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else None,
+    }
+
+
+_PENDING_KEY = "user_identity_pending"
+
+
+def _collect_user_row(target: User) -> None:
+    """Remember the row's phones/id on its session; they are invalidated once the transaction ends."""
+    phones = [getattr(target, "phone", None)]
+    try:
+        phones.extend(get_history(target, "phone").deleted or ())
+    except Exception:
+        pass
+    session = object_session(target)
+    if session is None:
+        for phone in phones:
+            invalidate_user_identity(phone=phone)
+        invalidate_user_identity(user_id=getattr(target, "id", None))
+        return
+    pending = session.info.setdefault(_PENDING_KEY, {"phones": set(), "user_ids": set()})
+    pending["phones"].update(p for p in phones if p)
+    if getattr(target, "id", None) is not None:
+        pending["user_ids"].add(int(target.id))
+
+
+# Invalidating at flush time would let a concurrent lookup re-cache the old committed
+# row before this transaction commits; after commit/rollback the DB is settled (and a
+# rollback also drops anything cached from the uncommitted rows).
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _on_transaction_end(session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for phone in pending["phones"]:
+        invalidate_user_identity(phone=phone)
+    for user_id in pending["user_ids"]:
+        invalidate_user_identity(user_id=user_id)
+
+
+# Users are created, renamed and deleted from many places (signup, admin tools,
+# assessments, seeding); hooking the mapper invalidates on all of them.
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_delete")
+def _on_user_insert_or_delete(mapper, connection, target) -> None:
+    _collect_user_row(target)
+
+
+@event.listens_for(User, "after_update")
+def _on_user_update(mapper, connection, target) -> None:
+    # Most updates (last_inbound_message_at, consent, billing) don't touch identity.
+    try:
+        changed = any(get_history(target, attr).has_changes() for attr in ("phone", "first_name", "surname"))
+    except Exception:
+        changed = True
+    if changed:
+        _collect_user_row(target)
@@ -4,26 +4,39 @@ from __future__ import annotations
 
 import os
 import time
+import signal
 import socket
+import threading
 import traceback
 import json
 import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
 
 from sqlalchemy import text as sa_text
 
 from app.job_queue import (
-    claim_job,
+    JobNotificationListener,
+    claim_jobs,
     ensure_job_table,
+    job_notify_enabled,
+    job_retry_policy,
+    kinds_for_lanes,
     mark_done,
     mark_error,
     enqueue_job_once,
     queue_requeue_delay_seconds,
+    release_jobs,
+    retry_after_hint,
+    retry_delay_seconds,
+    seconds_until_next_available_job,
 )
 from app import scheduler, assessor
 from app.prompts import run_llm_prompt
+from app.prompt_context import prompt_context_scope
 from app.usage import ensure_usage_schema
-from app.prompts import _ensure_llm_prompt_log_schema
+from app.prompts import _ensure_llm_prompt_log_schema, flush_llm_prompt_logs
 from app.message_log import _ensure_message_log_schema
 from app.reporting import (
     generate_assessment_narratives,
@@ -601,39 +614,255 @@ def main() -> None:
     worker_id = os.getenv("WORKER_ID") or socket.gethostname()
     poll_seconds = int(os.getenv("WORKER_POLL_SECONDS", "2") or "2")
     lock_timeout = int(os.getenv("WORKER_LOCK_TIMEOUT_MINUTES", "30") or "30")
-    max_attempts = int(os.getenv("WORKER_MAX_ATTEMPTS", "3") or "3")
-
-    print(f"[worker] started id={worker_id} poll={poll_seconds}s lock_timeout={lock_timeout}m max_attempts={max_attempts}")
-    while True:
+    concurrency = max(1, int(os.getenv("WORKER_CONCURRENCY", "8") or "8"))
+    kind_limits = _kind_concurrency_limits(concurrency)
+    kinds = _subscribed_kinds()
+    claim_batch = max(1, int(os.getenv("WORKER_CLAIM_BATCH", "8") or "8"))
+    # With LISTEN/NOTIFY the poll only catches delayed/stale jobs, so it can be much longer.
+    notify_fallback = int(os.getenv("WORKER_NOTIFY_FALLBACK_SECONDS", "30") or "30")
+    listener = JobNotificationListener(listen=job_notify_enabled())
+    runner = _JobRunner(concurrency=concurrency, kind_limits=kind_limits, on_release=listener.wake)
+    stop = threading.Event()
+
+    def _request_stop(signum, _frame) -> None:
+        if not stop.is_set():
+            print(f"[worker] signal {signum} received; draining {runner.in_flight()} in-flight job(s)")
+        stop.set()
+        listener.wake()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    print(
+        f"[worker] started id={worker_id} poll={poll_seconds}s lock_timeout={lock_timeout}m "
+        f"default_max_attempts={job_retry_policy('').max_attempts} notify={'on' if listener.listen else 'off'} "
+        f"concurrency={concurrency} claim_batch={claim_batch} kind_limits={kind_limits} kinds={kinds or 'all'}"
+    )
+    while not stop.is_set():
         _wait_for_db_reset_to_finish()
-        job = claim_job(worker_id=worker_id, lock_timeout_minutes=lock_timeout)
-        if not job:
-            time.sleep(max(1, poll_seconds))
+        free_slots = runner.free_slots()
+        if free_slots <= 0:
+            listener.wait(max(1, notify_fallback))
+            continue
+        jobs = claim_jobs(
+            min(free_slots, claim_batch),
+            worker_id=worker_id,
+            kinds=kinds,
+            exclude_kinds=runner.saturated_kinds(),
+            lock_timeout_minutes=lock_timeout,
+        )
+        if not jobs:
+            _wait_for_work(listener, poll_seconds=poll_seconds, notify_fallback=notify_fallback, kinds=kinds)
+            continue
+        surplus = [job for job in jobs if not runner.try_submit(job)]
+        if surplus:
+            release_jobs([job.id for job in surplus])
+    runner.shutdown()
+    listener.close()
+    if not flush_llm_prompt_logs(timeout=30):
+        print("[worker] WARN: prompt log flush timed out")
+    print("[worker] stopped")
+
+
+# Long-running fan-outs are capped low so they never occupy the whole pool; interactive
+# kinds default to the global WORKER_CONCURRENCY cap.
+_DEFAULT_KIND_CONCURRENCY = {
+    "education_avatar_generate_all": 1,
+    "education_avatar_generate_programme": 1,
+    "education_marketing_video_generate_all": 1,
+    "education_marketing_video": 2,
+    "assessment_completion_summary_media": 4,
+    "llm_prompt": 16,
+}
+
+# Kinds whose jobs for the same user must run in enqueue order, one at a time.
+_USER_SERIAL_KINDS = {"assessment_start", "assessment_continue"}
+
+
+def _subscribed_kinds() -> list[str] | None:
+    """
+    Restrict this worker to WORKER_KINDS (comma-separated kinds) and/or WORKER_LANES
+    (e.g. "interactive" for a dedicated chat pool). None means claim every kind.
+    """
+    kinds = {k.strip() for k in (os.getenv("WORKER_KINDS") or "").split(",") if k.strip()}
+    lanes = [l.strip() for l in (os.getenv("WORKER_LANES") or "").split(",") if l.strip()]
+    if lanes:
+        kinds.update(kinds_for_lanes(lanes))
+    return sorted(kinds) or None
+
+
+def _kind_concurrency_limits(concurrency: int) -> dict[str, int]:
+    """
+    Per-kind caps from _DEFAULT_KIND_CONCURRENCY, overridden by
+    WORKER_KIND_CONCURRENCY="llm_prompt=16,education_avatar_generate_all=1".
+    """
+    limits = dict(_DEFAULT_KIND_CONCURRENCY)
+    raw = (os.getenv("WORKER_KIND_CONCURRENCY") or "").strip()
+    for part in raw.split(","):
+        kind, sep, value = part.partition("=")
+        if not sep or not kind.strip():
             continue
         try:
-            payload = dict(job.payload or {})
-            payload.setdefault("job_id", int(job.id))
+            limits[kind.strip()] = max(0, int(value.strip()))
+        except Exception:
+            print(f"[worker] WARN: ignoring invalid WORKER_KIND_CONCURRENCY entry: {part!r}")
+    return {kind: min(limit, concurrency) for kind, limit in limits.items()}
+
+
+class _JobRunner:
+    """
+    Runs claimed jobs on a bounded thread pool, tracking per-kind counts so the claim
+    loop can skip kinds at their cap. Jobs of _USER_SERIAL_KINDS for a user that already
+    has one in flight are held locally and run in claim order by the same thread.
+    """
+
+    def __init__(self, *, concurrency: int, kind_limits: dict[str, int], on_release=None) -> None:
+        self.concurrency = int(concurrency)
+        self.kind_limits = dict(kind_limits)
+        self._on_release = on_release
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._total = 0
+        self._by_kind: dict[str, int] = {}
+        self._serial_waiting: dict[int, deque] = {}
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return self._total
+
+    def free_slots(self) -> int:
+        with self._lock:
+            return self.concurrency - self._total
+
+    def saturated_kinds(self) -> list[str]:
+        with self._lock:
+            return [
+                kind
+                for kind, limit in self.kind_limits.items()
+                if self._by_kind.get(kind, 0) >= limit
+            ]
+
+    def _serial_key(self, job) -> int | None:
+        if job.kind not in _USER_SERIAL_KINDS:
+            return None
+        user_id = job.user_id
+        if user_id is None and isinstance(job.payload, dict):
+            user_id = job.payload.get("user_id")
+        return int(user_id) if user_id is not None else None
+
+    def try_submit(self, job) -> bool:
+        """Submit unless the job's kind is already at its cap; False means hand it back."""
+        serial_key = self._serial_key(job)
+        with self._lock:
+            limit = self.kind_limits.get(job.kind)
+            if limit is not None and self._by_kind.get(job.kind, 0) >= limit:
+                return False
+            self._total += 1
+            self._by_kind[job.kind] = self._by_kind.get(job.kind, 0) + 1
+            if serial_key is not None:
+                waiting = self._serial_waiting.get(serial_key)
+                if waiting is not None:
+                    waiting.append(job)
+                    return True
+                self._serial_waiting[serial_key] = deque()
+        self._pool.submit(self._run, job, serial_key)
+        return True
+
+    def _release(self, job) -> None:
+        with self._lock:
+            self._total -= 1
+            remaining = self._by_kind.get(job.kind, 1) - 1
+            if remaining > 0:
+                self._by_kind[job.kind] = remaining
+            else:
+                self._by_kind.pop(job.kind, None)
+        if self._on_release:
+            self._on_release()
+
+    def _run(self, job, serial_key: int | None) -> None:
+        while job is not None:
+            try:
+                _run_job(job)
+            except Exception:
+                print(traceback.format_exc())
+            finally:
+                self._release(job)
+            job = None
+            if serial_key is not None:
+                with self._lock:
+                    waiting = self._serial_waiting.get(serial_key)
+                    if waiting:
+                        job = waiting.popleft()
+                    else:
+                        self._serial_waiting.pop(serial_key, None)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+# Job kinds that build prompts for their user -> whether to preload the daily tracker context.
+_PROMPT_CONTEXT_PRELOAD_KINDS = {
+    "coach_home_tracker_refresh": True,
+}
+
+
+def _run_job(job) -> None:
+    try:
+        payload = dict(job.payload or {})
+        payload.setdefault("job_id", int(job.id))
+        # One prompt-context snapshot per user for the whole job; kinds that build prompts
+        # for the job's user load its inputs when the scope opens. ORM writes made by the
+        # job refresh the affected user's snapshot.
+        preload_tracker = _PROMPT_CONTEXT_PRELOAD_KINDS.get(job.kind)
+        preload_user_id = (job.user_id or payload.get("user_id")) if preload_tracker is not None else None
+        with prompt_context_scope(
+            user_id=int(preload_user_id) if preload_user_id else None,
+            tracker=bool(preload_tracker),
+        ):
             result = process_job(job.kind, payload)
-            mark_done(job.id, result)
-            print(f"[worker] done job={job.id} kind={job.kind}")
-        except Exception as e:
-            if job.kind == "assessment_completion_summary_media":
-                run_id = (job.payload or {}).get("run_id")
-                if run_id:
-                    try:
-                        set_completion_summary_worker_state(
-                            int(run_id),
-                            job_id=int(job.id),
-                            status="Failed",
-                            error=str(e),
-                            queued_at=datetime.utcnow().replace(microsecond=0).isoformat(),
-                        )
-                    except Exception:
-                        pass
-            retry = int(job.attempts or 0) < max_attempts
-            mark_error(job.id, str(e), retry=retry)
-            print(f"[worker] error job={job.id} kind={job.kind} retry={retry}: {e}")
-            print(traceback.format_exc())
+        mark_done(job.id, result)
+        print(f"[worker] done job={job.id} kind={job.kind}")
+    except Exception as e:
+        if job.kind == "assessment_completion_summary_media":
+            run_id = (job.payload or {}).get("run_id")
+            if run_id:
+                try:
+                    set_completion_summary_worker_state(
+                        int(run_id),
+                        job_id=int(job.id),
+                        status="Failed",
+                        error=str(e),
+                        queued_at=datetime.utcnow().replace(microsecond=0).isoformat(),
+                    )
+                except Exception:
+                    pass
+        attempts = int(job.attempts or 0)
+        retry = attempts < job_retry_policy(job.kind).max_attempts
+        available_at = None
+        if retry:
+            delay = retry_delay_seconds(job.kind, attempts, retry_after_seconds=retry_after_hint(e))
+            available_at = datetime.utcnow() + timedelta(seconds=delay)
+        mark_error(job.id, str(e), retry=retry, available_at=available_at)
+        retry_note = f" in {(available_at - datetime.utcnow()).total_seconds():.0f}s" if available_at else ""
+        print(f"[worker] error job={job.id} kind={job.kind} attempt={attempts} retry={retry}{retry_note}: {e}")
+        print(traceback.format_exc())
+
+
+def _wait_for_work(
+    listener: JobNotificationListener,
+    *,
+    poll_seconds: int,
+    notify_fallback: int,
+    kinds: list[str] | None = None,
+) -> None:
+    if not listener.listen:
+        listener.wait(max(1, poll_seconds))
+        return
+    timeout = float(max(1, notify_fallback))
+    next_due = seconds_until_next_available_job(kinds=kinds)
+    if next_due is not None:
+        timeout = min(timeout, next_due)
+    listener.wait(timeout)
 
 
 def _env_true(name: str, default: str = "0") -> bool: